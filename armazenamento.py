@@ -0,0 +1,162 @@
+import hashlib
+import os
+import tempfile
+
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from db_runtime import get_session
+from imagens import remover_comprovante
+from models import ComprovanteBlob, Lancamento
+from pastas import UPLOAD_FOLDER
+
+# Armazenamento dos comprovantes por conteúdo. Cada arquivo é gravado uma única
+# vez em uploads/blobs/<aa>/<bb>/<sha256><ext> e a tabela comprovante_blob
+# conta quantos lançamentos apontam para ele; o caminho gravado na primeira vez
+# vale para o mesmo conteúdo enviado depois com outra extensão. O arquivo só é
+# colocado ou removido depois de um upsert/delete na linha do blob, que a trava
+# até o fim da transação (no SQLite, o banco inteiro), então um upload e uma
+# remoção do mesmo conteúdo não se cruzam. Arquivos sem referência saem do
+# disco depois do commit que as zerou, ou do rollback que desfez o upload.
+BLOBS_DIR = os.path.join(UPLOAD_FOLDER, 'blobs')
+TAMANHO_BLOCO = 1024 * 1024
+
+
+def _normalizar_extensao(extensao):
+    extensao = extensao.lower()
+    return '.jpg' if extensao == '.jpeg' else extensao
+
+
+def caminho_blob(digest, extensao):
+    return os.path.join(BLOBS_DIR, digest[:2], digest[2:4], digest + _normalizar_extensao(extensao))
+
+
+def _gravar_temporario(arquivo, extensao):
+    """Copia `arquivo` em blocos para um temporário, calculando o SHA-256 durante a cópia."""
+    os.makedirs(BLOBS_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    tamanho = 0
+    descritor, temporario = tempfile.mkstemp(dir=BLOBS_DIR, suffix=_normalizar_extensao(extensao) + '.tmp')
+    try:
+        with os.fdopen(descritor, 'wb') as destino:
+            for bloco in iter(lambda: arquivo.read(TAMANHO_BLOCO), b''):
+                digest.update(bloco)
+                destino.write(bloco)
+                tamanho += len(bloco)
+    except BaseException:
+        os.remove(temporario)
+        raise
+    return digest.hexdigest(), temporario, tamanho
+
+
+def guardar_comprovante(session, arquivo, extensao, quantidade=1, validar=None):
+    """Guarda o conteúdo de `arquivo` e soma `quantidade` referências na transação de `session`.
+
+    `validar`, se dado, recebe o caminho do temporário antes de qualquer registro
+    e pode levantar exceção para recusar o arquivo. Devolve (hash, caminho, tamanho).
+    """
+    digest, temporario, tamanho = _gravar_temporario(arquivo, extensao)
+    try:
+        if validar:
+            validar(temporario)
+        caminho = _registrar_e_travar(session, digest, caminho_blob(digest, extensao), tamanho, quantidade)
+        if os.path.exists(caminho):
+            os.remove(temporario)
+        else:
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            os.replace(temporario, caminho)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    session.info.setdefault('blobs_guardados', set()).add((digest, caminho))
+    return digest, caminho, tamanho
+
+
+def _registrar_e_travar(session, digest, caminho, tamanho, quantidade):
+    """Upsert da referência (que trava a linha) e caminho definitivo do blob."""
+    registrar_referencia(session, digest, caminho, tamanho, quantidade)
+    return session.query(ComprovanteBlob.caminho).filter_by(hash=digest).scalar()
+
+
+def registrar_referencia(session, digest, caminho, tamanho, quantidade=1):
+    """Soma `quantidade` referências ao blob, criando a linha se preciso."""
+    valores = {"hash": digest, "caminho": caminho, "tamanho": tamanho, "referencias": quantidade}
+    dialeto = session.get_bind().dialect.name
+    if dialeto in ('postgresql', 'sqlite'):
+        modulo = postgresql if dialeto == 'postgresql' else sqlite
+        tabela = ComprovanteBlob.__table__
+        comando = modulo.insert(tabela).values(**valores)
+        comando = comando.on_conflict_do_update(
+            index_elements=[tabela.c.hash],
+            set_={"referencias": tabela.c.referencias + comando.excluded.referencias}
+        )
+        session.execute(comando)
+        return
+
+    atualizados = session.query(ComprovanteBlob).filter_by(hash=digest).update(
+        {ComprovanteBlob.referencias: ComprovanteBlob.referencias + quantidade}, synchronize_session=False
+    )
+    if not atualizados:
+        session.add(ComprovanteBlob(**valores))
+
+
+def _agendar_remocao(session, digest, caminho):
+    session.info.setdefault('arquivos_para_remover', set()).add((digest, caminho))
+
+
+def liberar_comprovante(session, lancamento):
+    """Solta a referência do lançamento ao seu comprovante; o arquivo some após o commit se ficar órfão."""
+    if not lancamento.comprovante:
+        return
+    digest = lancamento.comprovante_hash
+    if digest is None:
+        # Upload antigo em uploads/<nome>, sem contagem de referências
+        _agendar_remocao(session, None, lancamento.comprovante)
+        return
+    session.query(ComprovanteBlob).filter_by(hash=digest).update(
+        {ComprovanteBlob.referencias: ComprovanteBlob.referencias - 1}, synchronize_session=False
+    )
+    referencias = session.query(ComprovanteBlob.referencias).filter_by(hash=digest).scalar()
+    if referencias is not None and referencias <= 0:
+        _agendar_remocao(session, digest, lancamento.comprovante)
+
+
+def descartar_se_orfao(digest, caminho):
+    """Remove o arquivo (e derivados) se nenhum lançamento ou blob o referenciar mais."""
+    with get_session() as session:
+        if digest is None:
+            if session.query(Lancamento.id).filter_by(comprovante=caminho).first() is None:
+                remover_comprovante(caminho)
+            return
+        # Trava a linha (criando-a vazia se preciso) antes de decidir: um upload do mesmo
+        # conteúdo ainda sem commit espera aqui, ou faz esta remoção esperar por ele
+        caminho = _registrar_e_travar(session, digest, caminho, 0, 0)
+        removidos = session.query(ComprovanteBlob).filter(
+            ComprovanteBlob.hash == digest, ComprovanteBlob.referencias <= 0
+        ).delete(synchronize_session=False)
+        if removidos:
+            remover_comprovante(caminho)
+        session.commit()
+
+
+@event.listens_for(Session, 'after_commit')
+def _remover_apos_commit(session):
+    session.info.pop('blobs_guardados', None)
+    for digest, caminho in session.info.pop('arquivos_para_remover', ()):
+        descartar_se_orfao(digest, caminho)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _descartar_remocoes_apos_rollback(session, transacao_anterior):
+    if transacao_anterior.parent is None:
+        session.info.pop('arquivos_para_remover', None)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _descartar_uploads_sem_commit(session, transacao):
+    # Rollback ou close() sem commit: os blobs guardados nesta transação podem ter ficado órfãos
+    if transacao.parent is None:
+        for digest, caminho in session.info.pop('blobs_guardados', ()):
+            descartar_se_orfao(digest, caminho)
@@ -0,0 +1,306 @@
+"""Executa os benchmarks de desempenho e grava os resultados em JSON.
+
+Uso:
+    python benchmarks/executar.py [--escalas pequena,media] [--casos relatorio,pagina]
+                                  [--repeticoes 3] [--database-url URL] [--saida arquivo.json]
+                                  [--base benchmarks/base.json] [--salvar-base] [--tolerancia 0.25]
+
+Cada escala roda num subprocesso próprio, com o banco preenchido por
+gerar_dados.py. Sem --database-url, cada escala usa um SQLite novo num
+diretório temporário; com --database-url (ex.: um Postgres local vazio) só
+uma escala pode ser pedida. Cada caso é executado uma vez para aquecimento e
+depois `--repeticoes` vezes com o cache de consultas vazio, registrando tempo
+(mediana, mínimo, máximo), número de consultas SQL e pico de memória Python
+(tracemalloc, numa execução à parte para não distorcer o tempo).
+
+Se houver resultado base (--base, padrão benchmarks/base.json), cada caso é
+comparado com ele; o comando termina com código 1 quando algum caso fica mais
+lento ou usa mais memória além da tolerância, ou faz mais consultas.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+BASE_PADRAO = os.path.join(RAIZ, 'benchmarks', 'base.json')
+RESULTADOS_DIR = os.path.join(RAIZ, 'benchmarks', 'resultados')
+
+ESCALAS = {
+    'pequena': {'admins': 1, 'umps': 3, 'lancamentos': 200, 'anos': 1, 'comprovantes': 0.2},
+    'media': {'admins': 2, 'umps': 10, 'lancamentos': 1000, 'anos': 2, 'comprovantes': 0.1},
+    'grande': {'admins': 5, 'umps': 20, 'lancamentos': 5000, 'anos': 3, 'comprovantes': 0.01},
+}
+PAGINAS = {
+    'pagina_dashboard': "Dashboard",
+    'pagina_relatorio_mensal': "Relatório Mensal",
+    'pagina_lancamentos': "Lançamentos",
+}
+
+
+class ContadorConsultas:
+    """Conta os comandos enviados ao banco pelo engine da aplicação."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.total = 0
+        event.listen(engine, 'before_cursor_execute', self._contar)
+
+    def _contar(self, *args):
+        self.total += 1
+
+
+def medir(contador, funcao, repeticoes):
+    from cache import esvaziar_cache
+
+    esvaziar_cache()
+    funcao()  # aquecimento: imports, fontes do FPDF, pool de processos
+
+    tempos = []
+    consultas = 0
+    for _ in range(repeticoes):
+        esvaziar_cache()
+        contador.total = 0
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+        consultas = contador.total
+
+    esvaziar_cache()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        funcao()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'mediana_s': statistics.median(tempos),
+        'min_s': min(tempos),
+        'max_s': max(tempos),
+        'consultas': consultas,
+        'memoria_pico_kb': pico // 1024,
+    }
+
+
+def _caso_pagina(rotulo, id_usuario):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(RAIZ, 'main.py'), default_timeout=600)
+    app.run()
+    app.session_state['logged_in'] = True
+    app.session_state['current_user'] = f"usuario {id_usuario}"
+    app.session_state['user_id'] = id_usuario
+    app.run()
+
+    def executar():
+        app.sidebar.button(key=rotulo.replace(" ", "_")).click().run()
+        if app.exception:
+            raise RuntimeError(app.exception[0].message)
+    return executar
+
+
+def montar_casos(ids):
+    """Casos medidos: funções quentes para uma UMP e o administrador, e as páginas principais."""
+    from db_runtime import get_session
+    from relatorio_dados import montar_dados_relatorio
+    from relatorio_federacao import exportar_federacao
+    from relatorios_pdf import exportar_comprovantes, exportar_relatorio
+    from saldos import recalcular_saldos
+
+    id_ump = ids['umps'][0]
+    id_admin = ids['admins'][0]
+    ano = date.today().year
+
+    def dados_relatorio():
+        with get_session() as session:
+            montar_dados_relatorio(session, id_ump)
+
+    def recalcular():
+        with get_session() as session:
+            recalcular_saldos(session, id_ump)
+            session.commit()
+
+    casos = {
+        'montar_dados_relatorio': dados_relatorio,
+        'recalcular_saldos': recalcular,
+        'exportar_relatorio': lambda: exportar_relatorio(id_ump),
+        'exportar_comprovantes_mes': lambda: exportar_comprovantes(id_ump, ano, 6),
+        'exportar_federacao': lambda: exportar_federacao(id_admin, ano),
+    }
+    for caso, rotulo in PAGINAS.items():
+        casos[caso] = (rotulo, id_admin)
+    return casos
+
+
+def executar_escala(nome, parametros, repeticoes, filtros):
+    """Gera a base e mede os casos no processo atual (usa o DATABASE_URL do ambiente)."""
+    from benchmarks.gerar_dados import gerar_dados
+    from db_runtime import get_engine
+
+    inicio = time.perf_counter()
+    ids = gerar_dados(
+        parametros['admins'], parametros['umps'], parametros['lancamentos'],
+        parametros['anos'], parametros['comprovantes']
+    )
+    resultado = {
+        'parametros': parametros,
+        'lancamentos': ids['lancamentos'],
+        'comprovantes': ids['comprovantes'],
+        'geracao_s': time.perf_counter() - inicio,
+        'casos': {},
+    }
+
+    engine = get_engine()
+    resultado['banco'] = engine.dialect.name
+    contador = ContadorConsultas(engine)
+    for caso, funcao in montar_casos(ids).items():
+        if filtros and not any(filtro in caso for filtro in filtros):
+            continue
+        print(f"[{nome}] {caso}...", flush=True)
+        try:
+            if isinstance(funcao, tuple):
+                funcao = _caso_pagina(*funcao)
+            resultado['casos'][caso] = medir(contador, funcao, repeticoes)
+        except Exception as e:
+            resultado['casos'][caso] = {'erro': f"{type(e).__name__}: {e}"}
+    return resultado
+
+
+def _versao_git():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def comparar(atual, base, tolerancia):
+    """Imprime a comparação caso a caso e devolve a lista de regressões."""
+    regressoes = []
+    for escala, dados in atual['escalas'].items():
+        casos_base = base.get('escalas', {}).get(escala, {}).get('casos', {})
+        for caso, medida in dados['casos'].items():
+            anterior = casos_base.get(caso)
+            if not anterior or 'erro' in anterior:
+                continue
+            if 'erro' in medida:
+                # Funcionava na referência e agora quebra: pior regressão possível
+                regressoes.append(f"{escala}/{caso}: falhou ({medida['erro']})")
+                continue
+            razao = medida['mediana_s'] / anterior['mediana_s'] if anterior['mediana_s'] else 1.0
+            razao_memoria = (
+                medida['memoria_pico_kb'] / anterior['memoria_pico_kb'] if anterior['memoria_pico_kb'] else 1.0
+            )
+            print(
+                f"{escala:8} {caso:30} {anterior['mediana_s'] * 1000:9.1f} ms -> {medida['mediana_s'] * 1000:9.1f} ms "
+                f"({razao:4.2f}x)  consultas {anterior['consultas']} -> {medida['consultas']}  "
+                f"memória {anterior['memoria_pico_kb']} -> {medida['memoria_pico_kb']} KB"
+            )
+            if razao > 1 + tolerancia:
+                regressoes.append(f"{escala}/{caso}: {razao:.2f}x mais lento")
+            if medida['consultas'] > anterior['consultas']:
+                regressoes.append(f"{escala}/{caso}: {anterior['consultas']} -> {medida['consultas']} consultas")
+            if razao_memoria > 1 + tolerancia:
+                regressoes.append(f"{escala}/{caso}: {razao_memoria:.2f}x mais memória")
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de desempenho do UMP Financeiro")
+    parser.add_argument("--escalas", default="pequena,media", help=f"Separadas por vírgula: {', '.join(ESCALAS)}")
+    parser.add_argument("--casos", default="", help="Só casos cujo nome contém algum destes trechos (vírgulas)")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--database-url", help="Banco vazio a usar em vez de um SQLite temporário")
+    parser.add_argument("--diretorio", help="Diretório de trabalho (bancos e comprovantes); padrão: temporário")
+    parser.add_argument("--saida", help="Arquivo JSON de resultado; padrão: benchmarks/resultados/<data>.json")
+    parser.add_argument("--base", default=BASE_PADRAO, help="Resultado de referência para comparação")
+    parser.add_argument("--salvar-base", action="store_true", help="Grava este resultado como nova referência")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="Piora relativa aceita (0.25 = 25%%)")
+    parser.add_argument("--interno", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    filtros = [filtro for filtro in args.casos.split(",") if filtro]
+
+    if args.interno:
+        # Subprocesso de uma escala: DATABASE_URL e diretório já preparados pelo processo pai
+        resultado = executar_escala(args.interno, ESCALAS[args.interno], args.repeticoes, filtros)
+        with open(args.saida, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultado, arquivo)
+        return
+
+    escalas = [escala for escala in args.escalas.split(",") if escala]
+    desconhecidas = [escala for escala in escalas if escala not in ESCALAS]
+    if desconhecidas:
+        parser.error(f"Escala desconhecida: {', '.join(desconhecidas)}")
+    if args.database_url and len(escalas) != 1:
+        parser.error("Com --database-url, informe uma única escala (o banco precisa estar vazio).")
+
+    diretorio = args.diretorio or tempfile.mkdtemp(prefix="ump_benchmark_")
+    os.makedirs(diretorio, exist_ok=True)
+    resultados = {
+        'versao': 1,
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+        'git': _versao_git(),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'repeticoes': args.repeticoes,
+        'escalas': {},
+    }
+    try:
+        for escala in escalas:
+            pasta = os.path.join(diretorio, escala)
+            os.makedirs(pasta, exist_ok=True)
+            ambiente = dict(os.environ)
+            ambiente['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(pasta, 'benchmark.db')}"
+            parcial = os.path.join(pasta, 'resultado.json')
+            comando = [
+                sys.executable, os.path.abspath(__file__), "--interno", escala,
+                "--repeticoes", str(args.repeticoes), "--casos", args.casos, "--saida", parcial,
+            ]
+            subprocess.run(comando, cwd=pasta, env=ambiente, check=True)
+            with open(parcial, encoding='utf-8') as arquivo:
+                resultados['escalas'][escala] = json.load(arquivo)
+    finally:
+        if not args.diretorio:
+            shutil.rmtree(diretorio, ignore_errors=True)
+
+    saida = args.saida or os.path.join(RESULTADOS_DIR, f"{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, 'w', encoding='utf-8') as arquivo:
+        json.dump(resultados, arquivo, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {saida}.")
+
+    for escala, dados in resultados['escalas'].items():
+        for caso, medida in dados['casos'].items():
+            if 'erro' in medida:
+                print(f"{escala:8} {caso:30} ERRO: {medida['erro']}")
+
+    regressoes = []
+    if os.path.exists(args.base) and not args.salvar_base:
+        with open(args.base, encoding='utf-8') as arquivo:
+            regressoes = comparar(resultados, json.load(arquivo), args.tolerancia)
+    if args.salvar_base:
+        shutil.copyfile(saida, args.base)
+        print(f"Referência atualizada em {args.base}.")
+    if regressoes:
+        print("Regressões:\n  " + "\n  ".join(regressoes))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
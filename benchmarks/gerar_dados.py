@@ -0,0 +1,168 @@
+"""Gera uma base sintética para os benchmarks no banco de DATABASE_URL.
+
+Uso:
+    python benchmarks/gerar_dados.py --admins 2 --umps 5 --lancamentos 1000 [--anos 2]
+                                     [--comprovantes 0.2] [--semente 42]
+
+Cria N administradores, M UMPs por administrador e K lançamentos por UMP em
+cada ano (os `--anos` mais recentes, terminando no ano vigente), com uma
+fração deles acompanhada de um comprovante JPEG gerado na hora. Depois
+reconstrói o resumo mensal e os saldos, como a aplicação faria. Os usuários
+sintéticos começam com PREFIXO; o gerador recusa bancos que já os tenham.
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+from datetime import date
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+from dotenv import load_dotenv
+from PIL import Image, ImageDraw
+from sqlalchemy import insert
+
+from armazenamento import guardar_comprovante
+from db_runtime import get_session, inicializar_banco
+from imagens import gerar_derivados
+from models import Configuracao, Lancamento, Usuario
+from pastas import criar_pastas
+from relatorio_dados import TIPOS_LANCAMENTO
+from resumo_mensal import reconstruir_resumo
+from saldos import recalcular_saldos
+
+PREFIXO = 'bench_'
+TAMANHO_LOTE = 5000
+# Folha A4 a 100 dpi, parecida com uma foto de recibo já reduzida
+TAMANHO_COMPROVANTE = (827, 1169)
+DESCRICOES = (
+    "Oferta culto jovem", "Material de escritório", "Lanche reunião", "Inscrição congresso",
+    "Camisetas acampamento", "ACI trimestral", "Transporte retiro", "Doação campanha",
+    "Aluguel som", "Cantina", "Taxa bancária", "Livros estudo bíblico",
+)
+
+
+def _comprovante_sintetico(aleatorio, texto):
+    imagem = Image.new('RGB', TAMANHO_COMPROVANTE, tuple(aleatorio.randint(200, 255) for _ in range(3)))
+    desenho = ImageDraw.Draw(imagem)
+    for linha in range(40):
+        y = 80 + linha * 26
+        desenho.line((60, y, 60 + aleatorio.randint(200, 700), y), fill=(90, 90, 90), width=3)
+    desenho.text((60, 30), texto, fill=(0, 0, 0))
+    conteudo = io.BytesIO()
+    imagem.save(conteudo, 'JPEG', quality=85)
+    conteudo.seek(0)
+    return conteudo
+
+
+def _criar_usuario(session, username, admin, ano_vigente, aleatorio):
+    usuario = Usuario(username=username, senha=username)
+    session.add(usuario)
+    session.flush()
+    session.add(Configuracao(
+        id_usuario=usuario.id,
+        admin=admin,
+        ump_federacao=f"UMP {username}",
+        federacao_sinodo="Sínodo Sintético",
+        ano_vigente=ano_vigente,
+        socios_ativos=aleatorio.randint(5, 80),
+        socios_cooperadores=aleatorio.randint(0, 20),
+        tesoureiro_responsavel="Tesoureiro Sintético",
+        saldo_inicial=round(aleatorio.uniform(0, 5000), 2),
+        email=f"{username}@benchmark.local",
+    ))
+    session.flush()
+    return usuario.id
+
+
+def gerar_dados(admins, umps_por_admin, lancamentos_por_ano, anos=1, fracao_comprovantes=0.2, semente=42):
+    """Preenche o banco e devolve {'admins': [...], 'umps': [...], 'lancamentos': n, 'comprovantes': n}."""
+    inicializar_banco()
+    criar_pastas()
+    aleatorio = random.Random(semente)
+    ano_vigente = date.today().year
+    anos_gerados = list(range(ano_vigente - anos + 1, ano_vigente + 1))
+
+    with get_session() as session:
+        if session.query(Usuario.id).filter(Usuario.username.like(f"{PREFIXO}%")).first():
+            raise SystemExit("O banco já tem dados sintéticos; use um banco vazio.")
+
+        ids_admins, ids_umps = [], []
+        for indice_admin in range(admins):
+            # O administrador também é uma UMP (a federação), sem supervisor
+            id_admin = _criar_usuario(session, f"{PREFIXO}admin_{indice_admin}", 0, ano_vigente, aleatorio)
+            ids_admins.append(id_admin)
+            for indice_ump in range(umps_por_admin):
+                ids_umps.append(_criar_usuario(
+                    session, f"{PREFIXO}ump_{indice_admin}_{indice_ump}", id_admin, ano_vigente, aleatorio
+                ))
+        session.commit()
+
+        total = comprovantes = 0
+        lote = []
+        for id_usuario in ids_admins + ids_umps:
+            for ano in anos_gerados:
+                for indice in range(lancamentos_por_ano):
+                    data = date(ano, aleatorio.randint(1, 12), aleatorio.randint(1, 28))
+                    descricao = f"{aleatorio.choice(DESCRICOES)} {indice}"
+                    registro = {
+                        'id_usuario': id_usuario,
+                        'data': data,
+                        'tipo': aleatorio.choice(TIPOS_LANCAMENTO),
+                        'descricao': descricao,
+                        'valor': round(aleatorio.uniform(5, 1500), 2),
+                        'comprovante': None,
+                        'comprovante_hash': None,
+                    }
+                    if aleatorio.random() < fracao_comprovantes:
+                        digest, caminho, _ = guardar_comprovante(
+                            session, _comprovante_sintetico(aleatorio, f"{id_usuario} {data} {descricao}"), '.jpg'
+                        )
+                        gerar_derivados(caminho)
+                        registro['comprovante'] = caminho
+                        registro['comprovante_hash'] = digest
+                        comprovantes += 1
+                    lote.append(registro)
+                    if len(lote) >= TAMANHO_LOTE:
+                        session.execute(insert(Lancamento.__table__), lote)
+                        total += len(lote)
+                        lote = []
+        if lote:
+            session.execute(insert(Lancamento.__table__), lote)
+            total += len(lote)
+        session.commit()
+
+        reconstruir_resumo(session)
+        for id_usuario in ids_admins + ids_umps:
+            recalcular_saldos(session, id_usuario, ano_vigente)
+        session.commit()
+
+    return {'admins': ids_admins, 'umps': ids_umps, 'lancamentos': total, 'comprovantes': comprovantes}
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Gera dados sintéticos para os benchmarks")
+    parser.add_argument("--admins", type=int, default=1)
+    parser.add_argument("--umps", type=int, default=5, help="UMPs por administrador")
+    parser.add_argument("--lancamentos", type=int, default=500, help="Lançamentos por UMP em cada ano")
+    parser.add_argument("--anos", type=int, default=1)
+    parser.add_argument("--comprovantes", type=float, default=0.2, help="Fração de lançamentos com comprovante")
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    resultado = gerar_dados(args.admins, args.umps, args.lancamentos, args.anos, args.comprovantes, args.semente)
+    print(
+        f"{len(resultado['admins'])} administrador(es), {len(resultado['umps'])} UMP(s), "
+        f"{resultado['lancamentos']} lançamento(s), {resultado['comprovantes']} comprovante(s) "
+        f"em {time.perf_counter() - inicio:.1f}s."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import threading
+from collections import namedtuple
+
+from sqlalchemy import Date, bindparam, text
+
+# Busca textual em Lancamento.descricao, restrita a uma lista de usuários (o
+# próprio e, para administradores, as UMPs supervisionadas).
+#   Postgres: índice GIN pg_trgm; casa substrings (ILIKE) e palavras parecidas
+#             (operador <%), ordenando por word_similarity.
+#   SQLite:   tabela FTS5 com tokenizador trigram; primeiro a frase exata e,
+#             se faltar resultado, os trigramas do termo com OR, por bm25,
+#             mantendo só descrições com pelo menos LIMIAR_APROXIMADO deles.
+#   Outros ou sem índice: LIKE simples, do mais recente para o mais antigo.
+# O índice é criado pela migração 6.
+ResultadoBusca = namedtuple('ResultadoBusca', ['id', 'id_usuario', 'data', 'tipo', 'descricao', 'valor', 'relevancia'])
+
+MAX_TRIGRAMAS = 12
+LIMIAR_APROXIMADO = 0.5
+
+_lock = threading.Lock()
+_modos = {}
+
+_COLUNAS = "l.id, l.id_usuario, l.data, l.tipo, l.descricao, l.valor"
+
+
+def _modo_busca(session):
+    bind = session.get_bind()
+    chave = str(bind.url)
+    with _lock:
+        if chave in _modos:
+            return _modos[chave]
+    if bind.dialect.name == 'sqlite':
+        existe = session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'lancamento_fts'"
+        )).first()
+        modo = 'fts5' if existe else 'like'
+    elif bind.dialect.name == 'postgresql':
+        existe = session.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first()
+        modo = 'trgm' if existe else 'like'
+    else:
+        modo = 'like'
+    with _lock:
+        _modos[chave] = modo
+    return modo
+
+
+def _executar(session, sql, **parametros):
+    consulta = text(sql).bindparams(bindparam('ids', expanding=True)).columns(data=Date)
+    return [ResultadoBusca(*linha) for linha in session.execute(consulta, parametros)]
+
+
+def _padrao_like(termo):
+    escapado = termo.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escapado}%"
+
+
+def _buscar_like(session, ids, termo, limite):
+    return _executar(session, f"""
+        SELECT {_COLUNAS}, 1.0 AS relevancia FROM lancamento l
+        WHERE l.id_usuario IN :ids AND lower(l.descricao) LIKE lower(:padrao) ESCAPE '\\'
+        ORDER BY l.data DESC, l.id DESC LIMIT :limite
+    """, ids=ids, padrao=_padrao_like(termo), limite=limite)
+
+
+def _buscar_trgm(session, ids, termo, limite):
+    return _executar(session, f"""
+        SELECT {_COLUNAS}, word_similarity(:termo, l.descricao) AS relevancia FROM lancamento l
+        WHERE l.id_usuario IN :ids AND (l.descricao ILIKE :padrao OR :termo <% l.descricao)
+        ORDER BY relevancia DESC, l.data DESC, l.id DESC LIMIT :limite
+    """, ids=ids, termo=termo, padrao=_padrao_like(termo), limite=limite)
+
+
+def _frase_fts(trecho):
+    return '"' + trecho.replace('"', '""') + '"'
+
+
+def _buscar_fts5(session, ids, termo, limite):
+    if len(termo) < 3:
+        # O tokenizador trigram não indexa termos com menos de três caracteres
+        return _buscar_like(session, ids, termo, limite)
+
+    sql = f"""
+        SELECT {_COLUNAS}, -bm25(lancamento_fts) AS relevancia
+        FROM lancamento_fts JOIN lancamento l ON l.id = lancamento_fts.rowid
+        WHERE lancamento_fts MATCH :consulta AND l.id_usuario IN :ids
+        ORDER BY bm25(lancamento_fts), l.data DESC LIMIT :limite
+    """
+    resultados = _executar(session, sql, consulta=_frase_fts(termo), ids=ids, limite=limite)
+    if len(resultados) >= limite:
+        return resultados
+
+    # Busca aproximada: qualquer trigrama do termo, ranqueado por quantos coincidem
+    minusculo = termo.lower()
+    trigramas = []
+    for inicio in range(len(minusculo) - 2):
+        trigrama = minusculo[inicio:inicio + 3]
+        if trigrama.strip() and trigrama not in trigramas:
+            trigramas.append(trigrama)
+    if len(trigramas) < 2:
+        return resultados
+    trigramas = trigramas[:MAX_TRIGRAMAS]
+    consulta = " OR ".join(_frase_fts(trigrama) for trigrama in trigramas)
+    encontrados = {resultado.id for resultado in resultados}
+    candidatos = _executar(session, sql, consulta=consulta, ids=ids, limite=4 * limite + len(encontrados))
+    for resultado in candidatos:
+        if len(resultados) >= limite:
+            break
+        if resultado.id in encontrados:
+            continue
+        descricao = resultado.descricao.lower()
+        if sum(1 for trigrama in trigramas if trigrama in descricao) / len(trigramas) >= LIMIAR_APROXIMADO:
+            resultados.append(resultado)
+    return resultados
+
+
+def buscar_por_descricao(session, ids_usuarios, termo, limite=50):
+    """Lançamentos dos usuários cuja descrição casa com `termo`, do mais para o menos relevante."""
+    termo = termo.strip()
+    ids = list(ids_usuarios)
+    if not termo or not ids:
+        return []
+    modo = _modo_busca(session)
+    if modo == 'fts5':
+        return _buscar_fts5(session, ids, termo, limite)
+    if modo == 'trgm':
+        return _buscar_trgm(session, ids, termo, limite)
+    return _buscar_like(session, ids, termo, limite)
@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from sqlalchemy import event, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from models import VersaoCache
+
+# Cache de consultas por usuário. Cada usuário tem um contador de versão que é
+# incrementado depois do commit de qualquer escrita nos seus dados; como a
+# versão faz parte da chave, entradas antigas deixam de ser lidas e acabam
+# descartadas pela política LRU. Desative com CACHE_CONSULTAS=0 para depurar.
+# Dados compartilhados entre usuários (como o índice de administradores) usam
+# ESCOPO_GLOBAL no lugar do id_usuario e têm sua própria versão.
+# As versões só valem no processo; alterações feitas fora dele (os comandos do
+# manutencao.py) incrementam a linha de versao_cache no banco, que o app
+# consulta no máximo a cada SINCRONIZAR_SEGUNDOS para descartar o cache todo.
+ESCOPO_GLOBAL = '*'
+SINCRONIZAR_SEGUNDOS = float(os.getenv("CACHE_SINCRONIZAR_SEGUNDOS", "5"))
+
+
+class CacheConsultas:
+    def __init__(self, max_entradas=2000, ativo=True):
+        self.max_entradas = max_entradas
+        self.ativo = ativo
+        self._lock = threading.Lock()
+        self._versoes = defaultdict(int)
+        self._geracao = 0
+        self._entradas = OrderedDict()
+        self.acertos = 0
+        self.falhas = 0
+
+    def versao(self, id_usuario):
+        return self._geracao, self._versoes[id_usuario]
+
+    def invalidar(self, id_usuario):
+        with self._lock:
+            self._versoes[id_usuario] += 1
+
+    def invalidar_tudo(self):
+        with self._lock:
+            self._geracao += 1
+            self._entradas.clear()
+
+    def obter_ou_calcular(self, id_usuario, chave, calcular):
+        if not self.ativo:
+            with self._lock:
+                self.falhas += 1
+            return calcular()
+
+        versao = self.versao(id_usuario)
+        chave_completa = (id_usuario, versao, chave)
+        with self._lock:
+            if chave_completa in self._entradas:
+                self._entradas.move_to_end(chave_completa)
+                self.acertos += 1
+                return self._entradas[chave_completa]
+            self.falhas += 1
+
+        valor = calcular()
+        with self._lock:
+            # Só guarda se nenhuma escrita foi confirmada durante o cálculo
+            if versao == self.versao(id_usuario):
+                self._entradas[chave_completa] = valor
+                self._entradas.move_to_end(chave_completa)
+                while len(self._entradas) > self.max_entradas:
+                    self._entradas.popitem(last=False)
+        return valor
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.acertos + self.falhas
+            return {
+                'ativo': self.ativo,
+                'entradas': len(self._entradas),
+                'max_entradas': self.max_entradas,
+                'acertos': self.acertos,
+                'falhas': self.falhas,
+                'taxa_acerto': self.acertos / consultas if consultas else 0.0,
+            }
+
+
+_cache = CacheConsultas(
+    max_entradas=int(os.getenv("CACHE_MAX_ENTRADAS", "2000")),
+    ativo=os.getenv("CACHE_CONSULTAS", "1") != "0",
+)
+_lock_sincronizacao = threading.Lock()
+_versao_externa = None
+_proxima_sincronizacao = 0.0
+
+
+def versao_dados(id_usuario):
+    return _cache.versao(id_usuario)
+
+
+def invalidar_usuario(id_usuario):
+    _cache.invalidar(id_usuario)
+
+
+def obter_ou_calcular(id_usuario, chave, calcular):
+    """Retorna o valor em cache para (usuário, versão, chave) ou o calcula e guarda."""
+    return _cache.obter_ou_calcular(id_usuario, chave, calcular)
+
+
+def definir_cache_ativo(ativo):
+    _cache.ativo = ativo
+    if not ativo:
+        _cache.limpar()
+
+
+def esvaziar_cache():
+    """Descarta todas as entradas (as versões continuam valendo); usado em medições a frio."""
+    _cache.limpar()
+
+
+def estatisticas_cache():
+    return _cache.estatisticas()
+
+
+def marcar_alteracao(session, id_usuario):
+    """Registra que a transação altera dados do usuário; o cache é invalidado no commit."""
+    session.info.setdefault('usuarios_alterados', set()).add(id_usuario)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidar_apos_commit(session):
+    for id_usuario in session.info.pop('usuarios_alterados', ()):
+        invalidar_usuario(id_usuario)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _descartar_apos_rollback(session, transacao_anterior):
+    if transacao_anterior.parent is None:
+        session.info.pop('usuarios_alterados', None)
+
+
+def registrar_alteracao_externa(session):
+    """Incrementa a versão no banco para que os processos do app descartem o cache; o commit fica com quem chama."""
+    if not session.execute(update(VersaoCache).where(VersaoCache.id == 1).values(
+        versao=VersaoCache.versao + 1
+    )).rowcount:
+        session.add(VersaoCache(id=1, versao=1))
+
+
+def sincronizar_com_banco(abrir_sessao):
+    """Descarta o cache se a versão no banco mudou; consulta no máximo a cada SINCRONIZAR_SEGUNDOS."""
+    global _versao_externa, _proxima_sincronizacao
+    with _lock_sincronizacao:
+        agora = time.monotonic()
+        if agora < _proxima_sincronizacao:
+            return
+        _proxima_sincronizacao = agora + SINCRONIZAR_SEGUNDOS
+        try:
+            with abrir_sessao() as session:
+                versao = session.query(VersaoCache.versao).filter(VersaoCache.id == 1).scalar() or 0
+        except SQLAlchemyError as e:
+            print(f"Erro ao consultar a versão do cache: {e}")
+            return
+        if _versao_externa is not None and versao != _versao_externa:
+            _cache.invalidar_tudo()
+        _versao_externa = versao
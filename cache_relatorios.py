@@ -0,0 +1,154 @@
+import hashlib
+import os
+import threading
+import time
+from functools import lru_cache
+
+from db_runtime import get_session
+from models import Configuracao, Lancamento, ResumoMensal
+from pastas import RELATORIOS_DIR, UPLOAD_FOLDER
+from periodos import intervalo_ano, intervalo_mes, filtro_periodo
+
+# Cache de PDFs gerados, indexado por uma impressão digital (SHA-256) de tudo o
+# que entra no documento: lançamentos do período, totais do ano, campos da
+# Configuracao e os comprovantes (hash do armazenamento por conteúdo, ou do
+# arquivo para uploads antigos, e o status da conversão). Se nada mudou, a
+# exportação devolve o arquivo já gerado. Entradas antigas são removidas por
+# idade e pelo tamanho total da pasta de cache.
+CACHE_DIR = os.path.join(RELATORIOS_DIR, 'cache')
+MAX_IDADE_SEGUNDOS = int(os.getenv("RELATORIOS_CACHE_MAX_DIAS", "30")) * 86400
+MAX_BYTES = int(os.getenv("RELATORIOS_CACHE_MAX_MB", "500")) * 1024 * 1024
+
+# Incrementar quando o layout dos PDFs mudar, para não servir arquivos antigos
+VERSAO_LAYOUT = 2
+# Hashes de arquivos memorizados por (caminho, tamanho, mtime)
+MAX_HASHES_MEMORIZADOS = 4096
+
+CAMPOS_CONFIGURACAO = (
+    'ump_federacao', 'federacao_sinodo', 'ano_vigente', 'socios_ativos',
+    'socios_cooperadores', 'tesoureiro_responsavel', 'saldo_inicial'
+)
+
+_lock = threading.Lock()
+
+
+def hash_arquivo(caminho, tamanho_bloco=1024 * 1024):
+    """SHA-256 do arquivo lido em blocos, memorizado por (caminho, tamanho, mtime)."""
+    try:
+        info = os.stat(caminho)
+    except OSError:
+        return None
+    return _hash_memorizado(caminho, info.st_size, info.st_mtime_ns, tamanho_bloco)
+
+
+@lru_cache(maxsize=MAX_HASHES_MEMORIZADOS)
+def _hash_memorizado(caminho, tamanho, mtime_ns, tamanho_bloco):
+    digest = hashlib.sha256()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(tamanho_bloco), b''):
+            digest.update(bloco)
+    return digest.hexdigest()
+
+
+def _caminho_comprovante(comprovante):
+    return comprovante if comprovante.startswith(UPLOAD_FOLDER) else os.path.join(UPLOAD_FOLDER, comprovante)
+
+
+def impressao_digital(id_usuario, tipo, mes=None):
+    """Impressão digital das entradas de uma exportação do ano vigente do usuário."""
+    digest = hashlib.sha256()
+
+    def adicionar(*valores):
+        digest.update(repr(valores).encode('utf-8'))
+
+    adicionar('layout', VERSAO_LAYOUT, tipo, mes)
+    with get_session() as session:
+        config = session.query(Configuracao).filter_by(id_usuario=id_usuario).first()
+        adicionar('configuracao', *(getattr(config, campo, None) for campo in CAMPOS_CONFIGURACAO))
+        ano = config.ano_vigente if config else None
+        if ano is None:
+            return None
+
+        # Totais do ano inteiro entram no resumo e no saldo corrente, mesmo no relatório mensal
+        for linha in session.query(ResumoMensal.mes, ResumoMensal.tipo, ResumoMensal.total).filter_by(
+            id_usuario=id_usuario, ano=ano
+        ).order_by(ResumoMensal.mes, ResumoMensal.tipo):
+            adicionar('resumo', *linha)
+
+        inicio, fim = intervalo_ano(ano) if mes is None else intervalo_mes(ano, mes)
+        lancamentos = session.query(
+            Lancamento.id, Lancamento.data, Lancamento.tipo, Lancamento.descricao,
+            Lancamento.valor, Lancamento.comprovante, Lancamento.comprovante_hash, Lancamento.comprovante_status
+        ).filter(
+            Lancamento.id_usuario == id_usuario,
+            filtro_periodo(Lancamento.data, inicio, fim)
+        ).order_by(Lancamento.data, Lancamento.id).all()
+
+    for linha in lancamentos:
+        adicionar('lancamento', *linha)
+        # Blobs já têm o hash do conteúdo na linha; só uploads antigos precisam ser lidos
+        if tipo == 'comprovantes' and linha.comprovante and linha.comprovante_hash is None:
+            adicionar('arquivo', hash_arquivo(_caminho_comprovante(linha.comprovante)))
+    return digest.hexdigest()
+
+
+def _caminho_cache(tipo, digital):
+    return os.path.join(CACHE_DIR, f"{tipo}_{digital}.pdf")
+
+
+def buscar_no_cache(tipo, digital):
+    """Conteúdo do PDF já gerado para a impressão digital, ou None."""
+    if digital is None:
+        return None
+    caminho = _caminho_cache(tipo, digital)
+    try:
+        os.utime(caminho)  # marca como usado recentemente
+        with open(caminho, 'rb') as arquivo:
+            return arquivo.read()
+    except OSError:
+        return None
+
+
+def guardar_no_cache(tipo, digital, conteudo):
+    if digital is None:
+        return
+    caminho = _caminho_cache(tipo, digital)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    temporario = f"{caminho}.{threading.get_ident()}.tmp"
+    with open(temporario, 'wb') as arquivo:
+        arquivo.write(conteudo)
+    os.replace(temporario, caminho)
+    limpar_cache()
+
+
+def limpar_cache(max_idade_segundos=MAX_IDADE_SEGUNDOS, max_bytes=MAX_BYTES):
+    """Remove entradas mais velhas que o limite e, depois, as menos usadas até caber em max_bytes."""
+    limpar_diretorio(CACHE_DIR, '.pdf', max_idade_segundos, max_bytes)
+
+
+def limpar_diretorio(diretorio, extensao, max_idade_segundos, max_bytes):
+    """Política de limpeza por idade e tamanho total, compartilhada com o cache de prévias."""
+    if not os.path.isdir(diretorio):
+        return
+    with _lock:
+        agora = time.time()
+        entradas = []
+        for nome in os.listdir(diretorio):
+            if not nome.endswith(extensao):
+                continue
+            caminho = os.path.join(diretorio, nome)
+            try:
+                info = os.stat(caminho)
+            except OSError:
+                continue
+            if agora - info.st_mtime > max_idade_segundos:
+                os.remove(caminho)
+            else:
+                entradas.append((info.st_mtime, info.st_size, caminho))
+
+        total = sum(tamanho for _, tamanho, _ in entradas)
+        for _, tamanho, caminho in sorted(entradas):
+            if total <= max_bytes:
+                break
+            os.remove(caminho)
+            total -= tamanho
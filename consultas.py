@@ -0,0 +1,74 @@
+from collections import defaultdict, namedtuple
+from types import MappingProxyType
+
+from cache import ESCOPO_GLOBAL, obter_ou_calcular
+from db_runtime import get_session
+from models import Configuracao, Lancamento, SaldoFinal
+from periodos import intervalo_mes, filtro_periodo
+from relatorio_dados import totais_por_mes_e_tipo
+
+# Leituras frequentes servidas pelo cache por usuário. Os valores guardados são
+# tuplas ou mapeamentos somente leitura (MappingProxyType), nunca objetos ORM,
+# para poderem ser compartilhados entre sessões e reexecuções sem risco de
+# alteração acidental.
+ConfiguracaoResumo = namedtuple('ConfiguracaoResumo', [
+    'id_usuario', 'admin', 'ump_federacao', 'federacao_sinodo', 'ano_vigente',
+    'socios_ativos', 'socios_cooperadores', 'tesoureiro_responsavel', 'saldo_inicial', 'email'
+])
+LancamentoResumo = namedtuple('LancamentoResumo', [
+    'id', 'id_usuario', 'data', 'tipo', 'descricao', 'valor', 'comprovante', 'comprovante_status'
+])
+
+
+def obter_configuracao(id_usuario):
+    def carregar():
+        with get_session() as session:
+            config = session.query(Configuracao).filter_by(id_usuario=id_usuario).first()
+            if not config:
+                return None
+            return ConfiguracaoResumo(*(getattr(config, campo) for campo in ConfiguracaoResumo._fields))
+    return obter_ou_calcular(id_usuario, 'configuracao', carregar)
+
+
+def listar_lancamentos_mes(id_usuario, ano, mes):
+    def carregar():
+        with get_session() as session:
+            linhas = session.query(
+                Lancamento.id, Lancamento.id_usuario, Lancamento.data, Lancamento.tipo,
+                Lancamento.descricao, Lancamento.valor, Lancamento.comprovante, Lancamento.comprovante_status
+            ).filter(
+                Lancamento.id_usuario == id_usuario,
+                filtro_periodo(Lancamento.data, *intervalo_mes(ano, mes))
+            ).order_by(Lancamento.data, Lancamento.id).all()
+            return tuple(LancamentoResumo(*linha) for linha in linhas)
+    return obter_ou_calcular(id_usuario, ('lancamentos_mes', ano, mes), carregar)
+
+
+def obter_saldo_final(id_usuario, ano, mes):
+    def carregar():
+        with get_session() as session:
+            return session.query(SaldoFinal.saldo).filter_by(id_usuario=id_usuario, ano=ano, mes=mes).scalar()
+    return obter_ou_calcular(id_usuario, ('saldo_final', ano, mes), carregar)
+
+
+def obter_totais_ano(id_usuario, ano):
+    """Totais por (mês, tipo) do ano em mapeamentos somente leitura, compartilhados pelo cache."""
+    def carregar():
+        with get_session() as session:
+            totais = totais_por_mes_e_tipo(session, id_usuario, ano)
+            return MappingProxyType({mes: MappingProxyType(dict(por_tipo)) for mes, por_tipo in totais.items()})
+    return obter_ou_calcular(id_usuario, ('totais_ano', ano), carregar)
+
+
+def obter_indice_administradores():
+    """{id_admin: ((id_usuario, ump_federacao), ...)} de todas as UMPs, montado uma vez por versão global."""
+    def carregar():
+        with get_session() as session:
+            linhas = session.query(
+                Configuracao.admin, Configuracao.id_usuario, Configuracao.ump_federacao
+            ).filter(Configuracao.admin != 0).order_by(Configuracao.id).all()
+        indice = defaultdict(list)
+        for admin, id_usuario, ump_federacao in linhas:
+            indice[admin].append((id_usuario, ump_federacao))
+        return MappingProxyType({admin: tuple(usuarios) for admin, usuarios in indice.items()})
+    return obter_ou_calcular(ESCOPO_GLOBAL, 'administradores', carregar)
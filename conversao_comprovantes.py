@@ -0,0 +1,141 @@
+import io
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from pdf2image import convert_from_path, pdfinfo_from_path
+from PIL import Image
+
+from armazenamento import guardar_comprovante, liberar_comprovante
+from cache import marcar_alteracao
+from db_runtime import get_session
+from imagens import caminho_impressao, gerar_derivados
+from metricas import CONVERSAO_DURACAO
+from models import Lancamento
+
+# Conversão de comprovantes em PDF para JPEG fora do script do Streamlit. Só a
+# primeira página é rasterizada (first_page/last_page), na resolução de
+# COMPROVANTE_PDF_DPI; arquivos acima dos limites de tamanho ou de páginas são
+# recusados já no upload. Enquanto a conversão não termina o lançamento fica
+# com comprovante_status='processando' e aponta para o PDF original.
+CONVERSAO_WORKERS = int(os.getenv("CONVERSAO_WORKERS", "2"))
+DPI_PDF = int(os.getenv("COMPROVANTE_PDF_DPI", "150"))
+MAX_PAGINAS_PDF = int(os.getenv("COMPROVANTE_PDF_MAX_PAGINAS", "20"))
+MAX_BYTES_COMPROVANTE = int(os.getenv("COMPROVANTE_MAX_MB", "10")) * 1024 * 1024
+TIMEOUT_CONVERSAO = int(os.getenv("COMPROVANTE_PDF_TIMEOUT", "60"))
+
+STATUS_PROCESSANDO = 'processando'
+STATUS_ERRO = 'erro'
+
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=CONVERSAO_WORKERS, thread_name_prefix="conversao")
+_em_andamento = set()
+_pendentes_retomados = False
+
+
+class ComprovanteInvalido(Exception):
+    pass
+
+
+def validar_tamanho(tamanho):
+    if tamanho > MAX_BYTES_COMPROVANTE:
+        raise ComprovanteInvalido(
+            f"O comprovante excede o limite de {MAX_BYTES_COMPROVANTE // (1024 * 1024)} MB."
+        )
+
+
+def validar_pdf(caminho):
+    """Confere o número de páginas lendo só os metadados do PDF (pdfinfo)."""
+    try:
+        paginas = pdfinfo_from_path(caminho, timeout=TIMEOUT_CONVERSAO).get('Pages', 0)
+    except Exception as e:
+        raise ComprovanteInvalido(f"Não foi possível ler o PDF: {e}")
+    if paginas < 1:
+        raise ComprovanteInvalido("O PDF não tem páginas.")
+    if paginas > MAX_PAGINAS_PDF:
+        raise ComprovanteInvalido(f"O PDF tem {paginas} páginas; o limite é {MAX_PAGINAS_PDF}.")
+
+
+def validar_imagem(caminho):
+    """Confere se o arquivo é uma imagem legível antes de gerar os derivados."""
+    try:
+        with Image.open(caminho) as imagem:
+            imagem.verify()
+    except Exception as e:
+        raise ComprovanteInvalido(f"O arquivo não é uma imagem válida: {e}")
+
+
+def converter_pdf(caminho_pdf):
+    """Rasteriza apenas a primeira página do PDF e devolve o JPEG em memória."""
+    paginas = convert_from_path(
+        caminho_pdf, dpi=DPI_PDF, first_page=1, last_page=1, timeout=TIMEOUT_CONVERSAO
+    )
+    if not paginas:
+        raise ComprovanteInvalido("O PDF não tem páginas.")
+    conteudo = io.BytesIO()
+    paginas[0].convert('RGB').save(conteudo, 'JPEG', quality=90)
+    conteudo.seek(0)
+    return conteudo
+
+
+def _executar(id_lancamento, caminho_pdf):
+    convertido = None
+    try:
+        inicio = time.perf_counter()
+        try:
+            convertido = converter_pdf(caminho_pdf)
+        except Exception:
+            traceback.print_exc()
+        CONVERSAO_DURACAO.labels('ok' if convertido else 'erro').observe(time.perf_counter() - inicio)
+
+        with get_session() as session:
+            lancamento = session.get(Lancamento, id_lancamento)
+            # O lançamento pode ter sido excluído ou recebido outro comprovante durante a conversão
+            if lancamento is None or lancamento.comprovante != caminho_pdf:
+                return
+            if convertido:
+                digest, caminho_jpg, _ = guardar_comprovante(session, convertido, '.jpg')
+                if not os.path.exists(caminho_impressao(caminho_jpg)):
+                    gerar_derivados(caminho_jpg)
+                liberar_comprovante(session, lancamento)  # o PDF sai do disco após o commit se ficar órfão
+                lancamento.comprovante = caminho_jpg
+                lancamento.comprovante_hash = digest
+                lancamento.comprovante_status = None
+            else:
+                lancamento.comprovante_status = STATUS_ERRO
+            marcar_alteracao(session, lancamento.id_usuario)
+            session.commit()
+    finally:
+        with _lock:
+            _em_andamento.discard(id_lancamento)
+
+
+def enviar_conversao(id_lancamento, caminho_pdf):
+    """Enfileira a conversão do PDF de um lançamento já gravado com status 'processando'."""
+    with _lock:
+        if id_lancamento in _em_andamento:
+            return
+        _em_andamento.add(id_lancamento)
+    _executor.submit(_executar, id_lancamento, caminho_pdf)
+
+
+def conversao_em_andamento(id_lancamento):
+    with _lock:
+        return id_lancamento in _em_andamento
+
+
+def retomar_conversoes_pendentes():
+    """Reenfileira conversões interrompidas por um reinício; roda uma vez por processo."""
+    global _pendentes_retomados
+    with _lock:
+        if _pendentes_retomados:
+            return
+        _pendentes_retomados = True
+    with get_session() as session:
+        pendentes = session.query(Lancamento.id, Lancamento.comprovante).filter(
+            Lancamento.comprovante_status == STATUS_PROCESSANDO
+        ).all()
+    for id_lancamento, caminho_pdf in pendentes:
+        enviar_conversao(id_lancamento, caminho_pdf)
@@ -0,0 +1,89 @@
+import os
+import threading
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from models import db
+from migracoes import aplicar_migracoes
+from monitor_sql import instrumentar_engine
+from metricas import ATIVO as METRICAS_ATIVO, PoolMedido, instrumentar_engine as instrumentar_metricas
+from perfil_paginas import instrumentar_engine as instrumentar_perfil
+
+# Engine, pool e fábrica de sessões compartilhados por todo o processo.
+# O Streamlit reexecuta o main.py a cada interação, mas os módulos importados
+# ficam em cache, então tudo aqui é criado uma única vez.
+_lock = threading.RLock()
+_engine = None
+_Session = None
+_banco_inicializado = False
+
+
+def _env_int(nome, padrao):
+    valor = os.getenv(nome)
+    try:
+        return int(valor) if valor else padrao
+    except ValueError:
+        return padrao
+
+
+def obter_database_uri():
+    uri = os.getenv("DATABASE_URL")
+    if not uri:
+        raise ValueError("DATABASE_URL não definido")
+    if uri.startswith("postgres://"):
+        uri = uri.replace("postgres://", "postgresql://", 1)
+    return uri
+
+
+def _opcoes_engine(uri):
+    if uri.startswith("sqlite"):
+        return {"pool_pre_ping": True, "connect_args": {"timeout": 10, "check_same_thread": False}}
+    opcoes = {
+        "pool_pre_ping": True,
+        "pool_size": _env_int("DB_POOL_SIZE", 5),
+        "max_overflow": _env_int("DB_MAX_OVERFLOW", 10),
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", 1800),
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", 30),
+        "connect_args": {"connect_timeout": 10},
+    }
+    if METRICAS_ATIVO:
+        opcoes["poolclass"] = PoolMedido
+    return opcoes
+
+
+def get_engine():
+    global _engine, _Session
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                uri = obter_database_uri()
+                engine = create_engine(uri, **_opcoes_engine(uri))
+                instrumentar_engine(engine)
+                instrumentar_perfil(engine)
+                instrumentar_metricas(engine)
+                _Session = sessionmaker(bind=engine)
+                _engine = engine
+    return _engine
+
+
+def get_session():
+    if _Session is None:
+        get_engine()
+    return _Session()
+
+
+def inicializar_banco():
+    """Cria, migra e verifica o esquema uma única vez por processo."""
+    global _banco_inicializado
+    if _banco_inicializado:
+        return get_engine()
+    with _lock:
+        if not _banco_inicializado:
+            engine = get_engine()
+            db.Model.metadata.create_all(engine)
+            aplicar_migracoes(engine)
+            with engine.connect() as conexao:
+                conexao.execute(text("SELECT 1"))
+            _banco_inicializado = True
+    return get_engine()
@@ -0,0 +1,75 @@
+from collections import namedtuple
+from datetime import timedelta
+
+from sqlalchemy import tuple_
+
+from models import Lancamento
+from periodos import filtro_periodo
+
+# Consulta paginada do explorador de lançamentos. A paginação é por chave
+# (keyset): cada página começa depois da tupla (coluna de ordenação, id) da
+# última linha da página anterior, então o custo não cresce com o número da
+# página e nenhuma linha é pulada ou repetida quando há inserções no meio.
+# Só as colunas exibidas são lidas, sem carregar entidades do ORM.
+FiltrosLancamentos = namedtuple('FiltrosLancamentos', [
+    'data_inicio', 'data_fim', 'tipos', 'valor_min', 'valor_max', 'com_comprovante'
+])
+LinhaLancamento = namedtuple('LinhaLancamento', ['id', 'data', 'tipo', 'descricao', 'valor', 'tem_comprovante'])
+
+ORDENACOES = {
+    'Data': Lancamento.data,
+    'Valor': Lancamento.valor,
+    'Tipo': Lancamento.tipo,
+    'Descrição': Lancamento.descricao,
+}
+
+
+def _aplicar_filtros(consulta, filtros):
+    if filtros.data_inicio and filtros.data_fim:
+        consulta = consulta.filter(
+            filtro_periodo(Lancamento.data, filtros.data_inicio, filtros.data_fim + timedelta(days=1))
+        )
+    elif filtros.data_inicio:
+        consulta = consulta.filter(Lancamento.data >= filtros.data_inicio)
+    elif filtros.data_fim:
+        consulta = consulta.filter(Lancamento.data < filtros.data_fim + timedelta(days=1))
+    if filtros.tipos:
+        consulta = consulta.filter(Lancamento.tipo.in_(filtros.tipos))
+    if filtros.valor_min is not None:
+        consulta = consulta.filter(Lancamento.valor >= filtros.valor_min)
+    if filtros.valor_max is not None:
+        consulta = consulta.filter(Lancamento.valor <= filtros.valor_max)
+    if filtros.com_comprovante is True:
+        consulta = consulta.filter(Lancamento.comprovante.isnot(None))
+    elif filtros.com_comprovante is False:
+        consulta = consulta.filter(Lancamento.comprovante.is_(None))
+    return consulta
+
+
+def buscar_pagina(session, id_usuario, filtros, ordenar_por='Data', decrescente=False, cursor=None, tamanho=50):
+    """Uma página de lançamentos e o cursor da próxima (None se esta for a última).
+
+    `cursor` é a tupla (valor da coluna de ordenação, id) da última linha da página anterior.
+    """
+    coluna = ORDENACOES[ordenar_por]
+    consulta = session.query(
+        Lancamento.id, Lancamento.data, Lancamento.tipo, Lancamento.descricao, Lancamento.valor,
+        Lancamento.comprovante.isnot(None)
+    ).filter(Lancamento.id_usuario == id_usuario)
+    consulta = _aplicar_filtros(consulta, filtros)
+
+    chave = tuple_(coluna, Lancamento.id)
+    if cursor is not None:
+        consulta = consulta.filter(chave < tuple_(*cursor) if decrescente else chave > tuple_(*cursor))
+    if decrescente:
+        consulta = consulta.order_by(coluna.desc(), Lancamento.id.desc())
+    else:
+        consulta = consulta.order_by(coluna, Lancamento.id)
+
+    linhas = [LinhaLancamento(*linha) for linha in consulta.limit(tamanho + 1)]
+    proximo = None
+    if len(linhas) > tamanho:
+        linhas = linhas[:tamanho]
+        ultima = linhas[-1]
+        proximo = (getattr(ultima, coluna.key), ultima.id)
+    return linhas, proximo
@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from cache_relatorios import buscar_no_cache, guardar_no_cache, impressao_digital, limpar_diretorio
+from livro_caixa import FORMATOS, exportar_livro_caixa
+from metricas import EXPORTACAO_BYTES, EXPORTACAO_DURACAO
+from pastas import RELATORIOS_DIR
+from relatorio_federacao import exportar_federacao
+from relatorios_pdf import exportar_comprovantes, exportar_relatorio, nome_arquivo_pdf, publicar_pdf
+
+# Exportações de PDF em segundo plano. Cada pedido vira um job com id e estado
+# (queued/running/done/failed) executado num pool de threads, para que o
+# script do Streamlit não fique bloqueado enquanto o FPDF trabalha. Pedidos
+# iguais (usuário, ano, mês, tipo) feitos enquanto um job ainda está na fila ou
+# rodando são agrupados no mesmo job, e um PDF cujas entradas não mudaram é
+# servido direto do cache_relatorios. O PDF fica em memória (bytes) até ser
+# baixado ou expirar; a cópia em relatorios/ é publicada com nome próprio para
+# cada variante. O relatório consolidado da federação usa o id do
+# administrador como id_usuario e não passa pelo cache de PDFs. O livro-caixa
+# em planilha recebe período, formato e UMPs em `opcoes` e, como pode ser
+# grande, nunca passa pela memória: é escrito em JOBS_DIR/<id do job>, servido
+# de lá e apagado quando o job expira. Planilhas acima de MAX_BYTES_DOWNLOAD
+# não são oferecidas no navegador (use `manutencao.py exportar-livro-caixa`).
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+RETENCAO_JOBS_SEGUNDOS = int(os.getenv("EXPORT_RETENCAO_SEGUNDOS", "900"))
+JOBS_DIR = os.path.join(RELATORIOS_DIR, 'jobs')
+MAX_BYTES_DOWNLOAD = int(os.getenv("EXPORT_DOWNLOAD_MAX_MB", "50")) * 1024 * 1024
+
+TIPO_RELATORIO = 'relatorio'
+TIPO_COMPROVANTES = 'comprovantes'
+TIPO_FEDERACAO = 'federacao'
+TIPO_LIVRO_CAIXA = 'livro_caixa'
+
+ESTADO_NA_FILA = 'queued'
+ESTADO_EXECUTANDO = 'running'
+ESTADO_CONCLUIDO = 'done'
+ESTADO_FALHOU = 'failed'
+
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="exportacao")
+_jobs = {}
+_jobs_ativos = {}
+
+
+class JobExportacao:
+    def __init__(self, id_usuario, ano, mes, tipo, opcoes=None):
+        self.id = uuid.uuid4().hex
+        self.id_usuario = id_usuario
+        self.ano = ano
+        self.mes = mes
+        self.tipo = tipo
+        self.opcoes = opcoes
+        self.estado = ESTADO_NA_FILA
+        self.progresso = 0.0
+        self.resultado = None
+        self.caminho = None
+        self.tamanho = None
+        self.erro = None
+        self.detalhes_erro = None
+        self.criado_em = time.time()
+        self.concluido_em = None
+
+    @property
+    def chave(self):
+        return (self.id_usuario, self.ano, self.mes, self.tipo, self.opcoes)
+
+    @property
+    def nome_arquivo(self):
+        if self.tipo == TIPO_LIVRO_CAIXA:
+            formato, data_inicio, data_fim, _ = self.opcoes
+            return f"livro_caixa_{self.id_usuario}_{data_inicio:%Y%m%d}_{data_fim:%Y%m%d}.{formato}"
+        return nome_arquivo_pdf(self.tipo, self.ano, self.id_usuario, self.mes)
+
+    @property
+    def mime(self):
+        if self.tipo == TIPO_LIVRO_CAIXA:
+            return FORMATOS[self.opcoes[0]][1]
+        return "application/pdf"
+
+    @property
+    def finalizado(self):
+        return self.estado in (ESTADO_CONCLUIDO, ESTADO_FALHOU)
+
+    @property
+    def grande_demais(self):
+        return self.caminho is not None and self.tamanho > MAX_BYTES_DOWNLOAD
+
+    def abrir_resultado(self):
+        """Bytes do PDF ou o arquivo da planilha aberto para leitura (quem chama fecha)."""
+        if self.caminho is not None:
+            return open(self.caminho, 'rb')
+        return self.resultado
+
+
+def _executar(job):
+    job.estado = ESTADO_EXECUTANDO
+    inicio = time.time()
+
+    def atualizar_progresso(fracao):
+        job.progresso = min(max(fracao, 0.0), 1.0)
+
+    try:
+        if job.tipo == TIPO_LIVRO_CAIXA:
+            job.caminho, job.tamanho = _exportar_planilha(job, atualizar_progresso)
+        else:
+            digital = None if job.tipo == TIPO_FEDERACAO else impressao_digital(job.id_usuario, job.tipo, job.mes)
+            conteudo = buscar_no_cache(job.tipo, digital)
+            if conteudo is None:
+                if job.tipo == TIPO_RELATORIO:
+                    conteudo = exportar_relatorio(job.id_usuario, job.mes, progresso=atualizar_progresso)
+                elif job.tipo == TIPO_FEDERACAO:
+                    conteudo = exportar_federacao(job.id_usuario, job.ano, progresso=atualizar_progresso)
+                else:
+                    conteudo = exportar_comprovantes(job.id_usuario, job.ano, job.mes, progresso=atualizar_progresso)
+                guardar_no_cache(job.tipo, digital, conteudo)
+            publicar_pdf(conteudo, job.nome_arquivo)
+            job.resultado, job.tamanho = conteudo, len(conteudo)
+        job.progresso = 1.0
+        job.estado = ESTADO_CONCLUIDO
+    except Exception as e:
+        job.erro = _mensagem_erro(e)
+        job.detalhes_erro = traceback.format_exc()
+        job.estado = ESTADO_FALHOU
+    finally:
+        job.concluido_em = time.time()
+        EXPORTACAO_DURACAO.labels(job.tipo, job.estado).observe(job.concluido_em - inicio)
+        if job.tamanho is not None:
+            EXPORTACAO_BYTES.labels(job.tipo).observe(job.tamanho)
+        with _lock:
+            if _jobs_ativos.get(job.chave) is job:
+                del _jobs_ativos[job.chave]
+
+
+def _mensagem_erro(erro):
+    """Primeira linha da mensagem da exceção, ou o nome do tipo se ela estiver vazia."""
+    linhas = str(erro).strip().splitlines()
+    return linhas[0] if linhas else type(erro).__name__
+
+
+def _exportar_planilha(job, progresso):
+    """Escreve a planilha em JOBS_DIR e devolve (caminho, tamanho)."""
+    formato, data_inicio, data_fim, ids_usuarios = job.opcoes
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    caminho = os.path.join(JOBS_DIR, f"{job.id}.{formato}")
+    try:
+        with open(caminho, 'wb') as arquivo:
+            exportar_livro_caixa(ids_usuarios, data_inicio, data_fim, formato, arquivo, progresso=progresso)
+        return caminho, os.path.getsize(caminho)
+    except Exception:
+        _remover_arquivo(caminho)
+        raise
+
+
+def _remover_arquivo(caminho):
+    try:
+        os.remove(caminho)
+    except FileNotFoundError:
+        pass
+
+
+def _limpar_jobs_antigos():
+    limite = time.time() - RETENCAO_JOBS_SEGUNDOS
+    for job in [j for j in _jobs.values() if j.finalizado and j.concluido_em < limite]:
+        del _jobs[job.id]
+        if job.caminho:
+            _remover_arquivo(job.caminho)
+    # Planilhas deixadas por processos encerrados antes de os jobs expirarem; a
+    # margem evita apagar um arquivo que outro processo ainda está escrevendo
+    limpar_diretorio(JOBS_DIR, '', 2 * RETENCAO_JOBS_SEGUNDOS, float('inf'))
+
+
+def enviar_exportacao(id_usuario, ano, mes, tipo, opcoes=None):
+    """Enfileira a exportação ou devolve o job equivalente que já está em andamento."""
+    with _lock:
+        _limpar_jobs_antigos()
+        existente = _jobs_ativos.get((id_usuario, ano, mes, tipo, opcoes))
+        if existente:
+            return existente
+        job = JobExportacao(id_usuario, ano, mes, tipo, opcoes)
+        _jobs[job.id] = job
+        _jobs_ativos[job.chave] = job
+    _executor.submit(_executar, job)
+    return job
+
+
+def obter_job(job_id):
+    with _lock:
+        return _jobs.get(job_id)
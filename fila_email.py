@@ -0,0 +1,263 @@
+import os
+import random
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+
+from db_runtime import get_session
+from metricas import EMAIL_ENVIOS
+from models import EmailPendente
+
+# Fila de e-mails de saída. enfileirar_email() só grava uma linha em
+# email_pendente dentro da transação de quem chama (a troca de senha e o e-mail
+# entram ou saem juntos); uma thread por processo envia os pendentes por uma
+# requests.Session reaproveitada, com timeouts de conexão e de leitura. Falhas
+# temporárias (rede, 429, 5xx) voltam para a fila com espera exponencial;
+# recusas definitivas (demais 4xx) ou MAX_TENTATIVAS esgotadas deixam o e-mail
+# em 'falhou'. O conteúdo é apagado quando o e-mail sai da fila (enviado ou
+# falhou), pois pode conter uma senha; `python manutencao.py reenviar-emails`
+# remonta a mensagem pelo reconstrutor registrado para o `tipo` do e-mail e a
+# coloca de novo na fila. Cada envio é reservado com um UPDATE condicional, então vários
+# processos podem despachar a mesma fila sem enviar duas vezes.
+PROVEDOR = os.getenv("EMAIL_PROVEDOR", "sendinblue")
+EMAIL_API_URL = os.getenv("EMAIL_API_URL", "https://api.sendinblue.com/v3/smtp/email")
+REMETENTE = os.getenv("EMAIL_REMETENTE", "suporteumpfinanceiro@gmail.com")
+TIMEOUT_CONEXAO = float(os.getenv("EMAIL_TIMEOUT_CONEXAO", "5"))
+TIMEOUT_LEITURA = float(os.getenv("EMAIL_TIMEOUT_LEITURA", "20"))
+MAX_TENTATIVAS = int(os.getenv("EMAIL_MAX_TENTATIVAS", "6"))
+ESPERA_BASE_SEGUNDOS = int(os.getenv("EMAIL_ESPERA_BASE", "30"))
+ESPERA_MAXIMA_SEGUNDOS = int(os.getenv("EMAIL_ESPERA_MAXIMA", "3600"))
+INTERVALO_SEGUNDOS = float(os.getenv("EMAIL_INTERVALO", "10"))
+LOTE = 20
+# Um e-mail reservado que não teve resultado gravado (processo interrompido) volta a ser elegível depois disso
+RESERVA_SEGUNDOS = 2 * (TIMEOUT_CONEXAO + TIMEOUT_LEITURA) + 60
+
+ESTADO_PENDENTE = 'pendente'
+ESTADO_ENVIADO = 'enviado'
+ESTADO_FALHOU = 'falhou'
+
+_lock = threading.Lock()
+_acordar = threading.Event()
+_despachante = None
+
+
+class ErroEnvio(Exception):
+    """Falha ao entregar ao provedor; com definitivo=True o e-mail não é tentado de novo."""
+
+    def __init__(self, mensagem, definitivo=False):
+        super().__init__(mensagem)
+        self.definitivo = definitivo
+
+
+class ProvedorSendinblue:
+    def configurado(self):
+        return bool(os.getenv("SENDINBLUE_API_KEY"))
+
+    def enviar(self, sessao_http, destinatario, assunto, conteudo):
+        api_key = os.getenv("SENDINBLUE_API_KEY")
+        if not api_key:
+            raise ErroEnvio("SENDINBLUE_API_KEY não configurada")
+        dados = {
+            "sender": {"email": REMETENTE},
+            "to": [{"email": destinatario}],
+            "subject": assunto,
+            "textContent": conteudo,
+        }
+        try:
+            resposta = sessao_http.post(
+                EMAIL_API_URL, json=dados, headers={"api-key": api_key},
+                timeout=(TIMEOUT_CONEXAO, TIMEOUT_LEITURA)
+            )
+        except requests.RequestException as e:
+            raise ErroEnvio(f"{type(e).__name__}: {e}")
+        if resposta.status_code in (200, 201, 202):
+            return
+        definitivo = 400 <= resposta.status_code < 500 and resposta.status_code not in (408, 429)
+        raise ErroEnvio(f"{resposta.status_code} - {resposta.text[:500]}", definitivo)
+
+
+PROVEDORES = {
+    'sendinblue': ProvedorSendinblue,
+}
+_provedor = None
+RECONSTRUTORES = {}
+
+
+def registrar_reconstrutor(tipo):
+    """Registra a função que remonta e reenfileira um e-mail desse tipo que falhou."""
+    def registrar(funcao):
+        RECONSTRUTORES[tipo] = funcao
+        return funcao
+    return registrar
+
+
+def obter_provedor():
+    global _provedor
+    if _provedor is None:
+        _provedor = PROVEDORES[PROVEDOR]()
+    return _provedor
+
+
+def definir_provedor(provedor):
+    """Troca o provedor do processo (por exemplo, por um falso em testes)."""
+    global _provedor
+    _provedor = provedor
+
+
+def provedor_configurado():
+    return obter_provedor().configurado()
+
+
+def enfileirar_email(session, destinatario, assunto, conteudo, tipo=None, id_usuario=None):
+    """Adiciona o e-mail à transação de `session`; o despachante é acordado após o commit."""
+    agora = datetime.now()
+    session.add(EmailPendente(
+        destinatario=destinatario,
+        assunto=assunto,
+        conteudo=conteudo,
+        tipo=tipo,
+        id_usuario=id_usuario,
+        estado=ESTADO_PENDENTE,
+        tentativas=0,
+        proxima_tentativa=agora,
+        criado_em=agora,
+    ))
+    session.info['email_enfileirado'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _acordar_apos_commit(session):
+    if session.info.pop('email_enfileirado', False):
+        _acordar.set()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _descartar_apos_rollback(session, transacao_anterior):
+    if transacao_anterior.parent is None:
+        session.info.pop('email_enfileirado', None)
+
+
+def _criar_sessao_http():
+    sessao = requests.Session()
+    adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+    sessao.mount("https://", adaptador)
+    sessao.mount("http://", adaptador)
+    return sessao
+
+
+def _reservar(id_email):
+    """Marca a tentativa e adia o e-mail por RESERVA_SEGUNDOS; None se outro despachante chegou antes."""
+    agora = datetime.now()
+    with get_session() as session:
+        resultado = session.execute(update(EmailPendente).where(
+            EmailPendente.id == id_email,
+            EmailPendente.estado == ESTADO_PENDENTE,
+            EmailPendente.proxima_tentativa <= agora
+        ).values(
+            tentativas=EmailPendente.tentativas + 1,
+            proxima_tentativa=agora + timedelta(seconds=RESERVA_SEGUNDOS)
+        ))
+        if resultado.rowcount != 1:
+            session.rollback()
+            return None
+        email = session.query(
+            EmailPendente.id, EmailPendente.destinatario, EmailPendente.assunto, EmailPendente.conteudo
+        ).filter(EmailPendente.id == id_email).one()
+        session.commit()
+        return email
+
+
+def _registrar_resultado(id_email, erro):
+    agora = datetime.now()
+    with get_session() as session:
+        email = session.get(EmailPendente, id_email)
+        if erro is None:
+            email.estado = ESTADO_ENVIADO
+            email.enviado_em = agora
+            email.conteudo = ""
+            email.ultimo_erro = None
+            EMAIL_ENVIOS.labels('enviado').inc()
+        elif erro.definitivo or email.tentativas >= MAX_TENTATIVAS:
+            email.estado = ESTADO_FALHOU
+            email.conteudo = ""
+            email.ultimo_erro = str(erro)
+            EMAIL_ENVIOS.labels('falhou').inc()
+        else:
+            espera = min(ESPERA_BASE_SEGUNDOS * 2 ** (email.tentativas - 1), ESPERA_MAXIMA_SEGUNDOS)
+            email.proxima_tentativa = agora + timedelta(seconds=espera * random.uniform(0.8, 1.2))
+            email.ultimo_erro = str(erro)
+            EMAIL_ENVIOS.labels('nova_tentativa').inc()
+        session.commit()
+
+
+def processar_fila(sessao_http, provedor=None):
+    """Envia até LOTE e-mails vencidos e devolve quantos foram tentados."""
+    provedor = provedor or obter_provedor()
+    with get_session() as session:
+        ids = [linha[0] for linha in session.query(EmailPendente.id).filter(
+            EmailPendente.estado == ESTADO_PENDENTE,
+            EmailPendente.proxima_tentativa <= datetime.now()
+        ).order_by(EmailPendente.proxima_tentativa).limit(LOTE)]
+
+    tentados = 0
+    for id_email in ids:
+        email = _reservar(id_email)
+        if email is None:
+            continue
+        try:
+            provedor.enviar(sessao_http, email.destinatario, email.assunto, email.conteudo)
+            erro = None
+        except ErroEnvio as e:
+            erro = e
+        except Exception as e:
+            traceback.print_exc()
+            erro = ErroEnvio(f"{type(e).__name__}: {e}")
+        _registrar_resultado(id_email, erro)
+        tentados += 1
+    return tentados
+
+
+def _executar_despachante():
+    sessao_http = _criar_sessao_http()
+    while True:
+        _acordar.clear()
+        try:
+            while processar_fila(sessao_http) == LOTE:
+                pass
+        except Exception:
+            traceback.print_exc()
+        _acordar.wait(INTERVALO_SEGUNDOS)
+
+
+def iniciar_despachante():
+    """Sobe a thread de envio uma única vez por processo."""
+    global _despachante
+    with _lock:
+        if _despachante is not None:
+            return
+        _despachante = threading.Thread(target=_executar_despachante, name="fila_email", daemon=True)
+        _despachante.start()
+
+
+def reenviar_falhos(session):
+    """Remonta e reenfileira os e-mails em 'falhou'; devolve (reenviados, sem_reconstrutor). O commit fica com quem chama."""
+    reenviados = sem_reconstrutor = 0
+    for email in session.query(EmailPendente).filter(EmailPendente.estado == ESTADO_FALHOU).all():
+        reconstruir = RECONSTRUTORES.get(email.tipo)
+        if reconstruir is not None and reconstruir(session, email):
+            session.delete(email)
+            reenviados += 1
+        elif email.conteudo:
+            # Falhas gravadas antes de o conteúdo ser apagado: volta à fila como está
+            email.estado = ESTADO_PENDENTE
+            email.tentativas = 0
+            email.proxima_tentativa = datetime.now()
+            reenviados += 1
+        else:
+            sem_reconstrutor += 1
+    return reenviados, sem_reconstrutor
@@ -0,0 +1,77 @@
+import os
+
+from PIL import Image, ImageOps
+
+# Derivados gerados no upload de cada comprovante:
+#   <original>.print.jpg  cópia para o PDF, limitada à área útil de 190x250 mm
+#   <original>.thumb.jpg  miniatura para a listagem do mês
+# As páginas e a exportação usam os derivados; o original fica guardado.
+DPI_IMPRESSAO = int(os.getenv("IMAGEM_DPI_IMPRESSAO", "150"))
+LARGURA_IMPRESSAO_MM = 190
+ALTURA_IMPRESSAO_MM = 250
+LARGURA_MINIATURA = int(os.getenv("IMAGEM_LARGURA_MINIATURA", "400"))
+QUALIDADE_JPEG = int(os.getenv("IMAGEM_QUALIDADE_JPEG", "85"))
+
+SUFIXO_IMPRESSAO = '.print.jpg'
+SUFIXO_MINIATURA = '.thumb.jpg'
+EXTENSOES_IMAGEM = ('.jpg', '.jpeg', '.png')
+
+
+def _mm_para_px(mm):
+    return int(mm / 25.4 * DPI_IMPRESSAO)
+
+
+def caminho_impressao(caminho):
+    return caminho + SUFIXO_IMPRESSAO
+
+
+def caminho_miniatura(caminho):
+    return caminho + SUFIXO_MINIATURA
+
+
+def eh_derivado(caminho):
+    return caminho.endswith(SUFIXO_IMPRESSAO) or caminho.endswith(SUFIXO_MINIATURA)
+
+
+def _salvar_jpeg(imagem, destino):
+    temporario = destino + '.tmp'
+    imagem.save(temporario, 'JPEG', quality=QUALIDADE_JPEG, optimize=True, progressive=True)
+    os.replace(temporario, destino)
+
+
+def gerar_derivados(caminho):
+    """Aplica a orientação EXIF e grava as versões de impressão e miniatura do comprovante."""
+    if not caminho.lower().endswith(EXTENSOES_IMAGEM) or eh_derivado(caminho):
+        return False
+    with Image.open(caminho) as original:
+        imagem = ImageOps.exif_transpose(original)
+        if imagem.mode != 'RGB':
+            imagem = imagem.convert('RGB')
+
+        impressao = imagem.copy()
+        impressao.thumbnail((_mm_para_px(LARGURA_IMPRESSAO_MM), _mm_para_px(ALTURA_IMPRESSAO_MM)), Image.LANCZOS)
+        _salvar_jpeg(impressao, caminho_impressao(caminho))
+
+        miniatura = impressao.copy()
+        miniatura.thumbnail((LARGURA_MINIATURA, LARGURA_MINIATURA * 4), Image.LANCZOS)
+        _salvar_jpeg(miniatura, caminho_miniatura(caminho))
+    return True
+
+
+def _existente_ou_original(derivado, caminho):
+    return derivado if os.path.exists(derivado) else caminho
+
+
+def imagem_para_exibicao(caminho):
+    return _existente_ou_original(caminho_miniatura(caminho), caminho)
+
+
+def imagem_para_pdf(caminho):
+    return _existente_ou_original(caminho_impressao(caminho), caminho)
+
+
+def remover_comprovante(caminho):
+    """Remove o arquivo do comprovante e seus derivados."""
+    for arquivo in (caminho, caminho_impressao(caminho), caminho_miniatura(caminho)):
+        if arquivo and os.path.exists(arquivo):
+            os.remove(arquivo)
@@ -0,0 +1,242 @@
+import csv
+import io
+import re
+import unicodedata
+from collections import Counter, defaultdict, namedtuple
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from models import Lancamento
+from relatorio_dados import TIPOS_LANCAMENTO
+from saldos import registrar_movimentos
+
+# Importação de extratos bancários (CSV ou OFX). O arquivo vira uma lista de
+# MovimentoExtrato (valor com sinal: positivo entra, negativo sai), que é
+# classificada em tipos e comparada com os lançamentos já gravados antes de
+# ir para a prévia. Na gravação, os lançamentos entram em lotes de
+# TAMANHO_LOTE com executemany e o resumo/saldo é atualizado uma única vez
+# por mês afetado, tudo na mesma transação.
+MovimentoExtrato = namedtuple('MovimentoExtrato', ['linha', 'data', 'descricao', 'valor', 'tipo', 'erro'])
+LinhaImportacao = namedtuple('LinhaImportacao', ['linha', 'data', 'tipo', 'descricao', 'valor', 'duplicada', 'erro'])
+
+TAMANHO_LOTE = 500
+TAMANHO_DESCRICAO = 120
+FORMATOS_DATA = ("%d/%m/%Y", "%d/%m/%y", "%Y-%m-%d", "%d-%m-%Y", "%d.%m.%Y")
+
+# Palavras do cabeçalho (sem acento, minúsculas) que indicam cada campo
+CAMPOS_CSV = {
+    'data': ('data', 'dt'),
+    'descricao': ('descri', 'histor', 'memo', 'lancamento'),
+    'valor': ('valor', 'quantia', 'montante'),
+    'tipo': ('tipo', 'natureza', 'd/c', 'c/d'),
+}
+INDICADORES_CREDITO = ('c', 'credito', 'receita', 'entrada')
+INDICADORES_DEBITO = ('d', 'debito', 'despesa', 'saida')
+
+
+def _normalizar(texto):
+    sem_acento = unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode('ascii')
+    return sem_acento.strip().lower()
+
+
+def _decodificar(conteudo):
+    try:
+        return conteudo.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return conteudo.decode('cp1252', errors='replace')
+
+
+def converter_valor_brl(texto):
+    """Converte valores como '1.234,56', '-R$ 10,00', '(10,00)' ou '10,00 D' em float.
+
+    Sem vírgula, o ponto só é separador de milhar quando separa grupos de três
+    dígitos ('1.234'); caso contrário é decimal ('10.5').
+    """
+    valor = texto.strip().upper().replace('R$', '').replace('\xa0', '').replace(' ', '')
+    negativo = False
+    if valor.startswith('(') and valor.endswith(')'):
+        negativo, valor = True, valor[1:-1]
+    if valor[-1:] in ('D', 'C'):
+        negativo, valor = valor[-1] == 'D', valor[:-1]
+    if valor.endswith('-'):
+        negativo, valor = True, valor[:-1]
+    if valor.startswith('-'):
+        negativo, valor = True, valor[1:]
+    elif valor.startswith('+'):
+        valor = valor[1:]
+
+    if ',' in valor:
+        valor = valor.replace('.', '').replace(',', '.')
+    elif re.fullmatch(r'\d{1,3}(\.\d{3})+', valor):
+        valor = valor.replace('.', '')
+    if not re.fullmatch(r'\d+(\.\d+)?', valor):
+        raise ValueError(f"Valor inválido: {texto!r}")
+    return -float(valor) if negativo else float(valor)
+
+
+def converter_data(texto):
+    texto = texto.strip()
+    for formato in FORMATOS_DATA:
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Data inválida: {texto!r}")
+
+
+def ler_csv(conteudo, pular=0):
+    """Cabeçalho e linhas do CSV, detectando codificação e separador (';', ',' ou tabulação)."""
+    texto = _decodificar(conteudo)
+    linhas_texto = texto.splitlines()[pular:]
+    amostra = "\n".join(linhas_texto[:20])
+    try:
+        delimitador = csv.Sniffer().sniff(amostra, delimiters=';,\t').delimiter
+    except csv.Error:
+        delimitador = ';'
+    leitor = csv.reader(io.StringIO("\n".join(linhas_texto)), delimiter=delimitador)
+    linhas = [linha for linha in leitor if any(celula.strip() for celula in linha)]
+    if not linhas:
+        return [], []
+    return [coluna.strip() for coluna in linhas[0]], linhas[1:]
+
+
+def sugerir_colunas(cabecalho):
+    """Índice sugerido de cada campo a partir dos nomes das colunas (None se não achar)."""
+    sugestao = {}
+    normalizados = [_normalizar(coluna) for coluna in cabecalho]
+    for campo, palavras in CAMPOS_CSV.items():
+        sugestao[campo] = next(
+            (indice for indice, nome in enumerate(normalizados)
+             if indice not in sugestao.values() and any(palavra in nome for palavra in palavras)),
+            None
+        )
+    return sugestao
+
+
+def _tipo_explicito(texto, valor):
+    """Aplica a coluna de tipo do CSV: devolve (valor com sinal, tipo ou None)."""
+    normalizado = _normalizar(texto)
+    for tipo in TIPOS_LANCAMENTO:
+        if normalizado == _normalizar(tipo):
+            return abs(valor), tipo
+    if normalizado in INDICADORES_CREDITO:
+        return abs(valor), None
+    if normalizado in INDICADORES_DEBITO:
+        return -abs(valor), None
+    return valor, None
+
+
+def extrair_csv(linhas, colunas):
+    """Movimentos das linhas do CSV; `colunas` mapeia data/descricao/valor/tipo para índices."""
+    movimentos = []
+    for numero, linha in enumerate(linhas, start=2):
+        def campo(nome):
+            indice = colunas.get(nome)
+            return linha[indice].strip() if indice is not None and indice < len(linha) else ""
+
+        try:
+            data = converter_data(campo('data'))
+            valor = converter_valor_brl(campo('valor'))
+            tipo = None
+            if colunas.get('tipo') is not None:
+                valor, tipo = _tipo_explicito(campo('tipo'), valor)
+            movimentos.append(MovimentoExtrato(numero, data, campo('descricao'), valor, tipo, None))
+        except ValueError as e:
+            movimentos.append(MovimentoExtrato(numero, None, campo('descricao'), None, None, str(e)))
+    return movimentos
+
+
+def _tag_ofx(bloco, tag):
+    encontrado = re.search(rf'<{tag}>([^<\r\n]*)', bloco, re.IGNORECASE)
+    return encontrado.group(1).strip() if encontrado else ""
+
+
+def extrair_ofx(conteudo):
+    """Movimentos das transações (<STMTTRN>) de um extrato OFX 1.x (SGML) ou 2.x (XML)."""
+    texto = _decodificar(conteudo)
+    movimentos = []
+    blocos = re.split(r'<STMTTRN>', texto, flags=re.IGNORECASE)[1:]
+    for numero, bloco in enumerate(blocos, start=1):
+        bloco = re.split(r'</STMTTRN>|</BANKTRANLIST>', bloco, flags=re.IGNORECASE)[0]
+        descricao = _tag_ofx(bloco, 'MEMO') or _tag_ofx(bloco, 'NAME')
+        try:
+            data = datetime.strptime(_tag_ofx(bloco, 'DTPOSTED')[:8], "%Y%m%d").date()
+            valor = float(_tag_ofx(bloco, 'TRNAMT').replace(',', '.'))
+            movimentos.append(MovimentoExtrato(numero, data, descricao, valor, None, None))
+        except ValueError:
+            movimentos.append(MovimentoExtrato(numero, None, descricao, None, None, "Transação sem data ou valor válido"))
+    return movimentos
+
+
+def _chave_duplicidade(data, valor, descricao):
+    return data, round(float(valor), 2), _normalizar(descricao)
+
+
+def preparar_importacao(session, id_usuario, movimentos, tipo_credito, tipo_debito):
+    """Classifica os movimentos e marca os que já existem entre os lançamentos do usuário.
+
+    Uma linha é duplicada quando já há lançamento com a mesma data, valor e
+    descrição; cada lançamento existente só cobre uma linha do extrato, então
+    duas transações idênticas no arquivo contra uma gravada deixam uma livre.
+    """
+    linhas = []
+    for movimento in movimentos:
+        erro = movimento.erro
+        if not erro and not movimento.valor:
+            erro = "Valor zerado"
+        if not erro and not movimento.descricao:
+            erro = "Descrição vazia"
+        if erro:
+            linhas.append(LinhaImportacao(movimento.linha, movimento.data, None, movimento.descricao, movimento.valor, False, erro))
+            continue
+        tipo = movimento.tipo or (tipo_credito if movimento.valor > 0 else tipo_debito)
+        linhas.append(LinhaImportacao(
+            movimento.linha, movimento.data, tipo, movimento.descricao[:TAMANHO_DESCRICAO],
+            round(abs(movimento.valor), 2), False, None
+        ))
+
+    datas = [linha.data for linha in linhas if not linha.erro]
+    if not datas:
+        return linhas
+    existentes = Counter(
+        _chave_duplicidade(*registro) for registro in session.query(
+            Lancamento.data, Lancamento.valor, Lancamento.descricao
+        ).filter(
+            Lancamento.id_usuario == id_usuario,
+            Lancamento.data >= min(datas),
+            Lancamento.data <= max(datas)
+        )
+    )
+    marcadas = []
+    for linha in linhas:
+        if not linha.erro:
+            chave = _chave_duplicidade(linha.data, linha.valor, linha.descricao)
+            if existentes[chave]:
+                existentes[chave] -= 1
+                linha = linha._replace(duplicada=True)
+        marcadas.append(linha)
+    return marcadas
+
+
+def importar_lancamentos(session, id_usuario, linhas, tamanho_lote=TAMANHO_LOTE):
+    """Grava as linhas (data, tipo, descrição, valor) na transação corrente; o commit fica com quem chama."""
+    registros = [{
+        'id_usuario': id_usuario,
+        'data': linha.data,
+        'tipo': linha.tipo,
+        'descricao': linha.descricao,
+        'valor': linha.valor,
+    } for linha in linhas]
+    tabela = Lancamento.__table__
+    for inicio in range(0, len(registros), tamanho_lote):
+        session.execute(insert(tabela), registros[inicio:inicio + tamanho_lote])
+
+    movimentos = defaultdict(lambda: (0.0, 0))
+    for registro in registros:
+        chave = (registro['data'].year, registro['data'].month, registro['tipo'])
+        valor, quantidade = movimentos[chave]
+        movimentos[chave] = (valor + registro['valor'], quantidade + 1)
+    if movimentos:
+        registrar_movimentos(session, id_usuario, movimentos)
+    return len(registros)
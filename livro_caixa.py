@@ -0,0 +1,180 @@
+import csv
+import io
+import os
+from collections import namedtuple
+from datetime import timedelta
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import Workbook
+from sqlalchemy import func, select, tuple_
+
+from db_runtime import get_session
+from models import Configuracao, Lancamento, SaldoFinal
+from periodos import filtro_periodo
+from saldos import valor_com_sinal
+
+# Livro-caixa em planilha (CSV, XLSX ou Parquet) para um conjunto de UMPs e um
+# período. Os lançamentos são lidos em lotes de LOTE_LEITURA (yield_per, que no
+# Postgres usa cursor no servidor) na ordem (UMP, data, id), e cada linha é
+# escrita assim que chega: csv direto no arquivo, openpyxl em modo write_only e
+# ParquetWriter em grupos de LOTE_ESCRITA linhas. Os saldos finais, poucos,
+# são carregados antes e intercalados após o último lançamento de cada mês.
+LOTE_LEITURA = int(os.getenv("LIVRO_CAIXA_LOTE_LEITURA", "2000"))
+LOTE_ESCRITA = int(os.getenv("LIVRO_CAIXA_LOTE_ESCRITA", "10000"))
+# Linhas de dados por aba do XLSX (o Excel aceita 1.048.576 contando o cabeçalho)
+LINHAS_POR_ABA = 1048575
+
+FORMATOS = {
+    'csv': ("CSV", "text/csv"),
+    'xlsx': ("Excel (XLSX)", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    'parquet': ("Parquet", "application/vnd.apache.parquet"),
+}
+
+REGISTRO_LANCAMENTO = 'Lançamento'
+REGISTRO_SALDO = 'Saldo final'
+
+LinhaLivro = namedtuple('LinhaLivro', [
+    'registro', 'id_usuario', 'ump', 'ano', 'mes', 'data', 'id_lancamento', 'tipo', 'descricao', 'valor', 'saldo'
+])
+TITULOS = ('Registro', 'ID UMP', 'UMP', 'Ano', 'Mês', 'Data', 'Cód.', 'Tipo', 'Descrição', 'Valor', 'Saldo final')
+
+ESQUEMA_PARQUET = pa.schema([
+    ('registro', pa.string()),
+    ('id_usuario', pa.int64()),
+    ('ump', pa.string()),
+    ('ano', pa.int32()),
+    ('mes', pa.int32()),
+    ('data', pa.date32()),
+    ('id_lancamento', pa.int64()),
+    ('tipo', pa.string()),
+    ('descricao', pa.string()),
+    ('valor', pa.float64()),
+    ('saldo', pa.float64()),
+])
+
+
+def _consulta_lancamentos(ids_usuarios, data_inicio, data_fim):
+    return select(
+        Lancamento.id, Lancamento.id_usuario, Lancamento.data, Lancamento.tipo, Lancamento.descricao, Lancamento.valor
+    ).where(
+        Lancamento.id_usuario.in_(ids_usuarios),
+        filtro_periodo(Lancamento.data, data_inicio, data_fim + timedelta(days=1))
+    )
+
+
+def contar_lancamentos(session, ids_usuarios, data_inicio, data_fim):
+    consulta = _consulta_lancamentos(ids_usuarios, data_inicio, data_fim).with_only_columns(func.count())
+    return session.execute(consulta).scalar()
+
+
+def gerar_linhas(session, ids_usuarios, data_inicio, data_fim):
+    """Linhas do livro-caixa em ordem (UMP, data, id), com o saldo final de cada mês após seus lançamentos.
+
+    Valores de despesa saem negativos, para que a soma da coluna seja o resultado do período.
+    """
+    ids_usuarios = list(ids_usuarios)
+    nomes = dict(session.query(Configuracao.id_usuario, Configuracao.ump_federacao).filter(
+        Configuracao.id_usuario.in_(ids_usuarios)
+    ))
+    saldos = session.query(SaldoFinal.id_usuario, SaldoFinal.ano, SaldoFinal.mes, SaldoFinal.saldo).filter(
+        SaldoFinal.id_usuario.in_(ids_usuarios),
+        tuple_(SaldoFinal.ano, SaldoFinal.mes) >= tuple_(data_inicio.year, data_inicio.month),
+        tuple_(SaldoFinal.ano, SaldoFinal.mes) <= tuple_(data_fim.year, data_fim.month)
+    ).order_by(SaldoFinal.id_usuario, SaldoFinal.ano, SaldoFinal.mes).all()
+
+    def linha_saldo(id_usuario, ano, mes, saldo):
+        return LinhaLivro(REGISTRO_SALDO, id_usuario, nomes.get(id_usuario, ""), ano, mes, None, None, None, None, None, saldo)
+
+    pendentes = iter(saldos)
+    proximo_saldo = next(pendentes, None)
+    consulta = _consulta_lancamentos(ids_usuarios, data_inicio, data_fim).order_by(
+        Lancamento.id_usuario, Lancamento.data, Lancamento.id
+    ).execution_options(yield_per=LOTE_LEITURA)
+    for id_lancamento, id_usuario, data, tipo, descricao, valor in session.execute(consulta):
+        chave = (id_usuario, data.year, data.month)
+        while proximo_saldo is not None and tuple(proximo_saldo[:3]) < chave:
+            yield linha_saldo(*proximo_saldo)
+            proximo_saldo = next(pendentes, None)
+        yield LinhaLivro(
+            REGISTRO_LANCAMENTO, id_usuario, nomes.get(id_usuario, ""), data.year, data.month, data,
+            id_lancamento, tipo, descricao, valor_com_sinal(tipo, valor), None
+        )
+    while proximo_saldo is not None:
+        yield linha_saldo(*proximo_saldo)
+        proximo_saldo = next(pendentes, None)
+
+
+def _numero_brl(valor):
+    return "" if valor is None else f"{valor:.2f}".replace('.', ',')
+
+
+def escrever_csv(linhas, destino):
+    # ';' e vírgula decimal, como o Excel em português espera; BOM para manter os acentos
+    texto = io.TextIOWrapper(destino, encoding='utf-8-sig', newline='')
+    escritor = csv.writer(texto, delimiter=';')
+    escritor.writerow(TITULOS)
+    for linha in linhas:
+        escritor.writerow([
+            linha.registro, linha.id_usuario, linha.ump, linha.ano, linha.mes,
+            linha.data.strftime("%d/%m/%Y") if linha.data else "", linha.id_lancamento or "",
+            linha.tipo or "", linha.descricao or "", _numero_brl(linha.valor), _numero_brl(linha.saldo)
+        ])
+    texto.flush()
+    texto.detach()
+
+
+def escrever_xlsx(linhas, destino):
+    planilha = Workbook(write_only=True)
+    aba = None
+    for indice, linha in enumerate(linhas):
+        if indice % LINHAS_POR_ABA == 0:
+            numero = indice // LINHAS_POR_ABA + 1
+            aba = planilha.create_sheet("Livro-caixa" if numero == 1 else f"Livro-caixa ({numero})")
+            aba.append(TITULOS)
+        aba.append(list(linha))
+    if aba is None:
+        planilha.create_sheet("Livro-caixa").append(TITULOS)
+    planilha.save(destino)
+
+
+def escrever_parquet(linhas, destino):
+    with pq.ParquetWriter(destino, ESQUEMA_PARQUET) as escritor:
+        lote = []
+        for linha in linhas:
+            lote.append(linha)
+            if len(lote) >= LOTE_ESCRITA:
+                escritor.write_table(_tabela_parquet(lote))
+                lote = []
+        if lote:
+            escritor.write_table(_tabela_parquet(lote))
+
+
+def _tabela_parquet(lote):
+    colunas = {campo: [getattr(linha, campo) for linha in lote] for campo in LinhaLivro._fields}
+    return pa.Table.from_pydict(colunas, schema=ESQUEMA_PARQUET)
+
+
+ESCRITORES = {
+    'csv': escrever_csv,
+    'xlsx': escrever_xlsx,
+    'parquet': escrever_parquet,
+}
+
+
+def exportar_livro_caixa(ids_usuarios, data_inicio, data_fim, formato, destino, progresso=None):
+    """Escreve o livro-caixa em `destino` (arquivo binário aberto) no formato pedido."""
+    with get_session() as session:
+        linhas = gerar_linhas(session, ids_usuarios, data_inicio, data_fim)
+        if progresso:
+            total = contar_lancamentos(session, ids_usuarios, data_inicio, data_fim) or 1
+
+            def acompanhar(linhas):
+                for indice, linha in enumerate(linhas, start=1):
+                    if indice % LOTE_LEITURA == 0:
+                        progresso(min(indice / total, 0.99))
+                    yield linha
+            linhas = acompanhar(linhas)
+        ESCRITORES[formato](linhas, destino)
+    if progresso:
+        progresso(1.0)
@@ -1,20 +1,40 @@
 import streamlit as st
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import extract
-from models import db, Usuario, Configuracao, Lancamento, SaldoFinal
+from models import Usuario, Configuracao, Lancamento, SaldoFinal
+from db_runtime import get_session, inicializar_banco
+from relatorio_dados import TIPOS_RECEITA, TIPOS_DESPESA, TIPOS_LANCAMENTO, resumo_anual
+from saldos import aplicar_delta_saldo, registrar_insercao, registrar_remocao, registrar_alteracao, recalcular_saldos
+from resumo_mensal import reconstruir_resumo
+from cache import marcar_alteracao, sincronizar_com_banco, ESCOPO_GLOBAL
+from monitor_sql import iniciar_coleta, finalizar_coleta
+from fila_email import provedor_configurado, iniciar_despachante
+from recuperacao_senha import redefinir_senha
+from metricas import iniciar_servidor, registrar_sessao, medir_pagina, UPLOAD_BYTES
+from perfil_paginas import ATIVO as PERFIL_ATIVO, perfilar_pagina, fase, ultimo_perfil, FASE_IMAGEM, FASE_EXPORTACAO, FASE_ESPERA
+from pastas import RELATORIOS_DIR, criar_pastas
+from imagens import gerar_derivados, caminho_impressao, imagem_para_exibicao
+from armazenamento import guardar_comprovante, liberar_comprovante
+from busca import buscar_por_descricao
+from explorador import FiltrosLancamentos, ORDENACOES, buscar_pagina
+from importacao import ler_csv, sugerir_colunas, extrair_csv, extrair_ofx, preparar_importacao, importar_lancamentos
+from previas_pdf import total_paginas, obter_previa, PAGINAS_POR_VEZ
+from conversao_comprovantes import (
+    ComprovanteInvalido, validar_tamanho, validar_pdf, validar_imagem, enviar_conversao, conversao_em_andamento,
+    retomar_conversoes_pendentes, STATUS_PROCESSANDO, STATUS_ERRO
+)
+from consultas import obter_configuracao, listar_lancamentos_mes, obter_saldo_final, obter_totais_ano, obter_indice_administradores
+from exportacao_jobs import (
+    enviar_exportacao, obter_job, TIPO_RELATORIO, TIPO_COMPROVANTES, TIPO_FEDERACAO, TIPO_LIVRO_CAIXA,
+    ESTADO_NA_FILA, ESTADO_EXECUTANDO, ESTADO_FALHOU
+)
+from livro_caixa import FORMATOS as FORMATOS_PLANILHA
 import os
 from datetime import datetime
 import locale
 from werkzeug.utils import secure_filename
-from pdf2image import convert_from_path
-from collections import defaultdict
-from fpdf import FPDF
-from PIL import Image
 import traceback
-import random
+import time
+import uuid
 import re
-import requests
 from dotenv import load_dotenv
 
 
@@ -25,40 +45,23 @@ def format_currency_brl(value, include_symbol=True):
 load_dotenv()
 
 # Configuração do banco
-DATABASE_URI = os.getenv("DATABASE_URL")
-if not DATABASE_URI:
+if not os.getenv("DATABASE_URL"):
     st.error("Erro: DATABASE_URL não definido nas variáveis de ambiente!")
     raise ValueError("DATABASE_URL não definido")
-if DATABASE_URI.startswith("postgres"):
-    DATABASE_URI = DATABASE_URI.replace("postgres://", "postgresql://")
-connect_args = {"connect_timeout": 10}  # Usado apenas para PostgreSQL
-
-# Exibir a URI para debug (sem a senha)
-st.write(f"Tentando conectar a: {DATABASE_URI.split('@')[0]}@...")
 
 try:
-    # Criar engine e tabelas
-    engine = create_engine(DATABASE_URI, pool_pre_ping=True, connect_args=connect_args)
-    db.Model.metadata.create_all(engine)
-    st.success("Conexão com o banco de dados e criação de tabelas bem-sucedida!")
-    
-    Session = sessionmaker(bind=engine)
-    
-    def get_session():
-        return Session()
-    
-    session = get_session()
+    # Engine, pool e esquema são preparados uma única vez por processo
+    inicializar_banco()
 except Exception as e:
     st.error(f"Erro ao conectar ao banco de dados: {str(e)}")
     raise
 
 # Configuração de uploads e relatorios
-UPLOAD_FOLDER = 'uploads/'
-RELATORIOS_DIR = 'relatorios/'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'pdf'}
-for folder in [UPLOAD_FOLDER, RELATORIOS_DIR]:
-    if not os.path.exists(folder):
-        os.makedirs(folder)
+criar_pastas()
+retomar_conversoes_pendentes()
+iniciar_servidor()
+iniciar_despachante()
 
 # Estado da sessão
 if 'logged_in' not in st.session_state:
@@ -70,12 +73,45 @@ if 'user_id' not in st.session_state:
 if 'edit_lancamento_id' not in st.session_state:
     st.session_state['edit_lancamento_id'] = None
 if 'recuperar_senha' not in st.session_state:
-    st.session_state['recuperar_senha'] = False    
+    st.session_state['recuperar_senha'] = False
+if 'exportacoes' not in st.session_state:
+    st.session_state['exportacoes'] = {}
+if 'previas' not in st.session_state:
+    st.session_state['previas'] = {}
+if 'explorador' not in st.session_state:
+    st.session_state['explorador'] = {'consulta': None, 'cursores': [None]}    
+if 'importacao_arquivo' not in st.session_state:
+    st.session_state['importacao_arquivo'] = 0
+if 'id_sessao' not in st.session_state:
+    st.session_state['id_sessao'] = uuid.uuid4().hex
+registrar_sessao(st.session_state['id_sessao'], st.session_state['logged_in'])
+sincronizar_com_banco(get_session)  # alterações feitas pelo manutencao.py
 
 # Funções auxiliares
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def salvar_comprovante(session, comprovante):
+    """Guarda o arquivo enviado no armazenamento por conteúdo e devolve (caminho, hash, status).
+
+    A referência ao arquivo entra na transação de `session` (sem commit, o
+    arquivo é descartado). Imagens já saem com cópia de impressão e miniatura;
+    PDFs ficam com status 'processando' e são convertidos em segundo plano
+    depois do commit.
+    """
+    validar_tamanho(comprovante.size)
+    extensao = os.path.splitext(secure_filename(comprovante.name))[1].lower()
+    UPLOAD_BYTES.labels(extensao).observe(comprovante.size)
+    comprovante.seek(0)
+    with fase(FASE_IMAGEM):
+        if extensao == '.pdf':
+            digest, file_path, _ = guardar_comprovante(session, comprovante, extensao, validar=validar_pdf)
+            return file_path, digest, STATUS_PROCESSANDO
+        digest, file_path, _ = guardar_comprovante(session, comprovante, extensao, validar=validar_imagem)
+        if not os.path.exists(caminho_impressao(file_path)):
+            gerar_derivados(file_path)
+    return file_path, digest, None
+
 def verificar_email_existente(email, id_usuario):
     with get_session() as session:
         config_existente = session.query(Configuracao).filter_by(email=email).first()
@@ -84,77 +120,24 @@ def verificar_email_existente(email, id_usuario):
         return False
 
 def carregar_administradores():
-    with get_session() as session:
-        administradores = defaultdict(list)
-        registros = session.query(Configuracao).all()
-        for registro in registros:
-            if registro.admin:
-                administradores[registro.admin].append((registro.id_usuario, registro.ump_federacao))
-        return {admin: usuarios for admin, usuarios in administradores.items()}
+    # Índice admin -> UMPs em cache no processo; invalidado ao cadastrar usuário ou renomear UMP
+    return obter_indice_administradores()
 
 def get_usuarios_autorizados():
-    with get_session() as session:
-        administradores = carregar_administradores()
-        return administradores.get(st.session_state['user_id'], [])
+    return carregar_administradores().get(st.session_state['user_id'], ())
 
 def obter_saldo_inicial(mes, ano):
-    with get_session() as session:
-        ano_vigente = session.query(Configuracao.ano_vigente).filter_by(id_usuario=st.session_state['user_id']).scalar()
-        if not ano_vigente:
-            return 0
-        if ano != ano_vigente:
-            ano = ano_vigente
-    
-        if mes == 1:
-            saldo_inicial = session.query(Configuracao.saldo_inicial).filter_by(id_usuario=st.session_state['user_id']).scalar()
-            return saldo_inicial if saldo_inicial is not None else 0
-    
-        saldo_anterior = session.query(SaldoFinal.saldo).filter_by(
-            mes=mes - 1,
-            ano=ano,
-            id_usuario=st.session_state['user_id']
-        ).scalar()
-        return saldo_anterior if saldo_anterior is not None else 0
+    config = obter_configuracao(st.session_state['user_id'])
+    if not config or not config.ano_vigente:
+        return 0
+    if ano != config.ano_vigente:
+        ano = config.ano_vigente
 
-def calcular_saldo_final(mes, ano, saldo_inicial):
-    with get_session() as session:
-        entradas = session.query(db.func.sum(Lancamento.valor)).filter(
-            (Lancamento.tipo == 'Outras Receitas') | (Lancamento.tipo == 'ACI Recebida'),
-            extract('month', Lancamento.data) == mes,
-            extract('year', Lancamento.data) == ano,
-            Lancamento.id_usuario == st.session_state['user_id']
-        ).scalar() or 0
-    
-        saidas = session.query(db.func.sum(Lancamento.valor)).filter(
-            (Lancamento.tipo == 'Outras Despesas') | (Lancamento.tipo == 'ACI Enviada'),
-            extract('month', Lancamento.data) == mes,
-            extract('year', Lancamento.data) == ano,
-            Lancamento.id_usuario == st.session_state['user_id']
-        ).scalar() or 0
-    
-        saldo_final = saldo_inicial + entradas - saidas
-        return saldo_final
+    if mes == 1:
+        return config.saldo_inicial if config.saldo_inicial is not None else 0
 
-def salvar_saldo_final(mes, ano, saldo_inicial):
-    with get_session() as session:
-        saldo_final = calcular_saldo_final(mes, ano, saldo_inicial)
-        saldo_existente = session.query(SaldoFinal).filter(
-            SaldoFinal.mes == mes,
-            SaldoFinal.ano == ano,
-            SaldoFinal.id_usuario == st.session_state['user_id']
-        ).first()
-    
-        if saldo_existente:
-            saldo_existente.saldo = saldo_final
-        else:
-            saldo_novo = SaldoFinal(
-                mes=mes,
-                ano=ano,
-                saldo=saldo_final,
-                id_usuario=st.session_state['user_id']
-            )
-            session.add(saldo_novo)
-        session.commit()
+    saldo_anterior = obter_saldo_final(st.session_state['user_id'], ano, mes - 1)
+    return saldo_anterior if saldo_anterior is not None else 0
 
 def atualizar_saldos_iniciais():
     with get_session() as session:
@@ -182,412 +165,27 @@ def atualizar_saldos_iniciais():
                 session.add(saldo_novo)
         session.commit()
 
+def mover_saldos_para_ano(session, id_usuario, ano):
+    # Mantém uma única linha por mês (índice único em id_usuario, ano, mes),
+    # preferindo as que já estão no ano de destino
+    saldos = session.query(SaldoFinal).filter_by(id_usuario=id_usuario).all()
+    mantidos = {}
+    for saldo in sorted(saldos, key=lambda s: (s.ano != ano, -s.id)):
+        if saldo.mes in mantidos:
+            session.delete(saldo)
+        else:
+            mantidos[saldo.mes] = saldo
+    session.flush()
+    for saldo in mantidos.values():
+        saldo.ano = ano
+
 def recalcular_saldos_finais():
+    """Reparo explícito: reconstrói o resumo mensal e os saldos do ano vigente do usuário."""
     with get_session() as session:
-        meses_anos = session.query(SaldoFinal.mes, SaldoFinal.ano).filter(
-            SaldoFinal.id_usuario == st.session_state['user_id']
-        ).distinct().all()
-    
-        for mes, ano in meses_anos:
-            saldo_inicial = obter_saldo_inicial(mes, ano)
-            saldo_final = calcular_saldo_final(mes, ano, saldo_inicial)
-            saldo_existente = session.query(SaldoFinal).filter(
-                SaldoFinal.mes == mes,
-                SaldoFinal.ano == ano,
-                SaldoFinal.id_usuario == st.session_state['user_id']
-            ).first()
-    
-            if saldo_existente:
-                saldo_existente.saldo = saldo_final
-            else:
-                saldo_novo = SaldoFinal(
-                    mes=mes,
-                    ano=ano,
-                    saldo=saldo_final,
-                    id_usuario=st.session_state['user_id']
-                )
-                session.add(saldo_novo)
+        reconstruir_resumo(session, st.session_state['user_id'])
+        recalcular_saldos(session, st.session_state['user_id'])
         session.commit()
 
-def dados_relatorio(mes=None):
-    with get_session() as session:
-        dados = []
-        saldo_anterior = 0
-    
-        configuracao = session.query(Configuracao).filter_by(id_usuario=st.session_state['user_id']).first()
-        ano_vigente = configuracao.ano_vigente if configuracao else datetime.now().year
-    
-        outras_receitas = float(session.query(db.func.sum(Lancamento.valor)).filter(
-            Lancamento.tipo == 'Outras Receitas',
-            extract('year', Lancamento.data) == ano_vigente,
-            Lancamento.id_usuario == st.session_state['user_id']
-        ).scalar() or 0)
-    
-        aci_recebida = float(session.query(db.func.sum(Lancamento.valor)).filter(
-            Lancamento.tipo == 'ACI Recebida',
-            extract('year', Lancamento.data) == ano_vigente,
-            Lancamento.id_usuario == st.session_state['user_id']
-        ).scalar() or 0)
-    
-        outras_despesas = float(session.query(db.func.sum(Lancamento.valor)).filter(
-            Lancamento.tipo == 'Outras Despesas',
-            extract('year', Lancamento.data) == ano_vigente,
-            Lancamento.id_usuario == st.session_state['user_id']
-        ).scalar() or 0)
-    
-        aci_enviada = float(session.query(db.func.sum(Lancamento.valor)).filter(
-            Lancamento.tipo == 'ACI Enviada',
-            extract('year', Lancamento.data) == ano_vigente,
-            Lancamento.id_usuario == st.session_state['user_id']
-        ).scalar() or 0)
-    
-        total_receitas = outras_receitas + aci_recebida
-        total_despesas = outras_despesas + aci_enviada
-        saldo_final_ano = (configuracao.saldo_inicial or 0) + total_receitas - total_despesas if configuracao else total_receitas - total_despesas
-    
-        meses = range(1, 13) if mes is None else [mes]
-    
-        for mes_atual in meses:
-            saldo_inicial = saldo_anterior if mes_atual > 1 else float(configuracao.saldo_inicial or 0) if configuracao else 0
-    
-            entradas = float(session.query(db.func.sum(Lancamento.valor)).filter(
-                Lancamento.tipo.in_(['Outras Receitas', 'ACI Recebida']),
-                extract('month', Lancamento.data) == mes_atual,
-                extract('year', Lancamento.data) == ano_vigente,
-                Lancamento.id_usuario == st.session_state['user_id']
-            ).scalar() or 0)
-    
-            saidas = float(session.query(db.func.sum(Lancamento.valor)).filter(
-                Lancamento.tipo.in_(['Outras Despesas', 'ACI Enviada']),
-                extract('month', Lancamento.data) == mes_atual,
-                extract('year', Lancamento.data) == ano_vigente,
-                Lancamento.id_usuario == st.session_state['user_id']
-            ).scalar() or 0)
-    
-            saldo_final = saldo_inicial + entradas - saidas
-            saldo_anterior = saldo_final
-    
-            lancamentos = session.query(Lancamento).filter(
-                extract('month', Lancamento.data) == mes_atual,
-                extract('year', Lancamento.data) == ano_vigente,
-                Lancamento.id_usuario == st.session_state['user_id']
-            ).all()
-    
-            dados.append({
-                'mes': mes_atual,
-                'saldo_inicial': saldo_inicial,
-                'entradas': entradas,
-                'saidas': saidas,
-                'saldo_final': saldo_final,
-                'saldo_final_ano': saldo_final_ano,
-                'lancamentos': lancamentos,
-                'configuracao': configuracao,
-                'outras_receitas': outras_receitas,
-                'aci_recebida': aci_recebida,
-                'outras_despesas': outras_despesas,
-                'aci_enviada': aci_enviada,
-                'total_receitas': total_receitas,
-                'total_despesas': total_despesas,
-                'ano_vigente': ano_vigente
-            })
-    
-        return dados
-
-def buscar_lancamentos(ano=None, mes=None):
-    with get_session() as session:
-        """Retorna os lançamentos filtrados por ano, mês e usuário logado."""
-        query = session.query(Lancamento)
-        query = query.filter(Lancamento.id_usuario == st.session_state['user_id'])
-    
-        if ano:
-            query = query.filter(extract('year', Lancamento.data) == ano)
-        if mes:
-            query = query.filter(extract('month', Lancamento.data) == mes)
-    
-        return query.all()
-
-def exportar_relatorio(mes=None):
-    with get_session() as session:
-        dados = dados_relatorio(mes)
-        ano = dados[0]['ano_vigente'] if dados else datetime.now().year
-    
-        class PDFWithFooter(FPDF):
-            def footer(self):
-                self.set_y(-15)
-                self.set_font("Arial", size=8)
-                self.set_text_color(128, 128, 128)  # Cinza
-                self.cell(0, 10, "Desenvolvido por Miquéias Teles | © 2025 Todos os direitos reservados", 0, 0, 'C')
-    
-        pdf = PDFWithFooter()
-        pdf.set_auto_page_break(auto=True, margin=15)
-        pdf.add_page()
-        pdf.set_font("Arial", size=12)
-    
-        dados_config = dados[0].get('configuracao', {}) if dados else {}
-    
-        logo_path = os.path.join('static', "Logos/Marca_UMP 02.png")
-        try:
-            pdf.image(logo_path, x=80, y=8, w=50)
-        except:
-            pass
-    
-        pdf.ln(18)
-    
-        pdf.set_text_color(28, 30, 62)
-        pdf.set_font("Arial", style='B', size=14)
-        pdf.cell(190, 10, txt=f"RELATÓRIO FINANCEIRO {ano}{f' - Mês {mes}' if mes else ''}", ln=True, align='C')
-        pdf.ln(0)
-    
-        pdf.set_font("Arial", style='B', size=12)
-        campo = f"{dados_config.ump_federacao if hasattr(dados_config, 'ump_federacao') else 'Não definido'} - {dados_config.federacao_sinodo if hasattr(dados_config, 'federacao_sinodo') else 'Não definido'}"
-        pdf.cell(190, 10, campo, ln=True, align='C')
-        pdf.ln(10)
-    
-        pdf.set_text_color(255, 255, 255)
-        pdf.set_font("Arial", style='B', size=14)
-        pdf.set_fill_color(28, 30, 62)
-        pdf.cell(190, 8, txt="Informações de Cabeçalho", ln=True, align='C', fill=True)
-        pdf.ln(5)
-    
-        largura_campo = 95
-        largura_valor = 95
-        altura_celula = 8
-    
-        pdf.set_text_color(28, 30, 62)
-        pdf.set_font("Arial", style='B', size=11)
-        pdf.set_fill_color(201, 203, 231)
-        pdf.cell(largura_campo, altura_celula, "Campos", border=1, align='C', fill=True)
-        pdf.cell(largura_valor, altura_celula, "Informações", border=1, align='C', fill=True)
-        pdf.ln()
-    
-        pdf.set_text_color(0, 0, 0)
-        pdf.set_font("Arial", size=11)
-        campos = [
-            ("UMP/Federação:", dados_config.ump_federacao if hasattr(dados_config, 'ump_federacao') else "Não definido"),
-            ("Federação/Sínodo:", dados_config.federacao_sinodo if hasattr(dados_config, 'federacao_sinodo') else "Não definido"),
-            ("Ano Vigente:", str(dados_config.ano_vigente if hasattr(dados_config, 'ano_vigente') else "Não definido")),
-            ("Sócios Ativos:", str(dados_config.socios_ativos if hasattr(dados_config, 'socios_ativos') else "Não definido")),
-            ("Sócios Cooperadores:", str(dados_config.socios_cooperadores if hasattr(dados_config, 'socios_cooperadores') else "Não definido")),
-            ("Tesoureiro Responsável:", dados_config.tesoureiro_responsavel if hasattr(dados_config, 'tesoureiro_responsavel') else "Não definido"),
-        ]
-    
-        for campo, valor in campos:
-            pdf.cell(largura_campo, altura_celula, campo, border=1)
-            pdf.cell(largura_valor, altura_celula, valor, border=1)
-            pdf.ln()
-    
-        pdf.ln(5)
-    
-        pdf.set_text_color(255, 255, 255)
-        pdf.set_font("Arial", style='B', size=14)
-        pdf.set_fill_color(28, 30, 62)
-        pdf.cell(190, 8, txt="Resumo Financeiro", ln=True, align='C', fill=True)
-        pdf.ln(5)
-    
-        resumo = dados[0] if dados else {}
-    
-        pdf.set_text_color(28, 30, 62)
-        pdf.set_font("Arial", style='B', size=11)
-        pdf.set_fill_color(201, 203, 231)
-        pdf.cell(largura_campo, altura_celula, "Receitas", border=1, align='C', fill=True)
-        pdf.cell(largura_valor, altura_celula, "Despesas", border=1, align='C', fill=True)
-        pdf.ln()
-    
-        pdf.set_text_color(0, 0, 0)
-        pdf.set_font("Arial", size=11)
-        resumo_financeiro = [
-            (f"Outras Receitas: R$ {locale.format_string('%.2f', resumo.get('outras_receitas', 0.00), grouping=True)}",
-             f"Outras Despesas: R$ {locale.format_string('%.2f', resumo.get('outras_despesas', 0.00), grouping=True)}"),
-            (f"ACI Recebida: R$ {locale.format_string('%.2f', resumo.get('aci_recebida', 0.00), grouping=True)}",
-             f"ACI Enviada: R$ {locale.format_string('%.2f', resumo.get('aci_enviada', 0.00), grouping=True)}")
-        ]
-    
-        for receita, despesa in resumo_financeiro:
-            pdf.cell(largura_campo, altura_celula, receita, border=1)
-            pdf.cell(largura_valor, altura_celula, despesa, border=1)
-            pdf.ln()
-    
-        pdf.ln(5)
-    
-        pdf.set_font("Arial", style='B', size=12)
-        pdf.set_fill_color(200, 200, 200)
-        pdf.cell(largura_campo, 10, f"Total de Receitas: R$ {locale.format_string('%.2f', resumo.get('total_receitas', 0.00), grouping=True)}", border=1, fill=True)
-        pdf.cell(largura_valor, 10, f"Total de Despesas: R$ {locale.format_string('%.2f', resumo.get('total_despesas', 0.00), grouping=True)}", border=1, fill=True)
-        pdf.ln(10)
-    
-        pdf.ln(20)
-        pdf.set_font("Arial", size=12)
-        assinatura_texto = "Assinatura do Tesoureiro"
-        largura_assinatura = pdf.get_string_width(assinatura_texto) + 10
-        pdf.set_x((pdf.w - largura_assinatura) / 2)
-        pdf.cell(largura_assinatura, 10, assinatura_texto, align='C')
-        pdf.line((pdf.w - largura_assinatura) / 2, pdf.get_y() + 3, (pdf.w + largura_assinatura) / 2, pdf.get_y() + 3)
-        pdf.ln(20)
-    
-        assinatura_texto = "Assinatura do Presidente"
-        largura_assinatura = pdf.get_string_width(assinatura_texto) + 10
-        pdf.set_x((pdf.w - largura_assinatura) / 2)
-        pdf.cell(largura_assinatura, 10, assinatura_texto, align='C')
-        pdf.line((pdf.w - largura_assinatura) / 2, pdf.get_y() + 3, (pdf.w + largura_assinatura) / 2, pdf.get_y() + 3)
-        pdf.ln(30)
-    
-        pdf.set_font("Arial", size=10)
-        campo = f"{dados_config.ump_federacao if hasattr(dados_config, 'ump_federacao') else 'Não definido'} - {dados_config.federacao_sinodo if hasattr(dados_config, 'federacao_sinodo') else 'Não definido'}"
-        pdf.cell(190, 10, campo, ln=True, align='C')
-        pdf.ln(0)
-        pdf.set_font("Arial", size=9)
-        pdf.cell(190, 10, txt="''Alegres na Esperança, Fortes na Fé, Dedicados no Amor, Unidos no Trabalho''", ln=True, align='C')
-        pdf.ln(10)
-    
-        meses = {
-            1: "Janeiro", 2: "Fevereiro", 3: "Março", 4: "Abril", 5: "Maio", 6: "Junho",
-            7: "Julho", 8: "Agosto", 9: "Setembro", 10: "Outubro", 11: "Novembro", 12: "Dezembro"
-        }
-    
-        for d in dados:
-            mes_nome = meses.get(d['mes'], f"Mês {d['mes']}")
-            pdf.set_text_color(28, 30, 62)
-            pdf.set_font("Arial", style='B', size=12)
-            pdf.cell(190, 10, txt=f"Mês {d['mes']} - {mes_nome} {ano}", ln=True, align='C')
-            pdf.ln(5)
-    
-            pdf.set_text_color(255, 255, 255)
-            pdf.set_font("Arial", style='B', size=10)
-            pdf.set_fill_color(28, 30, 62)
-            pdf.cell(55, 10, "Saldo Inicial", border=1, align='C', fill=True)
-            pdf.cell(40, 10, "Entradas", border=1, align='C', fill=True)
-            pdf.cell(40, 10, "Saídas", border=1, align='C', fill=True)
-            pdf.cell(55, 10, "Saldo Final", border=1, align='C', fill=True)
-            pdf.ln()
-    
-            pdf.set_text_color(28, 30, 62)
-            pdf.set_font("Arial", size=11)
-            pdf.cell(55, 10, f"R$ {locale.format_string('%.2f', d['saldo_inicial'], grouping=True)}", border=1, align='C')
-            pdf.cell(40, 10, f"R$ {locale.format_string('%.2f', d['entradas'], grouping=True)}", border=1, align='C')
-            pdf.cell(40, 10, f"R$ {locale.format_string('%.2f', d['saidas'], grouping=True)}", border=1, align='C')
-            pdf.cell(55, 10, f"R$ {locale.format_string('%.2f', d['saldo_final'], grouping=True)}", border=1, align='C')
-            pdf.ln(15)
-    
-            pdf.set_font("Arial", style='B', size=10)
-            pdf.set_fill_color(200, 200, 200)
-            pdf.cell(35, 10, "Data", border=1, align='C', fill=True)
-            pdf.cell(35, 10, "Tipo", border=1, align='C', fill=True)
-            pdf.cell(65, 10, "Descrição", border=1, align='C', fill=True)
-            pdf.cell(35, 10, "Valor", border=1, align='C', fill=True)
-            pdf.cell(20, 10, "Cód.", border=1, align='C', fill=True)
-            pdf.ln()
-    
-            pdf.set_font("Arial", size=10)
-            for lanc in d['lancamentos']:
-                pdf.cell(35, 10, txt=lanc.data.strftime('%d/%m/%Y'), border=1, align='C')
-                pdf.cell(35, 10, txt=lanc.tipo, border=1, align='C')
-                pdf.cell(65, 10, txt=lanc.descricao, border=1, align='C')
-                pdf.cell(35, 10, txt=f"R$ {locale.format_string('%.2f', lanc.valor, grouping=True)}", border=1, align='C')
-                pdf.cell(20, 10, txt=str(lanc.id), border=1, align='C')
-                pdf.ln()
-    
-            pdf.ln(5)
-    
-        pdf_file = f"relatorio_{ano}_id_usuario_{st.session_state['user_id']}.pdf"
-        pdf_path = os.path.join(RELATORIOS_DIR, pdf_file)
-        pdf.output(pdf_path)
-        return pdf_path
-
-def exportar_comprovantes(ano=None, mes=None):
-    with get_session() as session:
-        dados = dados_relatorio(mes) if mes else dados_relatorio()
-        ano = dados[0]['ano_vigente'] if dados else datetime.now().year
-        dados_config = dados[0].get('configuracao', {}) if dados else {}
-        lancamentos = buscar_lancamentos(ano, mes)
-    
-        class PDFWithFooter(FPDF):
-            def footer(self):
-                self.set_y(-15)
-                self.set_font("Arial", size=8)
-                self.set_text_color(128, 128, 128)  # Cinza
-                self.cell(0, 10, "Desenvolvido por Miquéias Teles | © 2025 Todos os direitos reservados", 0, 0, 'C')
-    
-        pdf = PDFWithFooter()
-        pdf.set_auto_page_break(auto=True, margin=15)
-        pdf.add_page()
-        pdf.set_font("Arial", size=12)
-    
-        pdf.set_text_color(28, 30, 62)
-        pdf.set_font("Arial", style='B', size=14)
-        pdf.cell(190, 10, f"RELATÓRIO DE COMPROVANTES - {ano if ano else 'Todos'}{f' Mês {mes}' if mes else ''}", ln=True, align='C')
-        pdf.ln(0)
-    
-        pdf.set_font("Arial", style='B', size=12)
-        campo = f"{dados_config.ump_federacao if hasattr(dados_config, 'ump_federacao') else 'Não definido'} - {dados_config.federacao_sinodo if hasattr(dados_config, 'federacao_sinodo') else 'Não definido'}"
-        pdf.cell(190, 10, campo, ln=True, align='C')
-        pdf.ln(10)
-    
-        pdf.set_text_color(255, 255, 255)
-        pdf.set_font("Arial", style='B', size=14)
-        pdf.set_fill_color(28, 30, 62)
-        pdf.cell(190, 8, txt="Relação de Comprovantes", ln=True, align='C', fill=True)
-        pdf.ln(5)
-    
-        pdf.set_text_color(28, 30, 62)
-        pdf.set_font("Arial", style='B', size=10)
-        pdf.cell(15, 10, "Cód.", border=1, align='C')
-        pdf.cell(30, 10, "Data", border=1, align='C')
-        pdf.cell(80, 10, "Descrição", border=1, align='C')
-        pdf.cell(30, 10, "Valor", border=1, align='C')
-        pdf.cell(35, 10, "Comprovante", border=1, align='C')
-        pdf.ln()
-    
-        pdf.set_font("Arial", size=10)
-        for lanc in lancamentos:
-            pdf.cell(15, 10, str(lanc.id), border=1, align='C')
-            pdf.cell(30, 10, txt=lanc.data.strftime('%d/%m/%Y'), border=1, align='C')
-            pdf.cell(80, 10, lanc.descricao, border=1, align='L')
-            pdf.cell(30, 10, f"R$ {locale.format_string('%.2f', lanc.valor, grouping=True)}", border=1, align='C')
-            pdf.cell(35, 10, "Anexado" if lanc.comprovante else "Não anexado", border=1, align='C')
-            pdf.ln()
-    
-        pdf.ln(10)
-    
-        for lanc in lancamentos:
-            if lanc.comprovante:
-                comprovante_path = lanc.comprovante if lanc.comprovante.startswith(UPLOAD_FOLDER) else os.path.join(UPLOAD_FOLDER, lanc.comprovante)
-    
-                if os.path.exists(comprovante_path):
-                    file_extension = comprovante_path.lower().split('.')[-1]
-                    if file_extension in ['jpg', 'jpeg', 'png']:
-                        try:
-                            pdf.add_page()
-                            pdf.set_font("Arial", style='B', size=12)
-                            pdf.cell(190, 10, f"Comprovante - Cód. {lanc.id}", ln=True, align='C')
-                            pdf.ln(5)
-    
-                            image = Image.open(comprovante_path)
-                            img_width, img_height = image.size
-    
-                            max_width = 190
-                            max_height = 250
-                            ratio = min(max_width / img_width, max_height / img_height)
-                            new_width = img_width * ratio
-                            new_height = img_height * ratio
-    
-                            pdf.image(comprovante_path, x=10, y=30, w=new_width, h=new_height)
-    
-                        except Exception as e:
-                            pdf.cell(190, 10, f"Erro ao carregar imagem: {str(e)}", ln=True, align='C')
-                    else:
-                        pdf.add_page()
-                        pdf.set_font("Arial", style='B', size=12)
-                        pdf.cell(190, 10, f"Comprovante - ID {lanc.id} (Formato de arquivo não suportado)", ln=True, align='C')
-                else:
-                    pdf.add_page()
-                    pdf.set_font("Arial", style='B', size=12)
-                    pdf.cell(190, 10, f"Comprovante - ID {lanc.id} (Arquivo não encontrado)", ln=True, align='C')
-    
-        pdf_file = f"comprovantes_{ano}_id_usuario_{st.session_state['user_id']}.pdf"
-        pdf_path = os.path.join(RELATORIOS_DIR, pdf_file)
-        pdf.output(pdf_path)
-        return pdf_path
-
 # Funções de recuperação de senha
 def verificar_email_no_banco(email):
     with get_session() as session:
@@ -596,14 +194,10 @@ def verificar_email_no_banco(email):
             return user.id_usuario
         return None
 
-def gerar_senha_aleatoria():
-    return str(random.randint(100000, 999999))  # Gera uma senha numérica de 6 dígitos
-
-def atualizar_senha_no_banco(user_id, nova_senha):
+def atualizar_senha_no_banco(user_id, email_destinatario):
+    """Gera a nova senha e enfileira o e-mail com ela na mesma transação."""
     with get_session() as session:
-        usuario = session.query(Usuario).filter_by(id=user_id).first()
-        if usuario:
-            usuario.senha = nova_senha
+        if redefinir_senha(session, user_id, email_destinatario):
             session.commit()
             return True
         return False
@@ -613,39 +207,6 @@ def validar_email(email):
         email_regex = r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$'
         return re.match(email_regex, email) is not None
 
-def enviar_email_sendinblue(email_destinatario, nova_senha):
-    with get_session() as session:
-        api_key = os.getenv("SENDINBLUE_API_KEY")
-        if not api_key:
-            st.error("Erro: Chave da API Sendinblue não configurada. Defina a variável de ambiente SENDINBLUE_API_KEY.")
-            return False
-        
-        url = "https://api.sendinblue.com/v3/smtp/email"
-        
-        headers = {
-            "api-key": api_key,
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "sender": {"email": "suporteumpfinanceiro@gmail.com"},
-            "to": [{"email": email_destinatario}],
-            "subject": "Recuperação de Senha",
-            "textContent": f"Olá!\n\nSua nova senha é: {nova_senha}\n\nEste é um e-mail automático. Por favor, não responda a esta mensagem."
-        }
-    
-        try:
-            resposta = requests.post(url, json=data, headers=headers)
-            if resposta.status_code in [200, 201]:
-                st.success("E-mail enviado com sucesso!")
-                return True
-            else:
-                st.error(f"Erro ao enviar o e-mail: {resposta.status_code} - {resposta.text}")
-                return False
-        except Exception as e:
-            st.error(f"Erro ao tentar enviar o e-mail: {str(e)}")
-            return False
-
 def recuperar_senha_page():
     with get_session() as session:
         st.title("Recuperar Senha")
@@ -661,17 +222,15 @@ def recuperar_senha_page():
                     st.error("Formato de e-mail inválido.")
                 else:
                     user_id = verificar_email_no_banco(email)
-                    if user_id:
-                        nova_senha = gerar_senha_aleatoria()
-                        if atualizar_senha_no_banco(user_id, nova_senha):
-                            if enviar_email_sendinblue(email, nova_senha):
-                                st.success("Uma nova senha foi enviada para o seu e-mail. Verifique sua caixa de entrada (ou spam).")
-                            else:
-                                st.error("Falha ao enviar o e-mail. Tente novamente mais tarde.")
+                    if not user_id:
+                        st.error("E-mail não encontrado no sistema.")
+                    elif not provedor_configurado():
+                        st.error("Erro: Chave da API Sendinblue não configurada. Defina a variável de ambiente SENDINBLUE_API_KEY.")
+                    else:
+                        if atualizar_senha_no_banco(user_id, email):
+                            st.success("Uma nova senha foi gerada e será enviada para o seu e-mail em instantes. Verifique sua caixa de entrada (ou spam).")
                         else:
                             st.error("Erro ao atualizar a senha no banco de dados.")
-                    else:
-                        st.error("E-mail não encontrado no sistema.")
         
         if st.button("Voltar ao Login"):
             st.session_state['recuperar_senha'] = False
@@ -711,9 +270,31 @@ def logout():
         st.session_state['edit_lancamento_id'] = None
         st.session_state['selected_page'] = None
         st.session_state['recuperar_senha'] = False  # Reseta o estado de recuperação
+        st.session_state['exportacoes'] = {}
+        st.session_state['previas'] = {}
+        st.session_state['explorador'] = {'consulta': None, 'cursores': [None]}
         st.success("Logout realizado!")
         st.rerun()
 
+def carregar_dashboard(session, id_usuario):
+    # Configuração inicial
+    config = obter_configuracao(id_usuario)
+    if not config:
+        session.add(Configuracao(
+            ump_federacao="UMP Local",
+            federacao_sinodo="Sinodal Exemplo",
+            ano_vigente=2025,
+            saldo_inicial=0,
+            id_usuario=id_usuario
+        ))
+        marcar_alteracao(session, id_usuario)
+        session.commit()
+        config = obter_configuracao(id_usuario)
+
+    # Cálculos financeiros: totais do usuário no ano vigente, em cache por (usuário, ano)
+    resumo = resumo_anual(obter_totais_ano(id_usuario, config.ano_vigente))
+    return config, resumo
+
 def index_page():
     with get_session() as session:
         # Injetar CSS personalizado para melhorar a aparência
@@ -762,24 +343,11 @@ def index_page():
         # Título estilizado
         st.markdown(f"<div class='title'>Bem-vindo, {st.session_state['current_user']}!</div>", unsafe_allow_html=True)
     
-        # Configuração inicial
-        config = session.query(Configuracao).filter_by(id_usuario=st.session_state['user_id']).first()
-        if not config:
-            config = Configuracao(
-                ump_federacao="UMP Local",
-                federacao_sinodo="Sinodal Exemplo",
-                ano_vigente=2025,
-                saldo_inicial=0,
-                id_usuario=st.session_state['user_id']
-            )
-            session.add(config)
-            session.commit()
-    
-        # Cálculos financeiros
-        outras_receitas = session.query(db.func.sum(Lancamento.valor)).filter(Lancamento.tipo == "Outras Receitas").scalar() or 0
-        aci_recebida = session.query(db.func.sum(Lancamento.valor)).filter(Lancamento.tipo == "ACI Recebida").scalar() or 0
-        outras_despesas = session.query(db.func.sum(Lancamento.valor)).filter(Lancamento.tipo == "Outras Despesas").scalar() or 0
-        aci_enviada = session.query(db.func.sum(Lancamento.valor)).filter(Lancamento.tipo == "ACI Enviada").scalar() or 0
+        config, resumo = carregar_dashboard(session, st.session_state['user_id'])
+        outras_receitas = resumo['Outras Receitas']
+        aci_recebida = resumo['ACI Recebida']
+        outras_despesas = resumo['Outras Despesas']
+        aci_enviada = resumo['ACI Enviada']
     
         receitas = outras_receitas + aci_recebida
         despesas = outras_despesas + aci_enviada
@@ -853,11 +421,12 @@ def configuracoes_page():
     with get_session() as session:
         st.title("Configurações")
         
-        config = session.query(Configuracao).filter_by(id_usuario=st.session_state['user_id']).first()
+        config = obter_configuracao(st.session_state['user_id'])
         if not config:
-            config = Configuracao(id_usuario=st.session_state['user_id'])
-            session.add(config)
+            session.add(Configuracao(id_usuario=st.session_state['user_id']))
+            marcar_alteracao(session, st.session_state['user_id'])
             session.commit()
+            config = obter_configuracao(st.session_state['user_id'])
     
         with st.form(key='config_form'):
             ump_federacao = st.text_input("UMP Federação", value=config.ump_federacao or "UMP Local")
@@ -878,6 +447,10 @@ def configuracoes_page():
                 if verificar_email_existente(email, st.session_state['user_id']):
                     st.error("Este e-mail já está cadastrado.")
                 else:
+                    config = session.query(Configuracao).filter_by(id_usuario=st.session_state['user_id']).first()
+                    ano_anterior = config.ano_vigente
+                    if config.ump_federacao != ump_federacao:
+                        marcar_alteracao(session, ESCOPO_GLOBAL)  # nome exibido no índice de administradores
                     config.ump_federacao = ump_federacao
                     config.federacao_sinodo = federacao_sinodo
                     config.ano_vigente = int(ano_vigente)
@@ -890,33 +463,97 @@ def configuracoes_page():
                         saldo_inicial_float = float(saldo_inicial.replace('.', '').replace(',', '.'))
                     except ValueError:
                         saldo_inicial_float = 0.0
+                    diferenca_saldo = saldo_inicial_float - (config.saldo_inicial or 0)
                     config.saldo_inicial = saldo_inicial_float
     
-                    session.query(SaldoFinal).filter_by(id_usuario=st.session_state['user_id']).update({"ano": config.ano_vigente})
+                    if config.ano_vigente != ano_anterior:
+                        mover_saldos_para_ano(session, st.session_state['user_id'], config.ano_vigente)
+                        recalcular_saldos(session, st.session_state['user_id'], config.ano_vigente)
+                    else:
+                        aplicar_delta_saldo(session, st.session_state['user_id'], config.ano_vigente, 1, diferenca_saldo)
+                    marcar_alteracao(session, st.session_state['user_id'])
                     session.commit()
-                    recalcular_saldos_finais()
                     st.success("Configurações salvas com sucesso!")
                     st.rerun()
 
+        st.subheader("Manutenção")
+        st.caption("Reconstrói todos os saldos mensais a partir dos lançamentos. Use apenas se os saldos estiverem inconsistentes.")
+        if st.button("Recalcular Saldos"):
+            recalcular_saldos_finais()
+            st.success("Saldos recalculados com sucesso!")
+
+
+def iniciar_exportacao(chave, tipo, ano, mes, rotulo, opcoes=None):
+    with fase(FASE_EXPORTACAO):
+        job = enviar_exportacao(st.session_state['user_id'], ano, mes, tipo, opcoes)
+    st.session_state['exportacoes'][chave] = {'job_id': job.id, 'rotulo': rotulo}
+
+def exibir_exportacoes(aguardar=False):
+    """Mostra o andamento das exportações da sessão e os downloads já prontos.
+
+    Com aguardar=True a página continua sendo atualizada mesmo sem exportações
+    pendentes (usado enquanto comprovantes em PDF são convertidos).
+    """
+    em_andamento = aguardar
+    for chave, pedido in list(st.session_state['exportacoes'].items()):
+        with fase(FASE_EXPORTACAO):
+            job = obter_job(pedido['job_id'])
+        if not job:
+            del st.session_state['exportacoes'][chave]
+            continue
+        arquivo = "planilha" if job.tipo == TIPO_LIVRO_CAIXA else "PDF"
+        if job.estado in (ESTADO_NA_FILA, ESTADO_EXECUTANDO):
+            em_andamento = True
+            texto = "na fila" if job.estado == ESTADO_NA_FILA else f"{int(job.progresso * 100)}%"
+            st.progress(job.progresso, text=f"{pedido['rotulo']}: gerando {arquivo} ({texto})")
+        elif job.estado == ESTADO_FALHOU:
+            st.error(f"Erro ao gerar {arquivo} ({pedido['rotulo']}): {job.erro}")
+        elif job.grande_demais:
+            st.warning(
+                f"{pedido['rotulo']}: a planilha tem {job.tamanho / (1024 * 1024):.0f} MB, acima do limite "
+                f"para download pelo navegador. Gere o arquivo no servidor com "
+                f"`python manutencao.py exportar-livro-caixa`."
+            )
+        else:
+            try:
+                resultado = job.abrir_resultado()
+            except OSError:
+                # A planilha expirou entre a consulta do job e a abertura
+                del st.session_state['exportacoes'][chave]
+                continue
+            try:
+                st.download_button(
+                    label=pedido['rotulo'],
+                    data=resultado,
+                    file_name=job.nome_arquivo,
+                    mime=job.mime,
+                    key=f"download_{chave}"
+                )
+            finally:
+                if hasattr(resultado, 'close'):
+                    resultado.close()
+
+    if em_andamento:
+        with fase(FASE_ESPERA):
+            time.sleep(1)
+        st.rerun()
 
 def mes_page():
     with get_session() as session:
         st.title("Relatório Mensal")
         
-        config = session.query(Configuracao).filter_by(id_usuario=st.session_state['user_id']).first()
+        config = obter_configuracao(st.session_state['user_id'])
         ano_vigente = config.ano_vigente if config else datetime.now().year
         
         mes = st.selectbox("Selecione o Mês", range(1, 13), format_func=lambda x: f"{x:02d}")
         ano = ano_vigente
     
         saldo_inicial = obter_saldo_inicial(mes, ano)
-        lancamentos = session.query(Lancamento).filter(
-            Lancamento.data.like(f"{ano}-{mes:02d}%"),
-            Lancamento.id_usuario == st.session_state['user_id']
-        ).all()
+        lancamentos = listar_lancamentos_mes(st.session_state['user_id'], ano, mes)
     
-        entradas = sum(l.valor for l in lancamentos if l.tipo in ['Outras Receitas', 'ACI Recebida'])
-        saidas = sum(l.valor for l in lancamentos if l.tipo in ['Outras Despesas', 'ACI Enviada'])
+        por_tipo = obter_totais_ano(st.session_state['user_id'], ano).get(mes, {})
+        entradas = sum(por_tipo.get(tipo, 0) for tipo in TIPOS_RECEITA)
+        saidas = sum(por_tipo.get(tipo, 0) for tipo in TIPOS_DESPESA)
         saldo = saldo_inicial + entradas - saidas
     
         saldo_inicial_formatado = format_currency_brl(saldo_inicial)
@@ -939,88 +576,190 @@ def mes_page():
             col1, col2, col3 = st.columns([3, 1, 1])
             with col1:
                 st.write(f"{lancamento.data.strftime('%d/%m/%Y')} - {lancamento.tipo} - {lancamento.descricao} - {locale.currency(lancamento.valor, grouping=True)}")
-                if lancamento.comprovante:
-                    st.image(lancamento.comprovante, caption="Comprovante", width=200)
+                if lancamento.comprovante_status == STATUS_PROCESSANDO:
+                    st.info("Comprovante em processamento...")
+                elif lancamento.comprovante_status == STATUS_ERRO:
+                    st.warning("Não foi possível converter o comprovante. Envie o arquivo novamente.")
+                elif lancamento.comprovante:
+                    with fase(FASE_IMAGEM):
+                        st.image(imagem_para_exibicao(lancamento.comprovante), caption="Comprovante", width=200)
             with col2:
                 if st.button("Editar", key=f"edit_{lancamento.id}"):
                     st.session_state['edit_lancamento_id'] = lancamento.id
                     st.rerun()
             with col3:
                 if st.button("Excluir", key=f"delete_{lancamento.id}"):
-                    if lancamento.comprovante and os.path.exists(lancamento.comprovante):
-                        os.remove(lancamento.comprovante)
-                    session.delete(lancamento)
-                    session.commit()
-                    saldo_inicial = obter_saldo_inicial(mes, ano)
-                    salvar_saldo_final(mes, ano, saldo_inicial)
-                    recalcular_saldos_finais()
-                    st.success("Lançamento excluído com sucesso!")
+                    lancamento = session.query(Lancamento).filter_by(
+                        id=lancamento.id,
+                        id_usuario=st.session_state['user_id']
+                    ).first()
+                    if lancamento:
+                        liberar_comprovante(session, lancamento)
+                        registrar_remocao(session, lancamento)
+                        session.delete(lancamento)
+                        session.commit()
+                        st.success("Lançamento excluído com sucesso!")
                     st.rerun()
     
         if st.session_state['edit_lancamento_id']:
             editar_lancamento_page(mes, ano)
     
-        recalcular_saldos_finais()
-    
         st.subheader("Exportar Relatório")
         col1, col2 = st.columns(2)
         with col1:
             if st.button("Exportar Mês Selecionado"):
-                pdf_path = exportar_relatorio(mes)
-                with open(pdf_path, "rb") as file:
-                    st.download_button(
-                        label="Baixar Relatório do Mês",
-                        data=file.read(),
-                        file_name=f"relatorio_{ano}_mes_{mes}_id_usuario_{st.session_state['user_id']}.pdf",
-                        mime="application/pdf"
-                    )
+                iniciar_exportacao('relatorio_mes', TIPO_RELATORIO, ano, mes, "Baixar Relatório do Mês")
         with col2:
             if st.button("Exportar Ano Completo"):
-                pdf_path = exportar_relatorio()
-                with open(pdf_path, "rb") as file:
-                    st.download_button(
-                        label="Baixar Relatório do Ano",
-                        data=file.read(),
-                        file_name=f"relatorio_{ano}_id_usuario_{st.session_state['user_id']}.pdf",
-                        mime="application/pdf"
-                    )
+                iniciar_exportacao('relatorio_ano', TIPO_RELATORIO, ano, None, "Baixar Relatório do Ano")
     
         st.subheader("Exportar Comprovantes")
         col1, col2 = st.columns(2)
         with col1:
             if st.button("Exportar Comprovantes do Mês"):
-                pdf_path = exportar_comprovantes(ano, mes)
-                with open(pdf_path, "rb") as file:
-                    st.download_button(
-                        label="Baixar Comprovantes do Mês",
-                        data=file.read(),
-                        file_name=f"comprovantes_{ano}_mes_{mes}_id_usuario_{st.session_state['user_id']}.pdf",
-                        mime="application/pdf"
-                    )
+                iniciar_exportacao('comprovantes_mes', TIPO_COMPROVANTES, ano, mes, "Baixar Comprovantes do Mês")
         with col2:
             if st.button("Exportar Comprovantes do Ano"):
-                pdf_path = exportar_comprovantes(ano)
-                with open(pdf_path, "rb") as file:
-                    st.download_button(
-                        label="Baixar Comprovantes do Ano",
-                        data=file.read(),
-                        file_name=f"comprovantes_{ano}_id_usuario_{st.session_state['user_id']}.pdf",
-                        mime="application/pdf"
-                    )
+                iniciar_exportacao('comprovantes_ano', TIPO_COMPROVANTES, ano, None, "Baixar Comprovantes do Ano")
+
+        exibir_exportacoes(aguardar=any(
+            lancamento.comprovante_status == STATUS_PROCESSANDO and conversao_em_andamento(lancamento.id)
+            for lancamento in lancamentos
+        ))
 
 def lancamentos_page():
     with get_session() as session:
         st.title("Lançamentos")
         
-        config = session.query(Configuracao).filter_by(id_usuario=st.session_state['user_id']).first()
+        config = obter_configuracao(st.session_state['user_id'])
         ano_atual = config.ano_vigente if config else datetime.now().year
         st.write(f"Ano Atual: {ano_atual}")
 
+        st.subheader("Buscar por Descrição")
+        termo = st.text_input("Buscar", placeholder="ex.: acampamento", label_visibility="collapsed")
+        supervisionados = get_usuarios_autorizados()
+        incluir_supervisionados = bool(supervisionados) and st.checkbox("Incluir UMPs supervisionadas")
+        if termo.strip():
+            ids_busca = [st.session_state['user_id']]
+            if incluir_supervisionados:
+                ids_busca += [id_usuario for id_usuario, _ in supervisionados if id_usuario != st.session_state['user_id']]
+            resultados = buscar_por_descricao(session, ids_busca, termo)
+            if resultados:
+                nomes = dict(supervisionados)
+                st.dataframe(
+                    [{
+                        "Cód.": resultado.id,
+                        "UMP": "Minha UMP" if resultado.id_usuario == st.session_state['user_id'] else nomes.get(resultado.id_usuario, ""),
+                        "Data": resultado.data,
+                        "Tipo": resultado.tipo,
+                        "Descrição": resultado.descricao,
+                        "Valor": resultado.valor,
+                    } for resultado in resultados],
+                    hide_index=True,
+                    use_container_width=True,
+                    column_config={
+                        "Data": st.column_config.DateColumn(format="DD/MM/YYYY"),
+                        "Valor": st.column_config.NumberColumn(format="R$ %.2f"),
+                    },
+                )
+            else:
+                st.info("Nenhum lançamento encontrado.")
+
+        st.subheader("Explorar Lançamentos")
+        with st.expander("Filtros", expanded=True):
+            col1, col2 = st.columns(2)
+            with col1:
+                data_inicio = st.date_input("De", value=datetime(ano_atual, 1, 1).date(), format="DD/MM/YYYY")
+                valor_min = st.number_input("Valor mínimo", min_value=0.0, value=None, step=10.0)
+            with col2:
+                data_fim = st.date_input("Até", value=datetime(ano_atual, 12, 31).date(), format="DD/MM/YYYY")
+                valor_max = st.number_input("Valor máximo", min_value=0.0, value=None, step=10.0)
+            tipos = st.multiselect("Tipo", TIPOS_LANCAMENTO)
+            opcoes_comprovante = {"Todos": None, "Com comprovante": True, "Sem comprovante": False}
+            com_comprovante = opcoes_comprovante[st.selectbox("Comprovante", list(opcoes_comprovante))]
+
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                ordenar_por = st.selectbox("Ordenar por", list(ORDENACOES))
+            with col2:
+                decrescente = st.checkbox("Ordem decrescente")
+            with col3:
+                tamanho = st.selectbox("Por página", [25, 50, 100], index=1)
+
+        filtros = FiltrosLancamentos(data_inicio, data_fim, tuple(tipos), valor_min, valor_max, com_comprovante)
+        estado = st.session_state['explorador']
+        consulta = (filtros, ordenar_por, decrescente, tamanho)
+        if estado['consulta'] != consulta:
+            # Filtro ou ordenação mudou: volta para a primeira página
+            estado['consulta'] = consulta
+            estado['cursores'] = [None]
+
+        linhas, proximo = buscar_pagina(
+            session, st.session_state['user_id'], filtros, ordenar_por, decrescente,
+            cursor=estado['cursores'][-1], tamanho=tamanho
+        )
+
+        if linhas:
+            st.dataframe(
+                [{
+                    "Cód.": linha.id,
+                    "Data": linha.data,
+                    "Tipo": linha.tipo,
+                    "Descrição": linha.descricao,
+                    "Valor": linha.valor,
+                    "Comprovante": linha.tem_comprovante,
+                } for linha in linhas],
+                hide_index=True,
+                use_container_width=True,
+                column_config={
+                    "Data": st.column_config.DateColumn(format="DD/MM/YYYY"),
+                    "Valor": st.column_config.NumberColumn(format="R$ %.2f"),
+                    "Comprovante": st.column_config.CheckboxColumn(),
+                },
+            )
+        else:
+            st.info("Nenhum lançamento encontrado com esses filtros.")
+
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            if st.button("Anterior", disabled=len(estado['cursores']) == 1):
+                estado['cursores'].pop()
+                st.rerun()
+        with col2:
+            st.write(f"Página {len(estado['cursores'])}")
+        with col3:
+            if st.button("Próxima", disabled=proximo is None):
+                estado['cursores'].append(proximo)
+                st.rerun()
+
+        st.subheader("Exportar Livro-Caixa")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            exportar_de = st.date_input("Início", value=datetime(ano_atual, 1, 1).date(), format="DD/MM/YYYY", key="livro_inicio")
+        with col2:
+            exportar_ate = st.date_input("Fim", value=datetime(ano_atual, 12, 31).date(), format="DD/MM/YYYY", key="livro_fim")
+        with col3:
+            formato = st.selectbox("Formato", list(FORMATOS_PLANILHA), format_func=lambda f: FORMATOS_PLANILHA[f][0])
+        exportar_supervisionados = bool(supervisionados) and st.checkbox("Incluir UMPs supervisionadas", key="livro_supervisionados")
+        if st.button("Gerar Planilha"):
+            if exportar_de > exportar_ate:
+                st.error("Erro: A data inicial deve ser anterior à final.")
+            else:
+                ids_exportacao = [st.session_state['user_id']]
+                if exportar_supervisionados:
+                    ids_exportacao += [id_usuario for id_usuario, _ in supervisionados if id_usuario != st.session_state['user_id']]
+                opcoes = (formato, exportar_de, exportar_ate, tuple(ids_exportacao))
+                iniciar_exportacao(
+                    f"livro_caixa_{formato}", TIPO_LIVRO_CAIXA, exportar_de.year, None,
+                    f"Baixar Livro-Caixa em {FORMATOS_PLANILHA[formato][0]}", opcoes
+                )
+        exibir_exportacoes()
+
 def adicionar_lancamento_page():
     with get_session() as session:
         st.title("Adicionar Lançamento")
         
-        config = session.query(Configuracao).filter_by(id_usuario=st.session_state['user_id']).first()
+        config = obter_configuracao(st.session_state['user_id'])
         ano = config.ano_vigente if config else datetime.now().year
     
         with st.form(key='add_lancamento_form'):
@@ -1040,23 +779,11 @@ def adicionar_lancamento_page():
                     try:
                         valor_float = float(valor.replace(',', '.'))
                         comprovante_path = None
+                        comprovante_hash = None
+                        comprovante_status = None
     
                         if comprovante:
-                            filename = secure_filename(comprovante.name)
-                            file_path = os.path.join(UPLOAD_FOLDER, filename)
-                            with open(file_path, "wb") as f:
-                                f.write(comprovante.getbuffer())
-    
-                            if filename.lower().endswith('.pdf'):
-                                images = convert_from_path(file_path)
-                                if images:
-                                    image_filename = filename.replace('.pdf', '.jpg')
-                                    image_path = os.path.join(UPLOAD_FOLDER, image_filename)
-                                    images[0].save(image_path, 'JPEG')
-                                    os.remove(file_path)
-                                    comprovante_path = image_path
-                            else:
-                                comprovante_path = file_path
+                            comprovante_path, comprovante_hash, comprovante_status = salvar_comprovante(session, comprovante)
     
                         lancamento = Lancamento(
                             data=data,
@@ -1064,19 +791,106 @@ def adicionar_lancamento_page():
                             descricao=descricao,
                             valor=valor_float,
                             comprovante=comprovante_path,
+                            comprovante_hash=comprovante_hash,
+                            comprovante_status=comprovante_status,
                             id_usuario=st.session_state['user_id']
                         )
                         session.add(lancamento)
+                        registrar_insercao(session, lancamento)
                         session.commit()
-    
-                        saldo_inicial = obter_saldo_inicial(mes, ano)
-                        salvar_saldo_final(mes, ano, saldo_inicial)
-                        recalcular_saldos_finais()
+                        if comprovante_status == STATUS_PROCESSANDO:
+                            enviar_conversao(lancamento.id, comprovante_path)
                         st.success("Lançamento adicionado com sucesso!")
                         st.rerun()
     
                     except ValueError:
                         st.error("Erro: Valor inválido.")
+                    except ComprovanteInvalido as e:
+                        st.error(f"Erro no comprovante: {e}")
+
+def importar_extrato_page():
+    with get_session() as session:
+        st.title("Importar Extrato")
+        st.write("Envie o extrato do banco em CSV ou OFX. Confira a prévia antes de importar.")
+
+        # A chave muda após cada importação para limpar o arquivo enviado
+        arquivo = st.file_uploader(
+            "Extrato", type=['csv', 'ofx'], key=f"extrato_{st.session_state['importacao_arquivo']}"
+        )
+        if not arquivo:
+            return
+        conteudo = arquivo.getvalue()
+
+        col1, col2 = st.columns(2)
+        with col1:
+            tipo_credito = st.selectbox("Tipo para entradas", TIPOS_RECEITA)
+        with col2:
+            tipo_debito = st.selectbox("Tipo para saídas", TIPOS_DESPESA)
+
+        if arquivo.name.lower().endswith('.ofx'):
+            movimentos = extrair_ofx(conteudo)
+        else:
+            pular = st.number_input("Linhas a ignorar antes do cabeçalho", min_value=0, value=0, step=1)
+            cabecalho, linhas_csv = ler_csv(conteudo, pular)
+            if not cabecalho:
+                st.error("Erro: O arquivo está vazio.")
+                return
+            sugestao = sugerir_colunas(cabecalho)
+            opcoes = [None] + list(range(len(cabecalho)))
+            rotulo = lambda indice: "(nenhuma)" if indice is None else cabecalho[indice]
+
+            st.subheader("Colunas")
+            colunas = {}
+            cols = st.columns(4)
+            for col, (campo, titulo) in zip(cols, (("data", "Data"), ("descricao", "Descrição"), ("valor", "Valor"), ("tipo", "Tipo (opcional)"))):
+                with col:
+                    colunas[campo] = st.selectbox(titulo, opcoes, index=opcoes.index(sugestao[campo]), format_func=rotulo)
+            if colunas['data'] is None or colunas['valor'] is None:
+                st.warning("Selecione ao menos as colunas de data e valor.")
+                return
+            movimentos = extrair_csv(linhas_csv, colunas)
+
+        linhas = preparar_importacao(session, st.session_state['user_id'], movimentos, tipo_credito, tipo_debito)
+        if not linhas:
+            st.info("Nenhuma transação encontrada no arquivo.")
+            return
+
+        duplicadas = sum(1 for linha in linhas if linha.duplicada)
+        com_erro = sum(1 for linha in linhas if linha.erro)
+        st.subheader("Prévia")
+        st.write(f"{len(linhas)} transação(ões): {duplicadas} já lançada(s), {com_erro} com erro.")
+        previa = st.data_editor(
+            [{
+                "Importar": not linha.duplicada and not linha.erro,
+                "Linha": linha.linha,
+                "Data": linha.data,
+                "Tipo": linha.tipo,
+                "Descrição": linha.descricao,
+                "Valor": linha.valor,
+                "Situação": linha.erro or ("Já lançado" if linha.duplicada else ""),
+            } for linha in linhas],
+            hide_index=True,
+            use_container_width=True,
+            disabled=["Linha", "Data", "Descrição", "Valor", "Situação"],
+            column_config={
+                "Data": st.column_config.DateColumn(format="DD/MM/YYYY"),
+                "Tipo": st.column_config.SelectboxColumn(options=list(TIPOS_LANCAMENTO), required=True),
+                "Valor": st.column_config.NumberColumn(format="R$ %.2f"),
+            },
+            key=f"previa_importacao_{st.session_state['importacao_arquivo']}",
+        )
+
+        selecionadas = [
+            linha._replace(tipo=editada["Tipo"])
+            for linha, editada in zip(linhas, previa)
+            if editada["Importar"] and not linha.erro
+        ]
+        if st.button(f"Importar {len(selecionadas)} lançamento(s)", disabled=not selecionadas):
+            quantidade = importar_lancamentos(session, st.session_state['user_id'], selecionadas)
+            session.commit()
+            st.session_state['importacao_arquivo'] += 1
+            st.success(f"{quantidade} lançamento(s) importado(s) com sucesso!")
+            st.rerun()
 
 def editar_lancamento_page(mes, ano):
     with get_session() as session:
@@ -1104,47 +918,77 @@ def editar_lancamento_page(mes, ano):
             if submit_button:
                 try:
                     valor_float = float(valor.replace(',', '.'))
-                    comprovante_path = lancamento.comprovante
-    
                     if comprovante:
-                        filename = secure_filename(comprovante.name)
-                        file_path = os.path.join(UPLOAD_FOLDER, filename)
-                        with open(file_path, "wb") as f:
-                            f.write(comprovante.getbuffer())
-    
-                        if filename.lower().endswith('.pdf'):
-                            images = convert_from_path(file_path)
-                            if images:
-                                image_filename = filename.replace('.pdf', '.jpg')
-                                image_path = os.path.join(UPLOAD_FOLDER, image_filename)
-                                images[0].save(image_path, 'JPEG')
-                                os.remove(file_path)
-                                comprovante_path = image_path
-                        else:
-                            comprovante_path = file_path
+                        comprovante_path, comprovante_hash, comprovante_status = salvar_comprovante(session, comprovante)
     
+                    antes = (lancamento.data, lancamento.tipo, lancamento.valor)
                     lancamento.data = data
                     lancamento.tipo = tipo
                     lancamento.descricao = descricao
                     lancamento.valor = valor_float
-                    if comprovante and lancamento.comprovante and os.path.exists(lancamento.comprovante):
-                        os.remove(lancamento.comprovante)
                     if comprovante:
+                        liberar_comprovante(session, lancamento)
                         lancamento.comprovante = comprovante_path
+                        lancamento.comprovante_hash = comprovante_hash
+                        lancamento.comprovante_status = comprovante_status
     
+                    registrar_alteracao(session, lancamento.id_usuario, antes, (data, tipo, valor_float))
                     session.commit()
-                    recalcular_saldos_finais()
+                    if comprovante and comprovante_status == STATUS_PROCESSANDO:
+                        enviar_conversao(lancamento.id, comprovante_path)
                     st.success("Lançamento atualizado com sucesso!")
                     st.session_state['edit_lancamento_id'] = None
                     st.rerun()
     
                 except ValueError:
                     st.error("Erro: Valor inválido.")
+                except ComprovanteInvalido as e:
+                    st.error(f"Erro no comprovante: {e}")
     
             if cancel_button:
                 st.session_state['edit_lancamento_id'] = None
                 st.rerun()
 
+def selecionar_previa(chave, caminho, nome_arquivo):
+    """Guarda o PDF buscado na sessão para a paginação sobreviver aos reruns."""
+    st.session_state.pop(f"pagina_{chave}", None)
+    if os.path.exists(caminho):
+        st.session_state['previas'][chave] = (caminho, nome_arquivo)
+    else:
+        st.session_state['previas'].pop(chave, None)
+
+def exibir_previa_pdf(chave, rotulo, rotulo_download):
+    """Mostra o PDF selecionado algumas páginas por vez; cada página é rasterizada só quando exibida."""
+    selecionado = st.session_state['previas'].get(chave)
+    if not selecionado or not os.path.exists(selecionado[0]):
+        return
+    caminho, nome_arquivo = selecionado
+    try:
+        with fase(FASE_IMAGEM):
+            paginas = total_paginas(caminho)
+        if not paginas:
+            st.warning("O PDF não tem páginas.")
+            return
+        inicio = st.number_input(
+            f"Página (total: {paginas})", min_value=1, max_value=paginas, value=1,
+            step=PAGINAS_POR_VEZ, key=f"pagina_{chave}"
+        )
+        for pagina in range(inicio, min(inicio + PAGINAS_POR_VEZ, paginas + 1)):
+            with fase(FASE_IMAGEM):
+                st.image(obter_previa(caminho, pagina), caption=f"Página {pagina} {rotulo}", use_container_width=True)
+
+        with open(caminho, "rb") as file:
+            st.download_button(
+                label=rotulo_download,
+                data=file.read(),
+                file_name=nome_arquivo,
+                mime="application/pdf"
+            )
+    except Exception as e:
+        st.error(f"Erro ao processar o PDF: {str(e)}")
+        st.write("Detalhes do erro:")
+        st.text(traceback.format_exc())  # Mostra stack trace completo para depuração
+
 def admin_relatorios_page():
     with get_session() as session:
         st.title("Consulta de Relatórios - Administrador")
@@ -1185,28 +1029,19 @@ def admin_relatorios_page():
             relatorio_path = os.path.join(RELATORIOS_DIR, relatorio_nome)
     
             st.write(f"Procurando relatório em: {relatorio_path}")  # Depuração
-    
-            if os.path.exists(relatorio_path):
-                try:
-                    st.write("Convertendo PDF para imagens...")  # Depuração
-                    images = convert_from_path(relatorio_path, dpi=200)  # Ajuste DPI se necessário
-                    for i, image in enumerate(images):
-                        st.image(image, caption=f"Página {i+1} do Relatório", use_container_width=True)
-                    
-                    with open(relatorio_path, "rb") as file:
-                        st.download_button(
-                            label="Baixar Relatório",
-                            data=file.read(),
-                            file_name=relatorio_nome,
-                            mime="application/pdf"
-                        )
-                except Exception as e:
-                    st.error(f"Erro ao processar o PDF: {str(e)}")
-                    st.write("Detalhes do erro:")
-                    st.text(traceback.format_exc())  # Mostra stack trace completo para depuração
-            else:
+            selecionar_previa('relatorio', relatorio_path, relatorio_nome)
+            if not os.path.exists(relatorio_path):
                 st.warning(f"Relatório para o ano {ano} do usuário {usuario_id} não encontrado em {relatorio_path}.")
 
+        exibir_previa_pdf('relatorio', "do Relatório", "Baixar Relatório")
+
+        st.subheader("Relatório Consolidado da Federação")
+        st.caption("Totais mensais de todas as UMPs sob sua supervisão, com uma seção por UMP.")
+        ano_consolidado = st.selectbox("Ano do consolidado", anos, index=len(anos) - 1)
+        if st.button("Gerar Relatório Consolidado"):
+            iniciar_exportacao('federacao', TIPO_FEDERACAO, ano_consolidado, None, "Baixar Relatório Consolidado")
+        exibir_exportacoes()
+
 def admin_comprovantes_page():
     with get_session() as session:
         st.title("Consulta de Comprovantes - Administrador")
@@ -1247,28 +1082,12 @@ def admin_comprovantes_page():
             comprovante_path = os.path.join(RELATORIOS_DIR, comprovante_nome)
     
             st.write(f"Procurando comprovantes em: {comprovante_path}")  # Depuração
-    
-            if os.path.exists(comprovante_path):
-                try:
-                    st.write("Convertendo PDF para imagens...")  # Depuração
-                    images = convert_from_path(comprovante_path, dpi=200)  # Ajuste DPI se necessário
-                    for i, image in enumerate(images):
-                        st.image(image, caption=f"Página {i+1} dos Comprovantes", use_container_width=True)
-                    
-                    with open(comprovante_path, "rb") as file:
-                        st.download_button(
-                            label="Baixar Comprovantes",
-                            data=file.read(),
-                            file_name=comprovante_nome,
-                            mime="application/pdf"
-                        )
-                except Exception as e:
-                    st.error(f"Erro ao processar o PDF: {str(e)}")
-                    st.write("Detalhes do erro:")
-                    st.text(traceback.format_exc())  # Mostra stack trace completo para depuração
-            else:
+            selecionar_previa('comprovantes', comprovante_path, comprovante_nome)
+            if not os.path.exists(comprovante_path):
                 st.warning(f"Comprovantes para o ano {ano} do usuário {usuario_id} não encontrados em {comprovante_path}.")
 
+        exibir_previa_pdf('comprovantes', "dos Comprovantes", "Baixar Comprovantes")
+
 
 def cadastro_usuario_page():
     with get_session() as session:
@@ -1318,6 +1137,8 @@ def cadastro_usuario_page():
                         for mes in range(1, 13):
                             saldo_final = SaldoFinal(id_usuario=id_usuario, mes=mes, ano=datetime.now().year, saldo=0.0)
                             session.add(saldo_final)
+                        marcar_alteracao(session, id_usuario)
+                        marcar_alteracao(session, ESCOPO_GLOBAL)
                         session.commit()
     
                         st.success("Usuário cadastrado com sucesso!")
@@ -1371,6 +1192,7 @@ def main():
                 ("Relatório Mensal", mes_page),
                 ("Lançamentos", lancamentos_page),
                 ("Adicionar Lançamento", adicionar_lancamento_page),
+                ("Importar Extrato", importar_extrato_page),
                 ("Consulta de Relatórios", admin_relatorios_page),
                 ("Consulta de Comprovantes", admin_comprovantes_page),
                 ("Cadastrar Usuário", cadastro_usuario_page),
@@ -1383,6 +1205,7 @@ def main():
                 ("Relatório Mensal", mes_page),
                 ("Lançamentos", lancamentos_page),
                 ("Adicionar Lançamento", adicionar_lancamento_page),
+                ("Importar Extrato", importar_extrato_page),
                 ("Alterar Senha", alterar_senha_page)
             ]
         
@@ -1390,8 +1213,13 @@ def main():
             if st.sidebar.button(page_name, key=page_name.replace(" ", "_")):
                 st.session_state['selected_page'] = page_func
         
+        cprofile = PERFIL_ATIVO and st.sidebar.checkbox("Perfil detalhado (cProfile)", key='perfil_cprofile')
+
         if st.session_state['selected_page']:
-            st.session_state['selected_page']()
+            with medir_pagina(st.session_state['selected_page']), \
+                    perfilar_pagina(st.session_state['selected_page'], st.session_state['user_id'], cprofile):
+                st.session_state['selected_page']()
+            exibir_perfil_pagina(ultimo_perfil())
         else:
             st.write("Selecione uma página na barra lateral para começar.")
         
@@ -1408,5 +1236,39 @@ def main():
             unsafe_allow_html=True
         )
 
+def exibir_perfil_pagina(perfil):
+    """Tempo da página e de cada fase na barra lateral (PERFIL_PAGINAS=1)."""
+    if not perfil:
+        return
+    fases = ", ".join(f"{nome} {ms:.0f} ms" for nome, ms in perfil['fases_ms'].items())
+    st.sidebar.caption(f"Página em {perfil['duracao_ms']:.0f} ms ({fases})")
+
+def exibir_painel_sql(resumo):
+    """Painel opcional na barra lateral com as consultas da reexecução (SQL_INSTRUMENTACAO=1)."""
+    if not resumo or not st.sidebar.checkbox("Depuração SQL"):
+        return
+    with st.sidebar.expander("Consultas SQL", expanded=True):
+        st.write(f"{resumo['total_consultas']} consulta(s), {resumo['tempo_total_ms']:.1f} ms no banco")
+        for grupo in resumo['n_mais_1']:
+            st.warning(
+                f"Possível N+1: {grupo['vezes']}x, {grupo['tempo_ms']:.1f} ms em {', '.join(grupo['origens'])}\n\n"
+                f"`{grupo['sql'][:300]}`"
+            )
+        st.dataframe(
+            [{
+                "ms": round(consulta['duracao_ms'], 2),
+                "Linhas": consulta['linhas'],
+                "Origem": consulta['origem'],
+                "SQL": consulta['sql'],
+            } for consulta in resumo['consultas']],
+            hide_index=True,
+        )
+
 if __name__ == "__main__":
-    main()
+    iniciar_coleta()
+    try:
+        main()
+    finally:
+        pagina = st.session_state.get('selected_page')
+        resumo = finalizar_coleta(getattr(pagina, '__name__', None))
+    exibir_painel_sql(resumo)
@@ -0,0 +1,192 @@
+"""Comandos de manutenção executados fora do Streamlit.
+
+Uso:
+    python manutencao.py migrar
+    python manutencao.py reconstruir-resumo [--usuario ID]
+    python manutencao.py recalcular-saldos [--usuario ID]
+    python manutencao.py gerar-derivados [--usuario ID] [--forcar]
+    python manutencao.py migrar-comprovantes
+    python manutencao.py exportar-livro-caixa --usuario ID --inicio AAAA-MM-DD --fim AAAA-MM-DD
+                         [--formato csv|xlsx|parquet] [--supervisionadas] --saida ARQUIVO
+    python manutencao.py reenviar-emails
+"""
+import argparse
+import os
+from datetime import date
+
+from dotenv import load_dotenv
+
+from armazenamento import guardar_comprovante
+from cache import SINCRONIZAR_SEGUNDOS, registrar_alteracao_externa
+from db_runtime import get_session, inicializar_banco
+from fila_email import reenviar_falhos
+from imagens import caminho_impressao, caminho_miniatura, gerar_derivados, remover_comprovante
+from livro_caixa import FORMATOS, exportar_livro_caixa
+from models import Configuracao, Lancamento
+from pastas import UPLOAD_FOLDER
+from resumo_mensal import reconstruir_resumo
+from saldos import recalcular_saldos
+import recuperacao_senha  # registra o reconstrutor dos e-mails de troca de senha
+
+# Os processos do app só percebem alterações feitas aqui pela versão gravada em versao_cache
+AVISO_CACHE = f"O app em execução descarta o cache de consultas em até {SINCRONIZAR_SEGUNDOS:g}s."
+
+
+def _ids_usuarios(session, id_usuario):
+    if id_usuario is not None:
+        return [id_usuario]
+    return [linha[0] for linha in session.query(Configuracao.id_usuario).distinct()]
+
+
+def comando_migrar(args):
+    inicializar_banco()
+    print("Esquema atualizado.")
+
+
+def comando_reconstruir_resumo(args):
+    inicializar_banco()
+    with get_session() as session:
+        reconstruir_resumo(session, args.usuario)
+        registrar_alteracao_externa(session)
+        session.commit()
+    print(f"Resumo mensal reconstruído. {AVISO_CACHE}")
+
+
+def comando_recalcular_saldos(args):
+    inicializar_banco()
+    with get_session() as session:
+        ids = _ids_usuarios(session, args.usuario)
+        for id_usuario in ids:
+            recalcular_saldos(session, id_usuario)
+        registrar_alteracao_externa(session)
+        session.commit()
+    print(f"Saldos recalculados para {len(ids)} usuário(s). {AVISO_CACHE}")
+
+
+def comando_gerar_derivados(args):
+    inicializar_banco()
+    with get_session() as session:
+        consulta = session.query(Lancamento.comprovante).filter(Lancamento.comprovante.isnot(None))
+        if args.usuario is not None:
+            consulta = consulta.filter(Lancamento.id_usuario == args.usuario)
+        comprovantes = sorted({linha[0] for linha in consulta})
+
+    gerados = falhas = 0
+    for comprovante in comprovantes:
+        caminho = comprovante if comprovante.startswith(UPLOAD_FOLDER) else os.path.join(UPLOAD_FOLDER, comprovante)
+        if not os.path.exists(caminho):
+            continue
+        if not args.forcar and os.path.exists(caminho_impressao(caminho)) and os.path.exists(caminho_miniatura(caminho)):
+            continue
+        try:
+            if gerar_derivados(caminho):
+                gerados += 1
+        except Exception as e:
+            falhas += 1
+            print(f"Erro ao processar {caminho}: {e}")
+    print(f"Derivados gerados para {gerados} comprovante(s); {falhas} falha(s).")
+
+
+def comando_migrar_comprovantes(args):
+    inicializar_banco()
+    with get_session() as session:
+        antigos = sorted({linha[0] for linha in session.query(Lancamento.comprovante).filter(
+            Lancamento.comprovante.isnot(None),
+            Lancamento.comprovante_hash.is_(None),
+            Lancamento.comprovante_status.is_(None)
+        )})
+
+    movidos = ausentes = 0
+    for comprovante in antigos:
+        caminho = comprovante if comprovante.startswith(UPLOAD_FOLDER) else os.path.join(UPLOAD_FOLDER, comprovante)
+        if not os.path.exists(caminho):
+            ausentes += 1
+            continue
+        with get_session() as session:
+            lancamentos = session.query(Lancamento).filter(
+                Lancamento.comprovante == comprovante, Lancamento.comprovante_hash.is_(None)
+            ).all()
+            with open(caminho, 'rb') as arquivo:
+                digest, novo_caminho, _ = guardar_comprovante(
+                    session, arquivo, os.path.splitext(caminho)[1], quantidade=len(lancamentos)
+                )
+            if not os.path.exists(caminho_impressao(novo_caminho)):
+                gerar_derivados(novo_caminho)
+            for lancamento in lancamentos:
+                lancamento.comprovante = novo_caminho
+                lancamento.comprovante_hash = digest
+            registrar_alteracao_externa(session)
+            session.commit()
+        remover_comprovante(caminho)
+        movidos += 1
+    print(f"{movidos} comprovante(s) movidos para o armazenamento por conteúdo; {ausentes} arquivo(s) não encontrados.")
+    if movidos:
+        print(AVISO_CACHE)
+
+
+def comando_exportar_livro_caixa(args):
+    inicializar_banco()
+    ids = [args.usuario]
+    if args.supervisionadas:
+        with get_session() as session:
+            ids += [linha[0] for linha in session.query(Configuracao.id_usuario).filter(
+                Configuracao.admin == args.usuario, Configuracao.id_usuario != args.usuario
+            )]
+    with open(args.saida, 'wb') as destino:
+        exportar_livro_caixa(ids, args.inicio, args.fim, args.formato, destino)
+    print(f"Livro-caixa de {len(ids)} UMP(s) gravado em {args.saida}.")
+
+
+def comando_reenviar_emails(args):
+    inicializar_banco()
+    with get_session() as session:
+        reenviados, sem_reconstrutor = reenviar_falhos(session)
+        session.commit()
+    print(f"{reenviados} e-mail(s) devolvidos à fila; o despachante da aplicação os envia na próxima verificação.")
+    if sem_reconstrutor:
+        print(f"{sem_reconstrutor} e-mail(s) sem conteúdo e sem como remontar a mensagem ficaram em 'falhou'.")
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Manutenção do UMP Financeiro")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    subparsers.add_parser("migrar", help="Cria tabelas e aplica migrações pendentes").set_defaults(func=comando_migrar)
+
+    resumo = subparsers.add_parser("reconstruir-resumo", help="Reconstrói resumo_mensal a partir dos lançamentos")
+    resumo.add_argument("--usuario", type=int, help="Limita a um id_usuario")
+    resumo.set_defaults(func=comando_reconstruir_resumo)
+
+    saldos = subparsers.add_parser("recalcular-saldos", help="Reconstrói saldo_final do ano vigente")
+    saldos.add_argument("--usuario", type=int, help="Limita a um id_usuario")
+    saldos.set_defaults(func=comando_recalcular_saldos)
+
+    derivados = subparsers.add_parser("gerar-derivados", help="Gera cópias de impressão e miniaturas dos comprovantes existentes")
+    derivados.add_argument("--usuario", type=int, help="Limita a um id_usuario")
+    derivados.add_argument("--forcar", action="store_true", help="Regera mesmo se os derivados já existirem")
+    derivados.set_defaults(func=comando_gerar_derivados)
+
+    subparsers.add_parser(
+        "migrar-comprovantes", help="Move uploads antigos (uploads/<nome>) para o armazenamento por conteúdo"
+    ).set_defaults(func=comando_migrar_comprovantes)
+
+    livro = subparsers.add_parser("exportar-livro-caixa", help="Exporta lançamentos e saldos finais em planilha")
+    livro.add_argument("--usuario", type=int, required=True, help="id_usuario da UMP (ou do administrador)")
+    livro.add_argument("--supervisionadas", action="store_true", help="Inclui as UMPs supervisionadas pelo usuário")
+    livro.add_argument("--inicio", type=date.fromisoformat, required=True)
+    livro.add_argument("--fim", type=date.fromisoformat, required=True)
+    livro.add_argument("--formato", choices=list(FORMATOS), default="csv")
+    livro.add_argument("--saida", required=True, help="Arquivo de destino")
+    livro.set_defaults(func=comando_exportar_livro_caixa)
+
+    subparsers.add_parser(
+        "reenviar-emails", help="Devolve à fila os e-mails que falharam em todas as tentativas"
+    ).set_defaults(func=comando_reenviar_emails)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
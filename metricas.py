@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as TimeoutPool
+from sqlalchemy.pool import QueuePool
+
+from cache import estatisticas_cache
+
+# Métricas do processo no formato do Prometheus, ligadas com METRICAS=1. O
+# registro é único por processo (o Streamlit reexecuta o main.py, mas este
+# módulo fica em cache) e é servido em http://METRICAS_ENDERECO:METRICAS_PORTA/
+# por um servidor HTTP em thread própria, iniciado na primeira reexecução.
+# Histogramas e contadores são alimentados pelo despacho das páginas, pelos
+# jobs de exportação, pelo upload e pela conversão de comprovantes e pela fila
+# de e-mails; pool do banco, cache de consultas e sessões ativas são lidos na
+# hora da coleta.
+ATIVO = os.getenv("METRICAS", "0") == "1"
+ENDERECO = os.getenv("METRICAS_ENDERECO", "127.0.0.1")
+PORTA = int(os.getenv("METRICAS_PORTA", "9464"))
+# Uma sessão do navegador conta como ativa se reexecutou o script nesse intervalo
+SESSAO_ATIVA_SEGUNDOS = int(os.getenv("METRICAS_SESSAO_ATIVA_SEGUNDOS", "300"))
+
+BALDES_SEGUNDOS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BALDES_BYTES = tuple(2 ** potencia for potencia in range(10, 31, 2))  # 1 KiB a 1 GiB
+
+REGISTRO = CollectorRegistry()
+
+PAGINA_DURACAO = Histogram(
+    'ump_pagina_duracao_segundos', "Tempo de execução de cada página do Streamlit",
+    ['pagina'], buckets=BALDES_SEGUNDOS, registry=REGISTRO
+)
+EXPORTACAO_DURACAO = Histogram(
+    'ump_exportacao_duracao_segundos', "Duração dos jobs de exportação",
+    ['tipo', 'estado'], buckets=BALDES_SEGUNDOS, registry=REGISTRO
+)
+EXPORTACAO_BYTES = Histogram(
+    'ump_exportacao_bytes', "Tamanho dos arquivos exportados",
+    ['tipo'], buckets=BALDES_BYTES, registry=REGISTRO
+)
+UPLOAD_BYTES = Histogram(
+    'ump_comprovante_upload_bytes', "Tamanho dos comprovantes enviados",
+    ['extensao'], buckets=BALDES_BYTES, registry=REGISTRO
+)
+CONVERSAO_DURACAO = Histogram(
+    'ump_comprovante_conversao_segundos', "Conversão de comprovantes em PDF para JPEG",
+    ['resultado'], buckets=BALDES_SEGUNDOS, registry=REGISTRO
+)
+EMAIL_ENVIOS = Counter(
+    'ump_email_envios', "Tentativas de envio da fila de e-mails por resultado",
+    ['resultado'], registry=REGISTRO
+)
+POOL_CHECKOUTS = Counter(
+    'ump_db_pool_checkouts', "Conexões entregues pelo pool do banco", registry=REGISTRO
+)
+POOL_ESPERA = Histogram(
+    'ump_db_pool_espera_segundos', "Tempo para obter uma conexão do pool (espera e abertura)",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30), registry=REGISTRO
+)
+POOL_TIMEOUTS = Counter(
+    'ump_db_pool_timeouts', "Pedidos de conexão que esgotaram DB_POOL_TIMEOUT", registry=REGISTRO
+)
+
+_lock = threading.Lock()
+_servidor_iniciado = False
+_pool = None
+_sessoes = {}
+
+
+class PoolMedido(QueuePool):
+    """QueuePool que registra quanto tempo cada pedido de conexão levou."""
+
+    def connect(self):
+        inicio = time.perf_counter()
+        try:
+            return super().connect()
+        except TimeoutPool:
+            POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            POOL_ESPERA.observe(time.perf_counter() - inicio)
+
+
+def _contar_checkout(dbapi_connection, connection_record, connection_proxy):
+    POOL_CHECKOUTS.inc()
+
+
+def instrumentar_engine(engine):
+    global _pool
+    if ATIVO:
+        _pool = engine.pool
+        event.listen(engine.pool, 'checkout', _contar_checkout)
+
+
+class _ColetorEstado:
+    """Valores lidos no momento da coleta: pool, cache de consultas e sessões."""
+
+    def collect(self):
+        if _pool is not None and isinstance(_pool, QueuePool):
+            tamanho = GaugeMetricFamily('ump_db_pool_tamanho', "Conexões fixas do pool")
+            tamanho.add_metric([], _pool.size())
+            yield tamanho
+            em_uso = GaugeMetricFamily('ump_db_pool_em_uso', "Conexões emprestadas no momento")
+            em_uso.add_metric([], _pool.checkedout())
+            yield em_uso
+            excedentes = GaugeMetricFamily('ump_db_pool_excedentes', "Conexões além de pool_size (overflow)")
+            excedentes.add_metric([], max(_pool.overflow(), 0))
+            yield excedentes
+
+        cache = estatisticas_cache()
+        acertos = CounterMetricFamily('ump_cache_consultas_acertos', "Consultas servidas pelo cache")
+        acertos.add_metric([], cache['acertos'])
+        yield acertos
+        falhas = CounterMetricFamily('ump_cache_consultas_falhas', "Consultas calculadas no banco")
+        falhas.add_metric([], cache['falhas'])
+        yield falhas
+        entradas = GaugeMetricFamily('ump_cache_consultas_entradas', "Entradas no cache de consultas")
+        entradas.add_metric([], cache['entradas'])
+        yield entradas
+
+        limite = time.time() - SESSAO_ATIVA_SEGUNDOS
+        with _lock:
+            for id_sessao in [s for s, (visto, _) in _sessoes.items() if visto < limite]:
+                del _sessoes[id_sessao]
+            autenticadas = sum(1 for _, logado in _sessoes.values() if logado)
+            total = len(_sessoes)
+        sessoes = GaugeMetricFamily(
+            'ump_sessoes_ativas', f"Sessões com atividade nos últimos {SESSAO_ATIVA_SEGUNDOS}s", labels=['autenticada']
+        )
+        sessoes.add_metric(['sim'], autenticadas)
+        sessoes.add_metric(['nao'], total - autenticadas)
+        yield sessoes
+
+
+REGISTRO.register(_ColetorEstado())
+
+
+def iniciar_servidor():
+    """Sobe o endpoint HTTP uma única vez por processo (sem efeito se METRICAS != 1)."""
+    global _servidor_iniciado
+    if not ATIVO:
+        return
+    with _lock:
+        if _servidor_iniciado:
+            return
+        _servidor_iniciado = True
+        try:
+            start_http_server(PORTA, addr=ENDERECO, registry=REGISTRO)
+        except OSError as e:
+            print(f"Erro ao iniciar o endpoint de métricas em {ENDERECO}:{PORTA}: {e}")
+
+
+def registrar_sessao(id_sessao, autenticada):
+    with _lock:
+        _sessoes[id_sessao] = (time.time(), bool(autenticada))
+
+
+@contextmanager
+def medir_pagina(pagina):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        PAGINA_DURACAO.labels(getattr(pagina, '__name__', str(pagina))).observe(time.perf_counter() - inicio)
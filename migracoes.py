@@ -0,0 +1,165 @@
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from resumo_mensal import reconstruir_resumo
+
+# Migrações versionadas do esquema. O create_all só cria tabelas que ainda não
+# existem, então qualquer alteração em tabelas existentes (índices, colunas,
+# restrições) precisa ser registrada aqui com um número de versão crescente.
+MIGRACOES = []
+
+
+class MigracaoAdiada(Exception):
+    """A migração não pôde ser aplicada agora; não é registrada e volta a ser tentada no próximo início."""
+
+
+def migracao(versao, descricao):
+    def registrar(funcao):
+        MIGRACOES.append((versao, descricao, funcao))
+        MIGRACOES.sort(key=lambda item: item[0])
+        return funcao
+    return registrar
+
+
+@migracao(1, "Índices compostos em lancamento e índice único em saldo_final")
+def _indices_lancamento_saldo_final(conexao):
+    conexao.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_lancamento_usuario_data ON lancamento (id_usuario, data)"
+    ))
+    conexao.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_lancamento_usuario_data_tipo ON lancamento (id_usuario, data, tipo)"
+    ))
+    # Remove duplicatas antigas antes de criar o índice único (mantém a linha mais recente)
+    conexao.execute(text(
+        "DELETE FROM saldo_final WHERE id NOT IN ("
+        " SELECT max_id FROM (SELECT MAX(id) AS max_id FROM saldo_final GROUP BY id_usuario, ano, mes) AS ultimos"
+        ")"
+    ))
+    conexao.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_saldo_final_usuario_ano_mes ON saldo_final (id_usuario, ano, mes)"
+    ))
+
+
+@migracao(2, "Preenche resumo_mensal a partir dos lançamentos existentes")
+def _preencher_resumo_mensal(conexao):
+    reconstruir_resumo(conexao)
+
+
+@migracao(3, "Coluna comprovante_status em lancamento")
+def _status_comprovante(conexao):
+    # Em bancos novos o create_all já cria a coluna
+    colunas = {coluna['name'] for coluna in inspect(conexao).get_columns('lancamento')}
+    if 'comprovante_status' not in colunas:
+        conexao.execute(text("ALTER TABLE lancamento ADD COLUMN comprovante_status VARCHAR(20)"))
+
+
+@migracao(4, "Coluna comprovante_hash em lancamento")
+def _hash_comprovante(conexao):
+    colunas = {coluna['name'] for coluna in inspect(conexao).get_columns('lancamento')}
+    if 'comprovante_hash' not in colunas:
+        conexao.execute(text("ALTER TABLE lancamento ADD COLUMN comprovante_hash VARCHAR(64)"))
+    conexao.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_lancamento_comprovante_hash ON lancamento (comprovante_hash)"
+    ))
+
+
+@migracao(5, "Índice em configuracao.admin")
+def _indice_admin(conexao):
+    conexao.execute(text("CREATE INDEX IF NOT EXISTS ix_configuracao_admin ON configuracao (admin)"))
+
+
+@migracao(6, "Índice de busca textual em lancamento.descricao")
+def _indice_busca_descricao(conexao):
+    # Sem suporte no servidor (extensão ou FTS5 indisponível) a busca cai para LIKE
+    # até que a migração seja aplicada num próximo início ou por `manutencao.py migrar`
+    if conexao.dialect.name == 'postgresql':
+        try:
+            with conexao.begin_nested():
+                conexao.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        except Exception as e:
+            raise MigracaoAdiada(f"extensão pg_trgm indisponível: {e}")
+        conexao.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_lancamento_descricao_trgm ON lancamento USING gin (descricao gin_trgm_ops)"
+        ))
+    elif conexao.dialect.name == 'sqlite':
+        try:
+            conexao.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS lancamento_fts USING fts5("
+                " descricao, content='lancamento', content_rowid='id', tokenize='trigram'"
+                ")"
+            ))
+        except Exception as e:
+            raise MigracaoAdiada(f"FTS5 indisponível: {e}")
+        # Tabela de conteúdo externo: os gatilhos mantêm o índice em dia com lancamento
+        conexao.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS lancamento_fts_ai AFTER INSERT ON lancamento BEGIN"
+            " INSERT INTO lancamento_fts (rowid, descricao) VALUES (new.id, new.descricao);"
+            " END"
+        ))
+        conexao.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS lancamento_fts_ad AFTER DELETE ON lancamento BEGIN"
+            " INSERT INTO lancamento_fts (lancamento_fts, rowid, descricao) VALUES ('delete', old.id, old.descricao);"
+            " END"
+        ))
+        conexao.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS lancamento_fts_au AFTER UPDATE OF descricao ON lancamento BEGIN"
+            " INSERT INTO lancamento_fts (lancamento_fts, rowid, descricao) VALUES ('delete', old.id, old.descricao);"
+            " INSERT INTO lancamento_fts (rowid, descricao) VALUES (new.id, new.descricao);"
+            " END"
+        ))
+        conexao.execute(text("INSERT INTO lancamento_fts (lancamento_fts) VALUES ('rebuild')"))
+
+
+@migracao(7, "Colunas tipo e id_usuario em email_pendente")
+def _tipo_email(conexao):
+    colunas = {coluna['name'] for coluna in inspect(conexao).get_columns('email_pendente')}
+    if 'tipo' not in colunas:
+        conexao.execute(text("ALTER TABLE email_pendente ADD COLUMN tipo VARCHAR(40)"))
+    if 'id_usuario' not in colunas:
+        conexao.execute(text("ALTER TABLE email_pendente ADD COLUMN id_usuario INTEGER"))
+
+
+def _criar_tabela_versao(conexao):
+    conexao.execute(text(
+        "CREATE TABLE IF NOT EXISTS versao_esquema ("
+        " versao INTEGER PRIMARY KEY,"
+        " descricao VARCHAR(200) NOT NULL,"
+        " aplicada_em TIMESTAMP NOT NULL"
+        ")"
+    ))
+
+
+def _bloquear(conexao):
+    # Impede que dois processos apliquem a mesma migração ao mesmo tempo
+    if conexao.dialect.name == 'postgresql':
+        conexao.execute(text("SELECT pg_advisory_xact_lock(727001)"))
+
+
+def versoes_aplicadas(conexao):
+    return {linha[0] for linha in conexao.execute(text("SELECT versao FROM versao_esquema"))}
+
+
+def aplicar_migracoes(engine):
+    """Aplica, em ordem e cada uma em sua transação, as migrações pendentes."""
+    with engine.begin() as conexao:
+        _bloquear(conexao)
+        _criar_tabela_versao(conexao)
+
+    aplicadas = []
+    for versao, descricao, funcao in MIGRACOES:
+        with engine.begin() as conexao:
+            _bloquear(conexao)
+            if versao in versoes_aplicadas(conexao):
+                continue
+            try:
+                funcao(conexao)
+            except MigracaoAdiada as e:
+                print(f"Aviso: migração {versao} ({descricao}) adiada: {e}")
+                continue
+            conexao.execute(
+                text("INSERT INTO versao_esquema (versao, descricao, aplicada_em) VALUES (:versao, :descricao, :aplicada_em)"),
+                {"versao": versao, "descricao": descricao, "aplicada_em": datetime.now()}
+            )
+            aplicadas.append(versao)
+    return aplicadas
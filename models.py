@@ -8,7 +8,7 @@ db = SQLAlchemy()
 class Configuracao(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     id_usuario = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
-    admin = db.Column(db.Integer, nullable=False)
+    admin = db.Column(db.Integer, nullable=False, index=True)
     ump_federacao = db.Column(db.String(100), nullable=False)
     federacao_sinodo = db.Column(db.String(100), nullable=False)
     ano_vigente = db.Column(db.Integer, nullable=False)
@@ -29,6 +29,10 @@ class Financeiro(db.Model):
 
 class Lancamento(db.Model):
     __tablename__ = 'lancamento'  # Garante que SQLAlchemy use a tabela correta
+    __table_args__ = (
+        db.Index('ix_lancamento_usuario_data', 'id_usuario', 'data'),
+        db.Index('ix_lancamento_usuario_data_tipo', 'id_usuario', 'data', 'tipo'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     id_usuario = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
@@ -37,13 +41,20 @@ class Lancamento(db.Model):
     descricao = db.Column(db.String(120), nullable=False)
     valor = db.Column(db.Float, nullable=False)
     comprovante = db.Column(db.String(120), nullable=True)
+    # None quando o comprovante está pronto; 'processando' ou 'erro' durante/após a conversão do PDF
+    comprovante_status = db.Column(db.String(20), nullable=True)
+    # SHA-256 do arquivo no armazenamento por conteúdo (None para uploads antigos em uploads/<nome>)
+    comprovante_hash = db.Column(db.String(64), nullable=True, index=True)
 
     def __repr__(self):
         return f'<Lancamento {self.id} - {self.descricao}>'
 
 class SaldoFinal(db.Model):
     __tablename__ = 'saldo_final'
-    
+    __table_args__ = (
+        db.Index('uq_saldo_final_usuario_ano_mes', 'id_usuario', 'ano', 'mes', unique=True),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     id_usuario = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
     mes = db.Column(db.Integer, nullable=False)
@@ -56,6 +67,56 @@ class SaldoFinal(db.Model):
         self.saldo = saldo
         self.id_usuario = id_usuario
 
+class ResumoMensal(db.Model):
+    __tablename__ = 'resumo_mensal'  # Totais por mês e tipo, mantidos junto com cada lançamento
+    __table_args__ = (
+        db.Index('uq_resumo_mensal_usuario_ano_mes_tipo', 'id_usuario', 'ano', 'mes', 'tipo', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    id_usuario = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
+    ano = db.Column(db.Integer, nullable=False)
+    mes = db.Column(db.Integer, nullable=False)
+    tipo = db.Column(db.String(50), nullable=False)
+    total = db.Column(db.Float, nullable=False, default=0)
+    quantidade = db.Column(db.Integer, nullable=False, default=0)
+
+class ComprovanteBlob(db.Model):
+    __tablename__ = 'comprovante_blob'  # Um arquivo por conteúdo; referencias = lançamentos que apontam para ele
+
+    hash = db.Column(db.String(64), primary_key=True)
+    caminho = db.Column(db.String(120), nullable=False)
+    tamanho = db.Column(db.Integer, nullable=False)
+    referencias = db.Column(db.Integer, nullable=False, default=0)
+
+class VersaoCache(db.Model):
+    __tablename__ = 'versao_cache'  # Linha única incrementada por alterações feitas fora do app (manutencao.py)
+
+    id = db.Column(db.Integer, primary_key=True)
+    versao = db.Column(db.Integer, nullable=False, default=0)
+
+class EmailPendente(db.Model):
+    __tablename__ = 'email_pendente'  # Fila de e-mails de saída, enviada em segundo plano por fila_email
+    __table_args__ = (
+        db.Index('ix_email_pendente_estado_proxima', 'estado', 'proxima_tentativa'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    destinatario = db.Column(db.String(120), nullable=False)
+    assunto = db.Column(db.String(200), nullable=False)
+    # Apagado depois do envio ou da falha definitiva (pode conter a senha gerada)
+    conteudo = db.Column(db.Text, nullable=False)
+    # Permite remontar a mensagem no reenvio (ver fila_email.registrar_reconstrutor)
+    tipo = db.Column(db.String(40), nullable=True)
+    id_usuario = db.Column(db.Integer, nullable=True)
+    # 'pendente', 'enviado' ou 'falhou' (esgotou as tentativas ou foi recusado pelo provedor)
+    estado = db.Column(db.String(20), nullable=False, default='pendente')
+    tentativas = db.Column(db.Integer, nullable=False, default=0)
+    proxima_tentativa = db.Column(db.DateTime, nullable=False)
+    ultimo_erro = db.Column(db.Text, nullable=True)
+    criado_em = db.Column(db.DateTime, nullable=False)
+    enviado_em = db.Column(db.DateTime, nullable=True)
+
 class Usuario(db.Model, UserMixin):
     __tablename__ = 'usuario'
     
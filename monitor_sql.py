@@ -0,0 +1,143 @@
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import event
+
+# Instrumentação das consultas SQL por reexecução do Streamlit, ligada com
+# SQL_INSTRUMENTACAO=1. Os eventos do engine registram cada comando da thread
+# do script entre iniciar_coleta() e finalizar_coleta(): SQL normalizado (sem
+# valores, para não gravar dados dos usuários), duração, linhas afetadas
+# (quando o driver informa) e as funções do projeto que o dispararam. Comandos do
+# mesmo formato repetidos LIMIAR_N_MAIS_1 vezes ou mais são apontados como
+# prováveis N+1. Cada reexecução vira uma linha JSON em ARQUIVO.
+ATIVO = os.getenv("SQL_INSTRUMENTACAO", "0") == "1"
+ARQUIVO = os.getenv("SQL_INSTRUMENTACAO_ARQUIVO", os.path.join("logs", "consultas_sql.jsonl"))
+LIMIAR_N_MAIS_1 = int(os.getenv("SQL_LIMIAR_N_MAIS_1", "3"))
+PROFUNDIDADE_ORIGEM = 3
+
+_RAIZ = os.path.dirname(os.path.abspath(__file__))
+_ESTE_ARQUIVO = os.path.abspath(__file__)
+
+_local = threading.local()
+_lock_arquivo = threading.Lock()
+
+_RE_PARAMETRO = re.compile(r"%\(\w+\)s|(?<![:\w]):[A-Za-z_]\w*|\$\d+")
+_RE_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMERO = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_ESPACOS = re.compile(r"\s+")
+_RE_LISTA = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+def normalizar_sql(sql):
+    """Formato do comando: valores e marcadores viram '?', listas do IN viram '(?)'."""
+    sql = _RE_TEXTO.sub("?", sql)
+    sql = _RE_PARAMETRO.sub("?", sql)
+    sql = _RE_NUMERO.sub("?", sql)
+    sql = _RE_ESPACOS.sub(" ", sql).strip()
+    return _RE_LISTA.sub("(?)", sql)
+
+
+def _origem():
+    """Até PROFUNDIDADE_ORIGEM funções do projeto na pilha (a mais interna primeiro), fora das bibliotecas."""
+    quadros = []
+    quadro = sys._getframe(2)
+    while quadro is not None and len(quadros) < PROFUNDIDADE_ORIGEM:
+        arquivo = quadro.f_code.co_filename
+        if arquivo.startswith(_RAIZ) and arquivo != _ESTE_ARQUIVO and 'site-packages' not in arquivo:
+            quadros.append(f"{os.path.basename(arquivo)}:{quadro.f_lineno} {quadro.f_code.co_name}")
+        quadro = quadro.f_back
+    return " < ".join(quadros) or None
+
+
+class ColetaConsultas:
+    def __init__(self):
+        self.inicio = time.time()
+        self.consultas = []
+
+    def resumo(self, pagina):
+        formatos = defaultdict(list)
+        for consulta in self.consultas:
+            formatos[consulta['sql']].append(consulta)
+        n_mais_1 = sorted((
+            {
+                'sql': sql,
+                'vezes': len(repeticoes),
+                'tempo_ms': sum(consulta['duracao_ms'] for consulta in repeticoes),
+                'origens': sorted({consulta['origem'] or "?" for consulta in repeticoes}),
+            }
+            for sql, repeticoes in formatos.items() if len(repeticoes) >= LIMIAR_N_MAIS_1
+        ), key=lambda grupo: -grupo['vezes'])
+        return {
+            'inicio': datetime.fromtimestamp(self.inicio).isoformat(timespec='milliseconds'),
+            'pagina': pagina,
+            'duracao_ms': (time.time() - self.inicio) * 1000,
+            'total_consultas': len(self.consultas),
+            'tempo_total_ms': sum(consulta['duracao_ms'] for consulta in self.consultas),
+            'n_mais_1': n_mais_1,
+            'consultas': self.consultas,
+        }
+
+
+def _antes_de_executar(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_local, 'coleta', None) is not None:
+        conn.info.setdefault('monitor_sql_inicio', []).append(time.perf_counter())
+
+
+def _depois_de_executar(conn, cursor, statement, parameters, context, executemany):
+    coleta = getattr(_local, 'coleta', None)
+    inicios = conn.info.get('monitor_sql_inicio')
+    if coleta is None or not inicios:
+        return
+    duracao = time.perf_counter() - inicios.pop()
+    coleta.consultas.append({
+        'sql': normalizar_sql(statement),
+        'duracao_ms': duracao * 1000,
+        'linhas': cursor.rowcount if cursor.rowcount >= 0 else None,
+        'lote': bool(executemany),
+        'origem': _origem(),
+    })
+
+
+def _erro_no_banco(contexto):
+    # Comando que falhou não chega ao after_cursor_execute; descarta o início pendente
+    conexao = contexto.connection
+    inicios = conexao.info.get('monitor_sql_inicio') if conexao is not None else None
+    if inicios:
+        inicios.pop()
+
+
+def instrumentar_engine(engine):
+    if ATIVO:
+        event.listen(engine, 'before_cursor_execute', _antes_de_executar)
+        event.listen(engine, 'after_cursor_execute', _depois_de_executar)
+        event.listen(engine, 'handle_error', _erro_no_banco)
+
+
+def iniciar_coleta():
+    """Começa a registrar os comandos da thread atual (uma reexecução do script)."""
+    _local.coleta = ColetaConsultas() if ATIVO else None
+
+
+def finalizar_coleta(pagina=None):
+    """Encerra a coleta da thread, grava a linha JSON e devolve o resumo (None se desativado)."""
+    coleta = getattr(_local, 'coleta', None)
+    _local.coleta = None
+    if coleta is None:
+        return None
+    resumo = coleta.resumo(pagina)
+    try:
+        pasta = os.path.dirname(ARQUIVO)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        linha = json.dumps(resumo, ensure_ascii=False)
+        with _lock_arquivo, open(ARQUIVO, 'a', encoding='utf-8') as arquivo:
+            arquivo.write(linha + "\n")
+    except OSError as e:
+        print(f"Erro ao gravar {ARQUIVO}: {e}")
+    return resumo
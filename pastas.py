@@ -0,0 +1,11 @@
+import os
+
+# Configuração de uploads e relatorios
+UPLOAD_FOLDER = 'uploads/'
+RELATORIOS_DIR = 'relatorios/'
+
+
+def criar_pastas():
+    for folder in [UPLOAD_FOLDER, RELATORIOS_DIR]:
+        if not os.path.exists(folder):
+            os.makedirs(folder)
@@ -0,0 +1,215 @@
+import cProfile
+import heapq
+import io
+import json
+import os
+import pstats
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import event
+
+# Perfil de cada página do Streamlit, ligado com PERFIL_PAGINAS=1. O tempo de
+# uma chamada de página é dividido em fases exclusivas: 'banco' (medida pelos
+# eventos do engine), as marcadas no código com `fase()` ('imagem',
+# 'exportacao', 'espera') e 'render', o restante (montagem dos widgets e
+# lógica da página). Uma fase aberta dentro de outra pausa a de fora, então a
+# soma das fases é a duração da página. As PERFIL_MAIS_LENTAS chamadas mais
+# demoradas (sem contar a espera) ficam em PASTA, uma por arquivo JSON.
+#
+# Com o cProfile ligado para a sessão (caixa na barra lateral), uma fração
+# PERFIL_AMOSTRAGEM das chamadas é perfilada por completo; o .prof fica ao lado
+# do JSON e as funções mais caras vão no próprio JSON.
+ATIVO = os.getenv("PERFIL_PAGINAS", "0") == "1"
+PASTA = os.getenv("PERFIL_PAGINAS_PASTA", os.path.join("logs", "perfis"))
+MAIS_LENTAS = int(os.getenv("PERFIL_MAIS_LENTAS", "20"))
+AMOSTRAGEM = float(os.getenv("PERFIL_AMOSTRAGEM", "1.0"))
+FUNCOES_CPROFILE = 30
+
+FASE_RENDER = 'render'
+FASE_BANCO = 'banco'
+FASE_IMAGEM = 'imagem'
+FASE_EXPORTACAO = 'exportacao'
+FASE_ESPERA = 'espera'
+
+_local = threading.local()
+_lock = threading.Lock()
+# Heap (duração, nome do arquivo) com as mais lentas já gravadas; None até ser lido da pasta
+_mais_lentas = None
+
+
+class PerfilPagina:
+    def __init__(self, pagina, id_usuario):
+        self.pagina = pagina
+        self.id_usuario = id_usuario
+        self.inicio = time.time()
+        self.fases = defaultdict(float)
+        self.contagens = defaultdict(int)
+        self._pilha = []
+
+    def entrar(self, nome):
+        agora = time.perf_counter()
+        if self._pilha:
+            self.fases[self._pilha[-1][0]] += agora - self._pilha[-1][1]
+        self._pilha.append([nome, agora])
+        self.contagens[nome] += 1
+
+    def sair(self, nome):
+        # Um comando com erro não dispara after_cursor_execute; descarta o que ficou aberto acima
+        while self._pilha and self._pilha[-1][0] != nome:
+            self._fechar_topo()
+        if self._pilha:
+            self._fechar_topo()
+
+    def _fechar_topo(self):
+        agora = time.perf_counter()
+        nome, inicio = self._pilha.pop()
+        self.fases[nome] += agora - inicio
+        if self._pilha:
+            self._pilha[-1][1] = agora
+
+    def resumo(self, excecao=None):
+        while self._pilha:
+            self._fechar_topo()
+        duracao = sum(self.fases.values())
+        return {
+            'inicio': datetime.fromtimestamp(self.inicio).isoformat(timespec='milliseconds'),
+            'pagina': self.pagina,
+            'id_usuario': self.id_usuario,
+            'duracao_ms': duracao * 1000,
+            'duracao_util_ms': (duracao - self.fases.get(FASE_ESPERA, 0)) * 1000,
+            'fases_ms': {nome: segundos * 1000 for nome, segundos in sorted(self.fases.items(), key=lambda f: -f[1])},
+            'contagens': dict(self.contagens),
+            'excecao': excecao,
+        }
+
+
+@contextmanager
+def fase(nome):
+    """Atribui o trecho à fase `nome` no perfil da página em execução nesta thread (sem efeito se não houver)."""
+    perfil = getattr(_local, 'perfil', None)
+    if perfil is None:
+        yield
+        return
+    perfil.entrar(nome)
+    try:
+        yield
+    finally:
+        perfil.sair(nome)
+
+
+def _antes_de_executar(conn, cursor, statement, parameters, context, executemany):
+    perfil = getattr(_local, 'perfil', None)
+    if perfil is not None:
+        perfil.entrar(FASE_BANCO)
+
+
+def _depois_de_executar(conn, cursor, statement, parameters, context, executemany):
+    perfil = getattr(_local, 'perfil', None)
+    if perfil is not None:
+        perfil.sair(FASE_BANCO)
+
+
+def _erro_no_banco(contexto):
+    perfil = getattr(_local, 'perfil', None)
+    if perfil is not None:
+        perfil.sair(FASE_BANCO)
+
+
+def instrumentar_engine(engine):
+    if ATIVO:
+        event.listen(engine, 'before_cursor_execute', _antes_de_executar)
+        event.listen(engine, 'after_cursor_execute', _depois_de_executar)
+        event.listen(engine, 'handle_error', _erro_no_banco)
+
+
+def _carregar_mais_lentas():
+    global _mais_lentas
+    if _mais_lentas is not None:
+        return
+    _mais_lentas = []
+    if os.path.isdir(PASTA):
+        for nome in os.listdir(PASTA):
+            if nome.endswith('.json'):
+                try:
+                    with open(os.path.join(PASTA, nome), encoding='utf-8') as arquivo:
+                        _mais_lentas.append((json.load(arquivo)['duracao_util_ms'], nome))
+                except (OSError, ValueError, KeyError):
+                    continue
+    heapq.heapify(_mais_lentas)
+
+
+def _remover_perfil(nome):
+    for caminho in (os.path.join(PASTA, nome), os.path.join(PASTA, nome[:-len('.json')] + '.prof')):
+        try:
+            os.remove(caminho)
+        except FileNotFoundError:
+            pass
+
+
+def _guardar_se_lenta(resumo, perfilador):
+    """Grava o perfil se ele estiver entre os MAIS_LENTAS; remove o que sair da lista."""
+    duracao = resumo['duracao_util_ms']
+    with _lock:
+        _carregar_mais_lentas()
+        if len(_mais_lentas) >= MAIS_LENTAS and duracao <= _mais_lentas[0][0]:
+            return
+        os.makedirs(PASTA, exist_ok=True)
+        base = f"{datetime.now():%Y%m%d_%H%M%S_%f}_{resumo['pagina']}"
+        if perfilador is not None:
+            perfilador.dump_stats(os.path.join(PASTA, base + '.prof'))
+            resumo['cprofile'] = base + '.prof'
+        with open(os.path.join(PASTA, base + '.json'), 'w', encoding='utf-8') as arquivo:
+            json.dump(resumo, arquivo, ensure_ascii=False, indent=2)
+        heapq.heappush(_mais_lentas, (duracao, base + '.json'))
+        while len(_mais_lentas) > MAIS_LENTAS:
+            _remover_perfil(heapq.heappop(_mais_lentas)[1])
+
+
+def _funcoes_mais_caras(perfilador):
+    saida = io.StringIO()
+    pstats.Stats(perfilador, stream=saida).sort_stats('cumulative').print_stats(FUNCOES_CPROFILE)
+    return saida.getvalue()
+
+
+@contextmanager
+def perfilar_pagina(pagina, id_usuario=None, cprofile=False):
+    """Mede a chamada da página; guarda o perfil em _local.ultimo (None se desativado)."""
+    _local.ultimo = None
+    if not ATIVO:
+        yield
+        return
+    perfil = PerfilPagina(getattr(pagina, '__name__', str(pagina)), id_usuario)
+    perfilador = cProfile.Profile() if cprofile and random.random() < AMOSTRAGEM else None
+    _local.perfil = perfil
+    perfil.entrar(FASE_RENDER)
+    excecao = None
+    if perfilador is not None:
+        perfilador.enable()
+    try:
+        yield
+    except BaseException as e:
+        # st.rerun() e st.stop() também chegam aqui como exceções do Streamlit
+        excecao = type(e).__name__
+        raise
+    finally:
+        if perfilador is not None:
+            perfilador.disable()
+        _local.perfil = None
+        resumo = perfil.resumo(excecao)
+        if perfilador is not None:
+            resumo['funcoes'] = _funcoes_mais_caras(perfilador)
+        try:
+            _guardar_se_lenta(resumo, perfilador)
+        except OSError as e:
+            print(f"Erro ao gravar o perfil em {PASTA}: {e}")
+        _local.ultimo = resumo
+
+
+def ultimo_perfil():
+    """Perfil da última página medida nesta thread."""
+    return getattr(_local, 'ultimo', None)
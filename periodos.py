@@ -0,0 +1,17 @@
+from datetime import date
+
+
+def intervalo_mes(ano, mes):
+    """Intervalo semiaberto [primeiro dia do mês, primeiro dia do mês seguinte)."""
+    inicio = date(ano, mes, 1)
+    fim = date(ano + 1, 1, 1) if mes == 12 else date(ano, mes + 1, 1)
+    return inicio, fim
+
+
+def intervalo_ano(ano):
+    return date(ano, 1, 1), date(ano + 1, 1, 1)
+
+
+def filtro_periodo(coluna, inicio, fim):
+    """Predicado `inicio <= coluna < fim`, que permite varredura por faixa no índice."""
+    return (coluna >= inicio) & (coluna < fim)
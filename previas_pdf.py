@@ -0,0 +1,67 @@
+import os
+import threading
+from functools import lru_cache
+
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+from cache_relatorios import hash_arquivo, limpar_diretorio
+from pastas import RELATORIOS_DIR
+
+# Prévias dos PDFs nas páginas de administrador. Em vez de rasterizar o PDF
+# inteiro a cada consulta, cada página é convertida só quando exibida, em
+# PREVIA_DPI, e guardada em relatorios/previas/<sha256>_p<pagina>_<dpi>.jpg.
+# Como a chave é o conteúdo do PDF, reabrir o mesmo relatório não chama o
+# poppler de novo, e um PDF regerado ganha prévias novas automaticamente.
+PREVIAS_DIR = os.path.join(RELATORIOS_DIR, 'previas')
+PREVIA_DPI = int(os.getenv("PREVIA_DPI", "100"))
+PAGINAS_POR_VEZ = int(os.getenv("PREVIA_PAGINAS_POR_VEZ", "2"))
+MAX_IDADE_SEGUNDOS = int(os.getenv("PREVIAS_MAX_DIAS", "30")) * 86400
+MAX_BYTES = int(os.getenv("PREVIAS_MAX_MB", "200")) * 1024 * 1024
+TIMEOUT_PREVIA = int(os.getenv("PREVIA_TIMEOUT", "60"))
+# Contagens de páginas memorizadas (por hash do PDF)
+MAX_CONTAGENS_MEMORIZADAS = 1024
+
+_lock = threading.Lock()
+_locks_paginas = {}
+
+
+def total_paginas(caminho):
+    """Número de páginas do PDF, lido dos metadados e memorizado pelo hash do arquivo."""
+    return _contar_paginas(hash_arquivo(caminho), caminho)
+
+
+@lru_cache(maxsize=MAX_CONTAGENS_MEMORIZADAS)
+def _contar_paginas(digest, caminho):
+    return pdfinfo_from_path(caminho, timeout=TIMEOUT_PREVIA).get('Pages', 0)
+
+
+def _caminho_previa(digest, pagina, dpi):
+    return os.path.join(PREVIAS_DIR, f"{digest}_p{pagina}_{dpi}.jpg")
+
+
+def obter_previa(caminho, pagina, dpi=PREVIA_DPI):
+    """Caminho do JPEG da página (1-based) do PDF, rasterizando só essa página se ainda não estiver no cache."""
+    digest = hash_arquivo(caminho)
+    destino = _caminho_previa(digest, pagina, dpi)
+    with _lock:
+        lock_pagina = _locks_paginas.setdefault(destino, threading.Lock())
+
+    # Dois administradores abrindo a mesma página esperam uma única conversão
+    try:
+        with lock_pagina:
+            if os.path.exists(destino):
+                os.utime(destino)  # marca como usada recentemente
+                return destino
+            imagens = convert_from_path(
+                caminho, dpi=dpi, first_page=pagina, last_page=pagina, timeout=TIMEOUT_PREVIA
+            )
+            os.makedirs(PREVIAS_DIR, exist_ok=True)
+            temporario = f"{destino}.{threading.get_ident()}.tmp"
+            imagens[0].convert('RGB').save(temporario, 'JPEG', quality=80)
+            os.replace(temporario, destino)
+    finally:
+        # Também em acerto de cache e em falha da conversão, para o dicionário não crescer
+        with _lock:
+            _locks_paginas.pop(destino, None)
+    limpar_diretorio(PREVIAS_DIR, '.jpg', MAX_IDADE_SEGUNDOS, MAX_BYTES)
+    return destino
@@ -0,0 +1,37 @@
+import random
+
+from fila_email import enfileirar_email, registrar_reconstrutor
+from models import Usuario
+
+# Troca de senha por e-mail. A senha nova só existe na mensagem enfileirada,
+# que é apagada depois do envio ou da falha definitiva; para reenviar um e-mail
+# que falhou, uma nova senha é gerada e a mensagem é montada de novo.
+TIPO_EMAIL = 'recuperacao_senha'
+ASSUNTO = "Recuperação de Senha"
+
+
+def gerar_senha_aleatoria():
+    return str(random.randint(100000, 999999))  # Gera uma senha numérica de 6 dígitos
+
+
+def redefinir_senha(session, id_usuario, email_destinatario):
+    """Troca a senha e enfileira o e-mail com ela na transação de `session`; False se o usuário não existe."""
+    usuario = session.get(Usuario, id_usuario)
+    if usuario is None:
+        return False
+    nova_senha = gerar_senha_aleatoria()
+    usuario.senha = nova_senha
+    enfileirar_email(
+        session,
+        email_destinatario,
+        ASSUNTO,
+        f"Olá!\n\nSua nova senha é: {nova_senha}\n\nEste é um e-mail automático. Por favor, não responda a esta mensagem.",
+        tipo=TIPO_EMAIL,
+        id_usuario=id_usuario,
+    )
+    return True
+
+
+@registrar_reconstrutor(TIPO_EMAIL)
+def _reconstruir(session, email):
+    return redefinir_senha(session, email.id_usuario, email.destinatario)
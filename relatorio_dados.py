@@ -0,0 +1,95 @@
+from collections import defaultdict
+from datetime import datetime
+
+from models import Configuracao, Lancamento, ResumoMensal
+from periodos import intervalo_mes, intervalo_ano, filtro_periodo
+
+TIPOS_RECEITA = ('Outras Receitas', 'ACI Recebida')
+TIPOS_DESPESA = ('Outras Despesas', 'ACI Enviada')
+TIPOS_LANCAMENTO = TIPOS_RECEITA + TIPOS_DESPESA
+
+
+def totais_por_mes_e_tipo(session, id_usuario, ano, mes=None):
+    """Totais do ano por (mês, tipo), lidos do resumo mensal (no máximo 48 linhas)."""
+    consulta = session.query(ResumoMensal.mes, ResumoMensal.tipo, ResumoMensal.total).filter(
+        ResumoMensal.id_usuario == id_usuario,
+        ResumoMensal.ano == ano
+    )
+    if mes is not None:
+        consulta = consulta.filter(ResumoMensal.mes == mes)
+
+    totais = defaultdict(lambda: defaultdict(float))
+    for mes_resumo, tipo, total in consulta:
+        totais[int(mes_resumo)][tipo] += float(total or 0)
+    return totais
+
+
+def resumo_anual(totais):
+    """Totais do ano por tipo a partir do resultado de totais_por_mes_e_tipo."""
+    resumo = {tipo: 0.0 for tipo in TIPOS_LANCAMENTO}
+    for por_tipo in totais.values():
+        for tipo, total in por_tipo.items():
+            resumo[tipo] = resumo.get(tipo, 0.0) + total
+    return resumo
+
+
+def montar_dados_relatorio(session, id_usuario, mes=None, configuracao=None):
+    """Dados do relatório anual (ou de um mês); `configuracao` evita nova consulta quando já carregada."""
+    if configuracao is None:
+        configuracao = session.query(Configuracao).filter_by(id_usuario=id_usuario).first()
+    ano_vigente = configuracao.ano_vigente if configuracao else datetime.now().year
+    saldo_inicial_ano = float(configuracao.saldo_inicial or 0) if configuracao else 0
+
+    totais = totais_por_mes_e_tipo(session, id_usuario, ano_vigente)
+    resumo = resumo_anual(totais)
+
+    inicio, fim = intervalo_ano(ano_vigente) if mes is None else intervalo_mes(ano_vigente, mes)
+    consulta = session.query(Lancamento).filter(
+        Lancamento.id_usuario == id_usuario,
+        filtro_periodo(Lancamento.data, inicio, fim)
+    )
+    lancamentos_por_mes = defaultdict(list)
+    for lancamento in consulta.order_by(Lancamento.data, Lancamento.id):
+        lancamentos_por_mes[lancamento.data.month].append(lancamento)
+
+    outras_receitas = resumo['Outras Receitas']
+    aci_recebida = resumo['ACI Recebida']
+    outras_despesas = resumo['Outras Despesas']
+    aci_enviada = resumo['ACI Enviada']
+    total_receitas = outras_receitas + aci_recebida
+    total_despesas = outras_despesas + aci_enviada
+    saldo_final_ano = saldo_inicial_ano + total_receitas - total_despesas
+
+    # Saldo corrente calculado em uma única passada pelos 12 meses
+    dados = []
+    saldo_anterior = saldo_inicial_ano
+    for mes_atual in range(1, 13):
+        por_tipo = totais.get(mes_atual, {})
+        entradas = sum(por_tipo.get(tipo, 0.0) for tipo in TIPOS_RECEITA)
+        saidas = sum(por_tipo.get(tipo, 0.0) for tipo in TIPOS_DESPESA)
+        saldo_inicial = saldo_anterior
+        saldo_final = saldo_inicial + entradas - saidas
+        saldo_anterior = saldo_final
+
+        if mes is not None and mes_atual != mes:
+            continue
+
+        dados.append({
+            'mes': mes_atual,
+            'saldo_inicial': saldo_inicial,
+            'entradas': entradas,
+            'saidas': saidas,
+            'saldo_final': saldo_final,
+            'saldo_final_ano': saldo_final_ano,
+            'lancamentos': lancamentos_por_mes.get(mes_atual, []),
+            'configuracao': configuracao,
+            'outras_receitas': outras_receitas,
+            'aci_recebida': aci_recebida,
+            'outras_despesas': outras_despesas,
+            'aci_enviada': aci_enviada,
+            'total_receitas': total_receitas,
+            'total_despesas': total_despesas,
+            'ano_vigente': ano_vigente
+        })
+
+    return dados
@@ -0,0 +1,215 @@
+import io
+import locale
+import multiprocessing
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pypdf import PdfWriter
+from sqlalchemy import func
+
+from consultas import obter_indice_administradores
+from db_runtime import get_session
+from models import Configuracao, ResumoMensal
+from relatorio_dados import TIPOS_DESPESA, TIPOS_LANCAMENTO, TIPOS_RECEITA
+from relatorios_pdf import PDFWithFooter
+
+# Relatório consolidado das UMPs supervisionadas por um administrador. As UMPs
+# vêm do índice de administradores em cache e os totais de todas elas saem de
+# uma única consulta agrupada sobre o resumo_mensal; cada seção (capa da federação + uma por UMP) é desenhada num
+# processo separado a partir de dicionários simples, e os PDFs resultantes são
+# unidos na ordem com pypdf. O tempo total fica próximo ao da seção mais lenta.
+FEDERACAO_WORKERS = int(os.getenv("FEDERACAO_WORKERS", str(os.cpu_count() or 1)))
+
+MESES = {
+    1: "Janeiro", 2: "Fevereiro", 3: "Março", 4: "Abril", 5: "Maio", 6: "Junho",
+    7: "Julho", 8: "Agosto", 9: "Setembro", 10: "Outubro", 11: "Novembro", 12: "Dezembro"
+}
+
+_lock = threading.Lock()
+_executor = None
+
+
+def _iniciar_processo(numerico, monetario):
+    # Processos 'spawn' começam no locale C; formata valores como o processo principal
+    locale.setlocale(locale.LC_NUMERIC, numerico)
+    locale.setlocale(locale.LC_MONETARY, monetario)
+
+
+def _obter_executor():
+    """Pool de processos criado no primeiro uso, com o locale do processo principal nesse momento."""
+    global _executor
+    if FEDERACAO_WORKERS <= 1:
+        return None
+    with _lock:
+        if _executor is None:
+            # 'spawn' evita herdar por fork as threads e conexões do servidor do Streamlit
+            _executor = ProcessPoolExecutor(
+                max_workers=FEDERACAO_WORKERS, mp_context=multiprocessing.get_context('spawn'),
+                initializer=_iniciar_processo,
+                initargs=(locale.setlocale(locale.LC_NUMERIC), locale.setlocale(locale.LC_MONETARY))
+            )
+    return _executor
+
+
+def _linha_mes(mes, por_tipo):
+    linha = {'mes': mes}
+    linha.update({tipo: por_tipo.get(tipo, 0.0) for tipo in TIPOS_LANCAMENTO})
+    linha['receitas'] = sum(por_tipo.get(tipo, 0.0) for tipo in TIPOS_RECEITA)
+    linha['despesas'] = sum(por_tipo.get(tipo, 0.0) for tipo in TIPOS_DESPESA)
+    linha['resultado'] = linha['receitas'] - linha['despesas']
+    return linha
+
+
+def _somar_linhas(linhas):
+    total = {'mes': None}
+    for chave in TIPOS_LANCAMENTO + ('receitas', 'despesas', 'resultado'):
+        total[chave] = sum(linha[chave] for linha in linhas)
+    return total
+
+
+def carregar_dados_federacao(session, id_admin, ano):
+    """Totais mensais por UMP e da federação, para todas as UMPs com admin == id_admin."""
+    umps = sorted(obter_indice_administradores().get(id_admin, ()), key=lambda ump: ump[1] or "")
+    ids = [id_usuario for id_usuario, _ in umps]
+
+    totais = defaultdict(lambda: defaultdict(lambda: defaultdict(float)))
+    sinodos = {}
+    if ids:
+        sinodos = dict(session.query(Configuracao.id_usuario, Configuracao.federacao_sinodo).filter(
+            Configuracao.id_usuario.in_(ids)
+        ))
+        linhas = session.query(
+            ResumoMensal.id_usuario, ResumoMensal.mes, ResumoMensal.tipo, func.sum(ResumoMensal.total)
+        ).filter(
+            ResumoMensal.id_usuario.in_(ids),
+            ResumoMensal.ano == ano
+        ).group_by(ResumoMensal.id_usuario, ResumoMensal.mes, ResumoMensal.tipo).all()
+        for id_usuario, mes, tipo, total in linhas:
+            totais[id_usuario][int(mes)][tipo] += float(total or 0)
+
+    secoes = []
+    federacao = defaultdict(lambda: defaultdict(float))
+    for id_usuario, ump_federacao in umps:
+        meses = [_linha_mes(mes, totais[id_usuario][mes]) for mes in range(1, 13)]
+        for mes in range(1, 13):
+            for tipo, total in totais[id_usuario][mes].items():
+                federacao[mes][tipo] += total
+        secoes.append({
+            'id_usuario': id_usuario,
+            'nome': ump_federacao or "Nome não disponível",
+            'sinodo': sinodos.get(id_usuario) or "",
+            'meses': meses,
+            'total': _somar_linhas(meses),
+        })
+
+    meses_federacao = [_linha_mes(mes, federacao[mes]) for mes in range(1, 13)]
+    return {
+        'ano': ano,
+        'meses': meses_federacao,
+        'total': _somar_linhas(meses_federacao),
+        'secoes': secoes,
+    }
+
+
+def _valor(valor):
+    return f"R$ {locale.format_string('%.2f', valor, grouping=True)}"
+
+
+def _tabela_mensal(pdf, meses, total):
+    pdf.set_text_color(255, 255, 255)
+    pdf.set_font("Arial", style='B', size=9)
+    pdf.set_fill_color(28, 30, 62)
+    colunas = [("Mês", 25)] + [(tipo, 33) for tipo in TIPOS_LANCAMENTO] + [("Resultado", 33)]
+    for titulo, largura in colunas:
+        pdf.cell(largura, 8, titulo, border=1, align='C', fill=True)
+    pdf.ln()
+
+    pdf.set_text_color(0, 0, 0)
+    pdf.set_font("Arial", size=9)
+    for linha in meses + [total]:
+        if linha is total:
+            pdf.set_font("Arial", style='B', size=9)
+            pdf.set_fill_color(200, 200, 200)
+        rotulo = MESES[linha['mes']] if linha['mes'] else "Total"
+        pdf.cell(25, 7, rotulo, border=1, align='L', fill=linha is total)
+        for tipo in TIPOS_LANCAMENTO:
+            pdf.cell(33, 7, _valor(linha[tipo]), border=1, align='R', fill=linha is total)
+        pdf.cell(33, 7, _valor(linha['resultado']), border=1, align='R', fill=linha is total)
+        pdf.ln()
+
+
+def _cabecalho(pdf, titulo, subtitulo):
+    pdf.add_page()
+    pdf.set_text_color(28, 30, 62)
+    pdf.set_font("Arial", style='B', size=14)
+    pdf.cell(190, 10, titulo, ln=True, align='C')
+    pdf.set_font("Arial", style='B', size=12)
+    pdf.cell(190, 10, subtitulo, ln=True, align='C')
+    pdf.ln(5)
+
+
+def renderizar_capa(dados):
+    """Capa com os totais da federação e o quadro-resumo por UMP."""
+    pdf = PDFWithFooter()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    _cabecalho(pdf, f"RELATÓRIO CONSOLIDADO {dados['ano']}", f"{len(dados['secoes'])} UMP(s) supervisionada(s)")
+    _tabela_mensal(pdf, dados['meses'], dados['total'])
+    pdf.ln(8)
+
+    pdf.set_text_color(255, 255, 255)
+    pdf.set_font("Arial", style='B', size=10)
+    pdf.set_fill_color(28, 30, 62)
+    for titulo, largura in (("UMP", 85), ("Receitas", 35), ("Despesas", 35), ("Resultado", 35)):
+        pdf.cell(largura, 8, titulo, border=1, align='C', fill=True)
+    pdf.ln()
+    pdf.set_text_color(0, 0, 0)
+    pdf.set_font("Arial", size=10)
+    for secao in dados['secoes']:
+        total = secao['total']
+        pdf.cell(85, 7, f"{secao['nome']} (ID: {secao['id_usuario']})", border=1)
+        pdf.cell(35, 7, _valor(total['receitas']), border=1, align='R')
+        pdf.cell(35, 7, _valor(total['despesas']), border=1, align='R')
+        pdf.cell(35, 7, _valor(total['resultado']), border=1, align='R')
+        pdf.ln()
+    return bytes(pdf.output())
+
+
+def renderizar_secao(secao, ano):
+    """Seção de uma UMP; roda em processo separado, então só recebe dados simples."""
+    pdf = PDFWithFooter()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    subtitulo = f"{secao['nome']} - {secao['sinodo']}" if secao['sinodo'] else secao['nome']
+    _cabecalho(pdf, f"RELATÓRIO FINANCEIRO {ano}", subtitulo)
+    _tabela_mensal(pdf, secao['meses'], secao['total'])
+    return bytes(pdf.output())
+
+
+def exportar_federacao(id_admin, ano, progresso=None):
+    with get_session() as session:
+        dados = carregar_dados_federacao(session, id_admin, ano)
+
+    tarefas = [(renderizar_capa, (dados,))] + [(renderizar_secao, (secao, ano)) for secao in dados['secoes']]
+    partes = [None] * len(tarefas)
+    executor = _obter_executor()
+    if executor is None:
+        for indice, (funcao, argumentos) in enumerate(tarefas):
+            partes[indice] = funcao(*argumentos)
+            if progresso:
+                progresso((indice + 1) / (len(tarefas) + 1))
+    else:
+        futuros = {executor.submit(funcao, *argumentos): indice for indice, (funcao, argumentos) in enumerate(tarefas)}
+        for concluidos, futuro in enumerate(as_completed(futuros), start=1):
+            partes[futuros[futuro]] = futuro.result()
+            if progresso:
+                progresso(concluidos / (len(tarefas) + 1))
+
+    documento = PdfWriter()
+    for parte in partes:
+        documento.append(io.BytesIO(parte))
+    saida = io.BytesIO()
+    documento.write(saida)
+    if progresso:
+        progresso(1.0)
+    return saida.getvalue()
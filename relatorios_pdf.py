@@ -0,0 +1,328 @@
+import locale
+import os
+import threading
+from datetime import datetime
+
+from fpdf import FPDF
+from PIL import Image
+
+from consultas import obter_configuracao
+from conversao_comprovantes import STATUS_PROCESSANDO
+from db_runtime import get_session
+from imagens import imagem_para_pdf
+from pastas import RELATORIOS_DIR, UPLOAD_FOLDER
+from relatorio_dados import montar_dados_relatorio
+
+# Geração dos PDFs de relatório e de comprovantes. As funções recebem o
+# id_usuario explicitamente (sem st.session_state) para poderem rodar em
+# threads de exportação em segundo plano, e devolvem o PDF em memória (bytes);
+# gravar em disco é um passo separado, feito por publicar_pdf.
+
+
+class PDFWithFooter(FPDF):
+    def footer(self):
+        self.set_y(-15)
+        self.set_font("Arial", size=8)
+        self.set_text_color(128, 128, 128)  # Cinza
+        self.cell(0, 10, "Desenvolvido por Miquéias Teles | © 2025 Todos os direitos reservados", 0, 0, 'C')
+
+
+def nome_arquivo_pdf(tipo, ano, id_usuario, mes=None):
+    """Nome do arquivo de cada variante; o anual é o que as páginas de administrador procuram."""
+    if mes:
+        return f"{tipo}_{ano}_mes_{mes}_id_usuario_{id_usuario}.pdf"
+    return f"{tipo}_{ano}_id_usuario_{id_usuario}.pdf"
+
+
+def publicar_pdf(conteudo, nome_arquivo):
+    """Grava o PDF em relatorios/ de forma atômica (arquivo temporário + rename)."""
+    caminho = os.path.join(RELATORIOS_DIR, nome_arquivo)
+    temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporario, 'wb') as arquivo:
+        arquivo.write(conteudo)
+    os.replace(temporario, caminho)
+    return caminho
+
+
+def _avisar(progresso, fracao):
+    if progresso:
+        progresso(fracao)
+
+
+def carregar_dados_relatorio(id_usuario, mes=None):
+    with get_session() as session:
+        return montar_dados_relatorio(session, id_usuario, mes, obter_configuracao(id_usuario))
+
+
+def exportar_relatorio(id_usuario, mes=None, progresso=None):
+    dados = carregar_dados_relatorio(id_usuario, mes)
+    ano = dados[0]['ano_vigente'] if dados else datetime.now().year
+
+    pdf = PDFWithFooter()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+
+    dados_config = dados[0].get('configuracao', {}) if dados else {}
+
+    logo_path = os.path.join('static', "Logos/Marca_UMP 02.png")
+    try:
+        pdf.image(logo_path, x=80, y=8, w=50)
+    except:
+        pass
+
+    pdf.ln(18)
+
+    pdf.set_text_color(28, 30, 62)
+    pdf.set_font("Arial", style='B', size=14)
+    pdf.cell(190, 10, txt=f"RELATÓRIO FINANCEIRO {ano}{f' - Mês {mes}' if mes else ''}", ln=True, align='C')
+    pdf.ln(0)
+
+    pdf.set_font("Arial", style='B', size=12)
+    campo = f"{dados_config.ump_federacao if hasattr(dados_config, 'ump_federacao') else 'Não definido'} - {dados_config.federacao_sinodo if hasattr(dados_config, 'federacao_sinodo') else 'Não definido'}"
+    pdf.cell(190, 10, campo, ln=True, align='C')
+    pdf.ln(10)
+
+    pdf.set_text_color(255, 255, 255)
+    pdf.set_font("Arial", style='B', size=14)
+    pdf.set_fill_color(28, 30, 62)
+    pdf.cell(190, 8, txt="Informações de Cabeçalho", ln=True, align='C', fill=True)
+    pdf.ln(5)
+
+    largura_campo = 95
+    largura_valor = 95
+    altura_celula = 8
+
+    pdf.set_text_color(28, 30, 62)
+    pdf.set_font("Arial", style='B', size=11)
+    pdf.set_fill_color(201, 203, 231)
+    pdf.cell(largura_campo, altura_celula, "Campos", border=1, align='C', fill=True)
+    pdf.cell(largura_valor, altura_celula, "Informações", border=1, align='C', fill=True)
+    pdf.ln()
+
+    pdf.set_text_color(0, 0, 0)
+    pdf.set_font("Arial", size=11)
+    campos = [
+        ("UMP/Federação:", dados_config.ump_federacao if hasattr(dados_config, 'ump_federacao') else "Não definido"),
+        ("Federação/Sínodo:", dados_config.federacao_sinodo if hasattr(dados_config, 'federacao_sinodo') else "Não definido"),
+        ("Ano Vigente:", str(dados_config.ano_vigente if hasattr(dados_config, 'ano_vigente') else "Não definido")),
+        ("Sócios Ativos:", str(dados_config.socios_ativos if hasattr(dados_config, 'socios_ativos') else "Não definido")),
+        ("Sócios Cooperadores:", str(dados_config.socios_cooperadores if hasattr(dados_config, 'socios_cooperadores') else "Não definido")),
+        ("Tesoureiro Responsável:", dados_config.tesoureiro_responsavel if hasattr(dados_config, 'tesoureiro_responsavel') else "Não definido"),
+    ]
+
+    for campo, valor in campos:
+        pdf.cell(largura_campo, altura_celula, campo, border=1)
+        pdf.cell(largura_valor, altura_celula, valor, border=1)
+        pdf.ln()
+
+    pdf.ln(5)
+
+    pdf.set_text_color(255, 255, 255)
+    pdf.set_font("Arial", style='B', size=14)
+    pdf.set_fill_color(28, 30, 62)
+    pdf.cell(190, 8, txt="Resumo Financeiro", ln=True, align='C', fill=True)
+    pdf.ln(5)
+
+    resumo = dados[0] if dados else {}
+
+    pdf.set_text_color(28, 30, 62)
+    pdf.set_font("Arial", style='B', size=11)
+    pdf.set_fill_color(201, 203, 231)
+    pdf.cell(largura_campo, altura_celula, "Receitas", border=1, align='C', fill=True)
+    pdf.cell(largura_valor, altura_celula, "Despesas", border=1, align='C', fill=True)
+    pdf.ln()
+
+    pdf.set_text_color(0, 0, 0)
+    pdf.set_font("Arial", size=11)
+    resumo_financeiro = [
+        (f"Outras Receitas: R$ {locale.format_string('%.2f', resumo.get('outras_receitas', 0.00), grouping=True)}",
+         f"Outras Despesas: R$ {locale.format_string('%.2f', resumo.get('outras_despesas', 0.00), grouping=True)}"),
+        (f"ACI Recebida: R$ {locale.format_string('%.2f', resumo.get('aci_recebida', 0.00), grouping=True)}",
+         f"ACI Enviada: R$ {locale.format_string('%.2f', resumo.get('aci_enviada', 0.00), grouping=True)}")
+    ]
+
+    for receita, despesa in resumo_financeiro:
+        pdf.cell(largura_campo, altura_celula, receita, border=1)
+        pdf.cell(largura_valor, altura_celula, despesa, border=1)
+        pdf.ln()
+
+    pdf.ln(5)
+
+    pdf.set_font("Arial", style='B', size=12)
+    pdf.set_fill_color(200, 200, 200)
+    pdf.cell(largura_campo, 10, f"Total de Receitas: R$ {locale.format_string('%.2f', resumo.get('total_receitas', 0.00), grouping=True)}", border=1, fill=True)
+    pdf.cell(largura_valor, 10, f"Total de Despesas: R$ {locale.format_string('%.2f', resumo.get('total_despesas', 0.00), grouping=True)}", border=1, fill=True)
+    pdf.ln(10)
+
+    pdf.ln(20)
+    pdf.set_font("Arial", size=12)
+    assinatura_texto = "Assinatura do Tesoureiro"
+    largura_assinatura = pdf.get_string_width(assinatura_texto) + 10
+    pdf.set_x((pdf.w - largura_assinatura) / 2)
+    pdf.cell(largura_assinatura, 10, assinatura_texto, align='C')
+    pdf.line((pdf.w - largura_assinatura) / 2, pdf.get_y() + 3, (pdf.w + largura_assinatura) / 2, pdf.get_y() + 3)
+    pdf.ln(20)
+
+    assinatura_texto = "Assinatura do Presidente"
+    largura_assinatura = pdf.get_string_width(assinatura_texto) + 10
+    pdf.set_x((pdf.w - largura_assinatura) / 2)
+    pdf.cell(largura_assinatura, 10, assinatura_texto, align='C')
+    pdf.line((pdf.w - largura_assinatura) / 2, pdf.get_y() + 3, (pdf.w + largura_assinatura) / 2, pdf.get_y() + 3)
+    pdf.ln(30)
+
+    pdf.set_font("Arial", size=10)
+    campo = f"{dados_config.ump_federacao if hasattr(dados_config, 'ump_federacao') else 'Não definido'} - {dados_config.federacao_sinodo if hasattr(dados_config, 'federacao_sinodo') else 'Não definido'}"
+    pdf.cell(190, 10, campo, ln=True, align='C')
+    pdf.ln(0)
+    pdf.set_font("Arial", size=9)
+    pdf.cell(190, 10, txt="''Alegres na Esperança, Fortes na Fé, Dedicados no Amor, Unidos no Trabalho''", ln=True, align='C')
+    pdf.ln(10)
+
+    meses = {
+        1: "Janeiro", 2: "Fevereiro", 3: "Março", 4: "Abril", 5: "Maio", 6: "Junho",
+        7: "Julho", 8: "Agosto", 9: "Setembro", 10: "Outubro", 11: "Novembro", 12: "Dezembro"
+    }
+
+    for indice, d in enumerate(dados):
+        _avisar(progresso, indice / len(dados))
+        mes_nome = meses.get(d['mes'], f"Mês {d['mes']}")
+        pdf.set_text_color(28, 30, 62)
+        pdf.set_font("Arial", style='B', size=12)
+        pdf.cell(190, 10, txt=f"Mês {d['mes']} - {mes_nome} {ano}", ln=True, align='C')
+        pdf.ln(5)
+
+        pdf.set_text_color(255, 255, 255)
+        pdf.set_font("Arial", style='B', size=10)
+        pdf.set_fill_color(28, 30, 62)
+        pdf.cell(55, 10, "Saldo Inicial", border=1, align='C', fill=True)
+        pdf.cell(40, 10, "Entradas", border=1, align='C', fill=True)
+        pdf.cell(40, 10, "Saídas", border=1, align='C', fill=True)
+        pdf.cell(55, 10, "Saldo Final", border=1, align='C', fill=True)
+        pdf.ln()
+
+        pdf.set_text_color(28, 30, 62)
+        pdf.set_font("Arial", size=11)
+        pdf.cell(55, 10, f"R$ {locale.format_string('%.2f', d['saldo_inicial'], grouping=True)}", border=1, align='C')
+        pdf.cell(40, 10, f"R$ {locale.format_string('%.2f', d['entradas'], grouping=True)}", border=1, align='C')
+        pdf.cell(40, 10, f"R$ {locale.format_string('%.2f', d['saidas'], grouping=True)}", border=1, align='C')
+        pdf.cell(55, 10, f"R$ {locale.format_string('%.2f', d['saldo_final'], grouping=True)}", border=1, align='C')
+        pdf.ln(15)
+
+        pdf.set_font("Arial", style='B', size=10)
+        pdf.set_fill_color(200, 200, 200)
+        pdf.cell(35, 10, "Data", border=1, align='C', fill=True)
+        pdf.cell(35, 10, "Tipo", border=1, align='C', fill=True)
+        pdf.cell(65, 10, "Descrição", border=1, align='C', fill=True)
+        pdf.cell(35, 10, "Valor", border=1, align='C', fill=True)
+        pdf.cell(20, 10, "Cód.", border=1, align='C', fill=True)
+        pdf.ln()
+
+        pdf.set_font("Arial", size=10)
+        for lanc in d['lancamentos']:
+            pdf.cell(35, 10, txt=lanc.data.strftime('%d/%m/%Y'), border=1, align='C')
+            pdf.cell(35, 10, txt=lanc.tipo, border=1, align='C')
+            pdf.cell(65, 10, txt=lanc.descricao, border=1, align='C')
+            pdf.cell(35, 10, txt=f"R$ {locale.format_string('%.2f', lanc.valor, grouping=True)}", border=1, align='C')
+            pdf.cell(20, 10, txt=str(lanc.id), border=1, align='C')
+            pdf.ln()
+
+        pdf.ln(5)
+
+    conteudo = bytes(pdf.output())
+    _avisar(progresso, 1.0)
+    return conteudo
+
+
+def exportar_comprovantes(id_usuario, ano=None, mes=None, progresso=None):
+    dados = carregar_dados_relatorio(id_usuario, mes)
+    ano = dados[0]['ano_vigente'] if dados else datetime.now().year
+    dados_config = dados[0].get('configuracao', {}) if dados else {}
+    lancamentos = [lanc for d in dados for lanc in d['lancamentos']]
+
+    pdf = PDFWithFooter()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+
+    pdf.set_text_color(28, 30, 62)
+    pdf.set_font("Arial", style='B', size=14)
+    pdf.cell(190, 10, f"RELATÓRIO DE COMPROVANTES - {ano if ano else 'Todos'}{f' Mês {mes}' if mes else ''}", ln=True, align='C')
+    pdf.ln(0)
+
+    pdf.set_font("Arial", style='B', size=12)
+    campo = f"{dados_config.ump_federacao if hasattr(dados_config, 'ump_federacao') else 'Não definido'} - {dados_config.federacao_sinodo if hasattr(dados_config, 'federacao_sinodo') else 'Não definido'}"
+    pdf.cell(190, 10, campo, ln=True, align='C')
+    pdf.ln(10)
+
+    pdf.set_text_color(255, 255, 255)
+    pdf.set_font("Arial", style='B', size=14)
+    pdf.set_fill_color(28, 30, 62)
+    pdf.cell(190, 8, txt="Relação de Comprovantes", ln=True, align='C', fill=True)
+    pdf.ln(5)
+
+    pdf.set_text_color(28, 30, 62)
+    pdf.set_font("Arial", style='B', size=10)
+    pdf.cell(15, 10, "Cód.", border=1, align='C')
+    pdf.cell(30, 10, "Data", border=1, align='C')
+    pdf.cell(80, 10, "Descrição", border=1, align='C')
+    pdf.cell(30, 10, "Valor", border=1, align='C')
+    pdf.cell(35, 10, "Comprovante", border=1, align='C')
+    pdf.ln()
+
+    pdf.set_font("Arial", size=10)
+    for lanc in lancamentos:
+        pdf.cell(15, 10, str(lanc.id), border=1, align='C')
+        pdf.cell(30, 10, txt=lanc.data.strftime('%d/%m/%Y'), border=1, align='C')
+        pdf.cell(80, 10, lanc.descricao, border=1, align='L')
+        pdf.cell(30, 10, f"R$ {locale.format_string('%.2f', lanc.valor, grouping=True)}", border=1, align='C')
+        pdf.cell(35, 10, "Anexado" if lanc.comprovante else "Não anexado", border=1, align='C')
+        pdf.ln()
+
+    pdf.ln(10)
+
+    for indice, lanc in enumerate(lancamentos):
+        _avisar(progresso, indice / len(lancamentos))
+        if lanc.comprovante_status == STATUS_PROCESSANDO:
+            pdf.add_page()
+            pdf.set_font("Arial", style='B', size=12)
+            pdf.cell(190, 10, f"Comprovante - ID {lanc.id} (Em processamento)", ln=True, align='C')
+        elif lanc.comprovante:
+            comprovante_path = lanc.comprovante if lanc.comprovante.startswith(UPLOAD_FOLDER) else os.path.join(UPLOAD_FOLDER, lanc.comprovante)
+
+            if os.path.exists(comprovante_path):
+                file_extension = comprovante_path.lower().split('.')[-1]
+                if file_extension in ['jpg', 'jpeg', 'png']:
+                    try:
+                        pdf.add_page()
+                        pdf.set_font("Arial", style='B', size=12)
+                        pdf.cell(190, 10, f"Comprovante - Cód. {lanc.id}", ln=True, align='C')
+                        pdf.ln(5)
+
+                        # Usa a cópia de impressão (já orientada e reduzida) quando existir
+                        imagem_path = imagem_para_pdf(comprovante_path)
+                        with Image.open(imagem_path) as image:
+                            img_width, img_height = image.size
+
+                        max_width = 190
+                        max_height = 250
+                        ratio = min(max_width / img_width, max_height / img_height)
+                        new_width = img_width * ratio
+                        new_height = img_height * ratio
+
+                        pdf.image(imagem_path, x=10, y=30, w=new_width, h=new_height)
+
+                    except Exception as e:
+                        pdf.cell(190, 10, f"Erro ao carregar imagem: {str(e)}", ln=True, align='C')
+                else:
+                    pdf.add_page()
+                    pdf.set_font("Arial", style='B', size=12)
+                    pdf.cell(190, 10, f"Comprovante - ID {lanc.id} (Formato de arquivo não suportado)", ln=True, align='C')
+            else:
+                pdf.add_page()
+                pdf.set_font("Arial", style='B', size=12)
+                pdf.cell(190, 10, f"Comprovante - ID {lanc.id} (Arquivo não encontrado)", ln=True, align='C')
+
+    conteudo = bytes(pdf.output())
+    _avisar(progresso, 1.0)
+    return conteudo
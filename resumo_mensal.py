@@ -0,0 +1,57 @@
+from sqlalchemy import delete, extract, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import Lancamento, ResumoMensal
+
+
+def atualizar_resumo(session, id_usuario, ano, mes, tipo, total, quantidade):
+    """Soma `total` e `quantidade` à linha (usuário, ano, mês, tipo) do resumo, criando-a se preciso."""
+    valores = {
+        "id_usuario": id_usuario, "ano": ano, "mes": mes, "tipo": tipo,
+        "total": total, "quantidade": quantidade,
+    }
+    dialeto = session.get_bind().dialect.name
+    if dialeto in ('postgresql', 'sqlite'):
+        modulo = postgresql if dialeto == 'postgresql' else sqlite
+        tabela = ResumoMensal.__table__
+        comando = modulo.insert(tabela).values(**valores)
+        comando = comando.on_conflict_do_update(
+            index_elements=[tabela.c.id_usuario, tabela.c.ano, tabela.c.mes, tabela.c.tipo],
+            set_={
+                "total": tabela.c.total + comando.excluded.total,
+                "quantidade": tabela.c.quantidade + comando.excluded.quantidade,
+            }
+        )
+        session.execute(comando)
+        return
+
+    atualizados = session.query(ResumoMensal).filter_by(
+        id_usuario=id_usuario, ano=ano, mes=mes, tipo=tipo
+    ).update({
+        ResumoMensal.total: ResumoMensal.total + total,
+        ResumoMensal.quantidade: ResumoMensal.quantidade + quantidade,
+    }, synchronize_session=False)
+    if not atualizados:
+        session.add(ResumoMensal(**valores))
+
+
+def reconstruir_resumo(conexao, id_usuario=None):
+    """Reconstrói o resumo a partir dos lançamentos (backfill ou reparo).
+
+    Aceita uma Session ou uma Connection; o commit fica a cargo de quem chama.
+    """
+    ano = extract('year', Lancamento.data)
+    mes = extract('month', Lancamento.data)
+    agregados = select(
+        Lancamento.id_usuario, ano, mes, Lancamento.tipo,
+        func.sum(Lancamento.valor), func.count(Lancamento.id)
+    ).group_by(Lancamento.id_usuario, ano, mes, Lancamento.tipo)
+    remocao = delete(ResumoMensal.__table__)
+    if id_usuario is not None:
+        agregados = agregados.where(Lancamento.id_usuario == id_usuario)
+        remocao = remocao.where(ResumoMensal.__table__.c.id_usuario == id_usuario)
+
+    conexao.execute(remocao)
+    conexao.execute(insert(ResumoMensal.__table__).from_select(
+        ['id_usuario', 'ano', 'mes', 'tipo', 'total', 'quantidade'], agregados
+    ))
@@ -0,0 +1,103 @@
+from collections import defaultdict
+
+from cache import marcar_alteracao
+from models import Configuracao, SaldoFinal
+from relatorio_dados import TIPOS_RECEITA, TIPOS_DESPESA, totais_por_mes_e_tipo
+from resumo_mensal import atualizar_resumo
+
+
+def valor_com_sinal(tipo, valor):
+    """Efeito do lançamento no saldo: receitas somam, despesas subtraem."""
+    return valor if tipo in TIPOS_RECEITA else -valor
+
+
+def aplicar_delta_saldo(session, id_usuario, ano, mes, delta):
+    """Soma `delta` ao SaldoFinal dos meses `mes..12` do ano na transação corrente.
+
+    Se o ano vigente ainda não tiver as 12 linhas de saldo, elas são
+    reconstruídas por completo a partir do resumo mensal, que já deve conter
+    o lançamento em andamento.
+    """
+    marcar_alteracao(session, id_usuario)
+    if not delta:
+        return
+    atualizados = session.query(SaldoFinal).filter(
+        SaldoFinal.id_usuario == id_usuario,
+        SaldoFinal.ano == ano,
+        SaldoFinal.mes >= mes
+    ).update({SaldoFinal.saldo: SaldoFinal.saldo + delta}, synchronize_session=False)
+
+    if atualizados != 13 - mes:
+        ano_vigente = session.query(Configuracao.ano_vigente).filter_by(id_usuario=id_usuario).scalar()
+        if ano == ano_vigente:
+            recalcular_saldos(session, id_usuario, ano)
+
+
+def registrar_movimento(session, id_usuario, ano, mes, tipo, valor, quantidade):
+    """Propaga `valor` (e `quantidade` lançamentos) de um tipo no resumo mensal e nos saldos.
+
+    Valores e quantidades negativos desfazem lançamentos. Deve ser chamada na
+    mesma transação da escrita em Lancamento.
+    """
+    marcar_alteracao(session, id_usuario)
+    atualizar_resumo(session, id_usuario, ano, mes, tipo, valor, quantidade)
+    aplicar_delta_saldo(session, id_usuario, ano, mes, valor_com_sinal(tipo, valor))
+
+
+def registrar_movimentos(session, id_usuario, movimentos):
+    """Versão em lote de registrar_movimento: `movimentos` é {(ano, mes, tipo): (valor, quantidade)}.
+
+    O resumo recebe uma escrita por (mês, tipo) e o saldo uma atualização por
+    mês. Os meses são processados em ordem, cada um com o resumo já somado, para
+    que uma reconstrução dos saldos não conte duas vezes os meses seguintes.
+    """
+    marcar_alteracao(session, id_usuario)
+    por_mes = defaultdict(list)
+    for (ano, mes, tipo), (valor, quantidade) in movimentos.items():
+        por_mes[(ano, mes)].append((tipo, valor, quantidade))
+    for (ano, mes), itens in sorted(por_mes.items()):
+        for tipo, valor, quantidade in itens:
+            atualizar_resumo(session, id_usuario, ano, mes, tipo, valor, quantidade)
+        aplicar_delta_saldo(session, id_usuario, ano, mes, sum(valor_com_sinal(tipo, valor) for tipo, valor, _ in itens))
+
+
+def registrar_insercao(session, lancamento):
+    registrar_movimento(session, lancamento.id_usuario, lancamento.data.year, lancamento.data.month,
+                        lancamento.tipo, lancamento.valor, 1)
+
+
+def registrar_remocao(session, lancamento):
+    registrar_movimento(session, lancamento.id_usuario, lancamento.data.year, lancamento.data.month,
+                        lancamento.tipo, -lancamento.valor, -1)
+
+
+def registrar_alteracao(session, id_usuario, antes, depois):
+    """Propaga a edição de um lançamento; `antes`/`depois` são tuplas (data, tipo, valor)."""
+    data_antes, tipo_antes, valor_antes = antes
+    data_depois, tipo_depois, valor_depois = depois
+    registrar_movimento(session, id_usuario, data_antes.year, data_antes.month, tipo_antes, -valor_antes, -1)
+    registrar_movimento(session, id_usuario, data_depois.year, data_depois.month, tipo_depois, valor_depois, 1)
+
+
+def recalcular_saldos(session, id_usuario, ano=None):
+    """Reparo completo: reconstrói os 12 saldos do ano a partir do resumo mensal."""
+    marcar_alteracao(session, id_usuario)
+    config = session.query(Configuracao).filter_by(id_usuario=id_usuario).first()
+    if ano is None:
+        if not config:
+            return
+        ano = config.ano_vigente
+    saldo = float(config.saldo_inicial or 0) if config else 0
+
+    totais = totais_por_mes_e_tipo(session, id_usuario, ano)
+    existentes = {
+        s.mes: s for s in session.query(SaldoFinal).filter_by(id_usuario=id_usuario, ano=ano)
+    }
+    for mes in range(1, 13):
+        por_tipo = totais.get(mes, {})
+        saldo += sum(por_tipo.get(tipo, 0.0) for tipo in TIPOS_RECEITA)
+        saldo -= sum(por_tipo.get(tipo, 0.0) for tipo in TIPOS_DESPESA)
+        if mes in existentes:
+            existentes[mes].saldo = saldo
+        else:
+            session.add(SaldoFinal(mes=mes, ano=ano, saldo=saldo, id_usuario=id_usuario))